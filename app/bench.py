@@ -0,0 +1,543 @@
+"""
+Offline end-to-end benchmark: drives /hackrx/run through the FastAPI app with
+every external service replaced by a local fake, and writes the results as
+JSON so runs can be compared across commits.
+
+    python -m app.bench --out bench.json
+    python -m app.bench --pages 5 50 --concurrency 1 8 --llm-latency-ms 300
+
+The fakes:
+- a static file server on 127.0.0.1 serving the fixture PDFs
+- a deterministic embedding stub (feature-hashed bag of words, so related
+  text gets related vectors)
+- the in-memory vector store (VECTOR_BACKEND=memory)
+- the mock LLM provider, answering after --llm-latency-ms
+- a fake Pinecone index for the upsert benchmark
+- Postgres request logging is recorded in memory instead
+
+Fixtures are generated deterministically into --fixtures, one PDF per
+--pages size, with facts planted on known pages and a labelled question for
+each (fixture_<version>_<pages>.qa.jsonl). Every run and commit sees the same
+corpus, and recall is scored with app.eval.
+
+Reported:
+- cold: each document's first request (download, extraction, chunking,
+  embedding), with per-stage timings and peak RSS growth
+- load: throughput and latency percentiles at each --concurrency level on
+  ingested documents (questions are made unique, so the answer cache
+  doesn't answer for the pipeline)
+- components: serial vs parallel and in-memory vs temp-file extraction,
+  clean_text MB/s, the chunker on 1M words, local vector store load
+  latency, embed/upsert throughput against the fakes, retrieval recall
+"""
+import os
+import tempfile
+
+# The app reads its configuration at import time, so it's pointed at the
+# fakes before anything from it is imported. These always win over the
+# environment: a benchmark must never reach the real services.
+BENCH_DIR = tempfile.mkdtemp(prefix="hackrx_bench_")
+os.environ.update({
+    "VECTOR_BACKEND": "memory",
+    "LLM_PRIMARY_PROVIDER": "mock",
+    "LLM_FALLBACK_PROVIDER": "",
+    "WARM_STARTUP": "false",
+    "BEARER_API_KEY": "bench",
+    "HACKRX_CACHE_DIR": os.path.join(BENCH_DIR, "cache"),
+    "LOG_SPILL_PATH": os.path.join(BENCH_DIR, "log_spill.jsonl"),
+})
+
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import functools
+import threading
+import subprocess
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+import httpx
+
+from app import main
+from app.eval import evaluate_document, summarize, variants
+from app.utils import clients, text_extraction
+from app.utils.llm_providers import MockProvider, register_provider
+from app.utils.lexical_index import tokenize
+from app.utils.document_cache import hash_file, make_document_id
+from app.utils.data_processing import clean_text, iter_document_chunks
+from app.utils.embeddings import embed_chunks, upsert_to_namespace
+from app.utils.vector_store import get_vector_store, LocalVectorStore, VECTOR_RESCORE
+
+DEFAULT_PAGES = [5, 50, 400, 2000]
+FIXTURE_VERSION = "f1"
+FIXTURE_HEADER = "ACME General Insurance Ltd. Health Policy Wording UIN ACMHLIP21001V012021"
+FIXTURE_WORDS = (
+    "policy insured grace period premium hospital claim waiting coverage benefit ayush section co-payment "
+    "sum deductible exclusion network treatment renewal portability nominee cashless reimbursement room rent"
+).split()
+FIXTURE_TOPICS = ["cataract surgery", "maternity cover", "organ donor expenses", "ayush treatment",
+                  "dental treatment", "bariatric surgery", "home nursing", "ambulance charges"]
+LINES_PER_PAGE = 60
+FACTS_PER_DOCUMENT = 12
+QUESTIONS_PER_REQUEST = 5
+CHUNKER_WORDS = 1_000_000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark /hackrx/run end to end against local fakes.")
+    parser.add_argument("--pages", type=int, nargs="+", default=DEFAULT_PAGES,
+                        help=f"Page counts of the fixture PDFs (default {' '.join(map(str, DEFAULT_PAGES))})")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                        help="Concurrent clients for the load runs (default 1 4 16)")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per load run (default 64)")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Mock LLM latency (default 200)")
+    parser.add_argument("--embed-latency-ms", type=float, default=20, help="Embedding stub latency per call (default 20)")
+    parser.add_argument("--upsert-latency-ms", type=float, default=20, help="Fake Pinecone latency per upsert (default 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of each component benchmark (default 3)")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "hackrx_bench_fixtures"),
+                        help="Where fixture PDFs are generated and reused")
+    parser.add_argument("--skip-components", action="store_true", help="Only run the end-to-end benchmarks")
+    parser.add_argument("--out", help="Write the JSON report here (it's always printed)")
+    return parser.parse_args()
+
+
+# --- Fixtures ---
+def make_fixture(path: str, pages: int, seed: int) -> list:
+    """
+    Writes a policy-like PDF of `pages` pages and returns the labelled
+    examples for the facts planted in it.
+    """
+    import fitz
+    rng = random.Random(seed)
+    fact_pages = set(rng.sample(range(1, pages + 1), min(pages, FACTS_PER_DOCUMENT)))
+    examples = []
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        lines = [FIXTURE_HEADER]
+        for _ in range(LINES_PER_PAGE):
+            lines.append(" ".join(rng.choices(FIXTURE_WORDS, k=rng.randint(6, 12))).capitalize() + ".")
+        if page_number in fact_pages:
+            topic, code, months = rng.choice(FIXTURE_TOPICS), f"PX-{rng.randrange(10000):04d}", rng.randint(2, 48)
+            lines.insert(rng.randint(1, LINES_PER_PAGE), f"The waiting period for {topic} under plan {code} is {months} months.")
+            examples.append({
+                "question": f"What is the waiting period for {topic} under plan {code}?",
+                "expected_text": [f"under plan {code} is {months} months"],
+                "expected_pages": [page_number],
+            })
+        lines.append(f"Page {page_number} of {pages}")
+        doc.new_page().insert_text((36, 36), "\n".join(lines), fontsize=7)
+    doc.save(path)
+    doc.close()
+    return examples
+
+
+def load_fixtures(directory: str, page_counts: list) -> list:
+    """Generates any missing fixtures and returns [{"name", "path", "pages", "bytes", "examples"}]."""
+    os.makedirs(directory, exist_ok=True)
+    fixtures = []
+    for pages in sorted(set(page_counts)):
+        name = f"fixture_{FIXTURE_VERSION}_{pages}"
+        path = os.path.join(directory, f"{name}.pdf")
+        qa_path = os.path.join(directory, f"{name}.qa.jsonl")
+        if not (os.path.exists(path) and os.path.exists(qa_path)):
+            examples = make_fixture(path, pages, seed=pages)
+            with open(qa_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(example) + "\n" for example in examples)
+        with open(qa_path, "r", encoding="utf-8") as f:
+            examples = [json.loads(line) for line in f if line.strip()]
+        fixtures.append({"name": name, "path": path, "pages": pages,
+                         "bytes": os.path.getsize(path), "examples": examples})
+    return fixtures
+
+
+# --- Fakes ---
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_file_server(directory: str):
+    """Serves directory over HTTP on a free local port. Returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def hash_embedding(text: str, dim: int) -> np.ndarray:
+    """
+    A unit vector of signed, feature-hashed token counts, so shared words
+    mean similar vectors. Counts are log-scaled; otherwise the filler words
+    repeated on every page drown out the rare terms a question asks about.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokenize(text)), dtype=np.int64)
+    if len(hashes):
+        np.add.at(vector, hashes % dim, np.where(hashes & 1, 1.0, -1.0))
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        vector /= np.linalg.norm(vector) or 1.0
+    return vector
+
+
+class FakeGenai:
+    """Stands in for google.generativeai's embed_content."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed_content(self, model, content, task_type=None, output_dimensionality=768, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency_ms / 1000)
+        texts = [content] if isinstance(content, str) else content
+        vectors = [hash_embedding(text, output_dimensionality).tolist() for text in texts]
+        return {"embedding": vectors[0] if isinstance(content, str) else vectors}
+
+
+class FakePineconeIndex:
+    """Accepts upserts after latency_ms and counts the vectors."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.vectors = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            self.vectors += len(vectors)
+
+
+class RequestLog:
+    """Replaces the Postgres log sink's enqueue, keeping each request's stage timings."""
+
+    def __init__(self):
+        self.rows = []
+
+    def enqueue(self, file_id, file_link, questions_json, answers_json, total_time_ms, timings_json):
+        self.rows.append({"file_id": file_id, "total_time_ms": total_time_ms, "timings": json.loads(timings_json)})
+
+
+class PeakRSS:
+    """
+    Samples this process's resident set size every few milliseconds while
+    active. peak_growth_mb is the highest RSS seen above the starting RSS
+    (None where /proc isn't available).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak_growth_mb = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _rss() -> int:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def _sample(self, start: int):
+        peak = start
+        while not self._stop.wait(self.interval):
+            peak = max(peak, self._rss())
+        peak = max(peak, self._rss())
+        self.peak_growth_mb = round((peak - start) / 1e6, 1)
+
+    def __enter__(self):
+        try:
+            start = self._rss()
+        except OSError:
+            self._thread = None
+            return self
+        self._thread = threading.Thread(target=self._sample, args=(start,), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+
+# --- Helpers ---
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+def stage_summary(rows: list) -> dict:
+    """The p50 of every numeric timing across requests (missing stages are skipped)."""
+    values = {}
+    for row in rows:
+        for key, value in row["timings"].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values.setdefault(key, []).append(value)
+    return {key: round(float(np.median(v)), 3) for key, v in sorted(values.items())}
+
+
+def timed(func, *args, repeat: int = 1, **kwargs):
+    """Runs func repeat times. Returns (median seconds, last result)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- End-to-end runs ---
+async def post_run(client: httpx.AsyncClient, url: str, questions: list):
+    start = time.perf_counter()
+    response = await client.post("/hackrx/run", json={"documents": url, "questions": questions},
+                                 headers={"Authorization": f"Bearer {os.environ['BEARER_API_KEY']}"})
+    return (time.perf_counter() - start) * 1000, response
+
+
+async def bench_cold(client, base_url: str, fixtures: list, request_log: RequestLog) -> list:
+    results = []
+    for fixture in fixtures:
+        questions = [example["question"] for example in fixture["examples"]]
+        before = len(request_log.rows)
+        with PeakRSS() as rss:
+            latency_ms, response = await post_run(client, f"{base_url}/{fixture['name']}.pdf", questions)
+        rows = request_log.rows[before:]
+        results.append({
+            "document": fixture["name"],
+            "pages": fixture["pages"],
+            "bytes": fixture["bytes"],
+            "status": response.status_code,
+            "latency_ms": round(latency_ms, 3),
+            "rss_peak_growth_mb": rss.peak_growth_mb,
+            "stages": rows[-1]["timings"] if rows else {},
+        })
+    return results
+
+
+async def bench_load(client, base_url: str, fixtures: list, request_log: RequestLog,
+                     concurrency: int, total_requests: int) -> dict:
+    """Runs total_requests across `concurrency` clients, round-robin over the documents."""
+    next_request = 0
+    latencies, errors = [], 0
+    before = len(request_log.rows)
+
+    async def client_loop():
+        nonlocal next_request, errors
+        while next_request < total_requests:
+            i = next_request
+            next_request += 1
+            fixture = fixtures[i % len(fixtures)]
+            examples = fixture["examples"]
+            # Unique per request (and run), so answers and query embeddings are computed, not recalled
+            questions = [f"{examples[(i + j) % len(examples)]['question']} (run {concurrency}, request {i})"
+                         for j in range(min(QUESTIONS_PER_REQUEST, len(examples)))]
+            latency_ms, response = await post_run(client, f"{base_url}/{fixture['name']}.pdf", questions)
+            if response.status_code == 200:
+                latencies.append(latency_ms)
+            else:
+                errors += 1
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "requests_per_second": round(total_requests / elapsed, 3),
+        "latency_ms": percentiles(latencies),
+        "stages_p50": stage_summary(request_log.rows[before:]),
+        "rss_peak_growth_mb": rss.peak_growth_mb,
+    }
+
+
+# --- Component benchmarks ---
+def bench_extraction(fixture: dict, repeat: int) -> dict:
+    path = fixture["path"]
+    with open(path, "rb") as f:
+        data = f.read()
+    results = {"document": fixture["name"], "pages": fixture["pages"]}
+
+    saved = text_extraction.PARALLEL_EXTRACT_MIN_PAGES
+    try:
+        text_extraction.PARALLEL_EXTRACT_MIN_PAGES = sys.maxsize
+        results["serial_ms"] = round(timed(text_extraction.extract_text_from_pdf, path, repeat=repeat)[0] * 1000, 3)
+        if text_extraction.EXTRACT_WORKERS >= 2:
+            text_extraction.PARALLEL_EXTRACT_MIN_PAGES = 0
+            # The first call pays for spawning the pool; that's reported separately
+            results["parallel_first_call_ms"] = round(timed(text_extraction.extract_text_from_pdf, path)[0] * 1000, 3)
+            results["parallel_ms"] = round(timed(text_extraction.extract_text_from_pdf, path, repeat=repeat)[0] * 1000, 3)
+            results["parallel_workers"] = text_extraction.EXTRACT_WORKERS
+    finally:
+        text_extraction.PARALLEL_EXTRACT_MIN_PAGES = saved
+
+    # The download path either keeps the body in memory or spills it to a temp file
+    def from_temp_file():
+        with tempfile.NamedTemporaryFile(suffix=".pdf", dir=BENCH_DIR) as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            return text_extraction.extract_text_from_pdf(temp_file.name)
+
+    text_extraction.PARALLEL_EXTRACT_MIN_PAGES = sys.maxsize
+    try:
+        for name, func, arg in (("in_memory", text_extraction.extract_text_from_pdf, data),
+                                ("temp_file", lambda _: from_temp_file(), None)):
+            with PeakRSS() as rss:
+                seconds, _ = timed(func, arg, repeat=repeat)
+            results[name] = {"ms": round(seconds * 1000, 3), "rss_peak_growth_mb": rss.peak_growth_mb}
+    finally:
+        text_extraction.PARALLEL_EXTRACT_MIN_PAGES = saved
+    return results
+
+
+def bench_text_processing(fixture: dict, repeat: int) -> dict:
+    text, page_count = text_extraction.extract_text_from_pdf(fixture["path"])
+    seconds, _ = timed(clean_text, text, page_count, repeat=repeat)
+    results = {"clean_text": {"mb": round(len(text.encode("utf-8")) / 1e6, 3),
+                              "mb_per_second": round(len(text.encode("utf-8")) / 1e6 / seconds, 3)}}
+
+    # Repeat the document's pages until the chunker sees CHUNKER_WORDS words
+    with text_extraction.open_pdf_pages(fixture["path"]) as (_, pages):
+        page_texts = [page_text for _, page_text in pages]
+    words_per_page = max(1, sum(len(t.split()) for t in page_texts) // len(page_texts))
+    copies = -(-CHUNKER_WORDS // (words_per_page * len(page_texts)))
+    corpus = page_texts * copies
+
+    def run_chunker():
+        return sum(1 for _ in iter_document_chunks(enumerate(corpus, start=1), len(corpus)))
+
+    seconds, chunks = timed(run_chunker, repeat=1)
+    words = words_per_page * len(corpus)
+    results["chunker"] = {"words": words, "chunks": chunks, "seconds": round(seconds, 3),
+                          "words_per_second": round(words / seconds)}
+    return results
+
+
+def bench_vector_store_load(doc_index, repeat: int) -> dict:
+    """Cold loads (memory cache cleared) of one document from the local store."""
+    store = LocalVectorStore(root=os.path.join(BENCH_DIR, "vectors"))
+    store.put("bench", doc_index.vectors, doc_index.metadatas)
+    latencies = []
+    for _ in range(max(20, repeat * 10)):
+        store._loaded.clear()
+        start = time.perf_counter()
+        store.get("bench")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"chunks": len(doc_index), "dtype": store.dtype, "load_ms": percentiles(latencies)}
+
+
+def bench_embed_upsert(fake_genai: FakeGenai, upsert_latency_ms: float, num_chunks: int = 1000) -> dict:
+    run_id = time.time_ns()
+    # Unique texts, so none of them are in the embedding cache
+    chunks = [f"{' '.join(random.Random(i).choices(FIXTURE_WORDS, k=80))} {run_id}-{i}" for i in range(num_chunks)]
+    calls_before = fake_genai.calls
+    seconds, vectors = timed(embed_chunks, chunks)
+    results = {"embed": {"chunks": num_chunks, "api_calls": fake_genai.calls - calls_before,
+                         "chunks_per_second": round(num_chunks / seconds, 3)}}
+
+    index = FakePineconeIndex(upsert_latency_ms)
+    seconds, _ = timed(upsert_to_namespace, index, "bench", vectors, [{"text": c} for c in chunks])
+    results["upsert"] = {"vectors": index.vectors, "vectors_per_second": round(index.vectors / seconds, 3)}
+    return results
+
+
+def bench_recall(fixtures: list) -> dict:
+    vector_store = get_vector_store()
+    ks, modes, dtypes, rescores = [1, 3, 5], ["dense", "hybrid"], ["float32", "int8"], [0, VECTOR_RESCORE]
+    per_document, num_questions = [], 0
+    for fixture in fixtures:
+        doc_index = vector_store.get(make_document_id(hash_file(fixture["path"])))
+        if doc_index is None or not fixture["examples"]:
+            continue
+        per_document.append(evaluate_document(doc_index, fixture["examples"], ks, modes, 5, dtypes, rescores))
+        num_questions += len(fixture["examples"])
+    labels = [mode + suffix for suffix, _, _ in variants(dtypes, rescores) for mode in modes]
+    return summarize(per_document, ks, labels, num_questions) if num_questions else {}
+
+
+# --- Main ---
+async def run(args, fixtures: list, fake_genai: FakeGenai) -> dict:
+    request_log = RequestLog()
+    main.log_sink.enqueue = request_log.enqueue
+    server, base_url = start_file_server(os.path.dirname(fixtures[0]["path"]))
+
+    report = {}
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                report["cold"] = await bench_cold(client, base_url, fixtures, request_log)
+                report["load"] = [
+                    await bench_load(client, base_url, fixtures, request_log, concurrency, args.requests)
+                    for concurrency in args.concurrency
+                ]
+
+            if not args.skip_components:
+                largest = fixtures[-1]
+                doc_index = get_vector_store().get(make_document_id(hash_file(largest["path"])))
+                report["components"] = {
+                    "extraction": bench_extraction(largest, args.repeat),
+                    "text_processing": bench_text_processing(largest, args.repeat),
+                    "vector_store_load": bench_vector_store_load(doc_index, args.repeat) if doc_index else None,
+                    "embed_upsert": bench_embed_upsert(fake_genai, args.upsert_latency_ms),
+                    "recall": bench_recall(fixtures),
+                }
+    finally:
+        server.shutdown()
+    return report
+
+
+def main_cli():
+    logging.getLogger().setLevel(logging.WARNING)
+    args = parse_args()
+
+    fake_genai = FakeGenai(args.embed_latency_ms)
+    clients._genai = fake_genai
+    register_provider(MockProvider(latency_ms=args.llm_latency_ms))
+
+    try:
+        fixtures = load_fixtures(args.fixtures, args.pages)
+        results = asyncio.run(run(args, fixtures, fake_genai))
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("out", "fixtures")},
+        },
+        "fixtures": [{k: fixture[k] for k in ("name", "pages", "bytes")} | {"questions": len(fixture["examples"])}
+                     for fixture in fixtures],
+        **results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main_cli()
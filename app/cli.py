@@ -0,0 +1,59 @@
+"""
+Offline pre-warm CLI: embeds and stores documents ahead of peak hours.
+
+    python -m app.cli https://example.com/policy.pdf ./local/policy.pdf
+    python -m app.cli --file urls.txt --concurrency 8
+"""
+import json
+import asyncio
+import logging
+import argparse
+
+from app.utils.ingestion import ingest_many, INGEST_CONCURRENCY
+from app.utils.http_client import close_http_client
+from app.utils.executors import shutdown_executors
+from app.utils.text_extraction import shutdown_extraction_pool
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pre-warm the document cache by ingesting URLs or local PDFs.")
+    parser.add_argument("sources", nargs="*", help="Document URLs or local PDF paths")
+    parser.add_argument("--file", "-f", help="Text file with one URL or path per line")
+    parser.add_argument("--concurrency", "-c", type=int, default=INGEST_CONCURRENCY,
+                        help=f"Documents to ingest at once (default {INGEST_CONCURRENCY})")
+    return parser.parse_args()
+
+
+async def run(sources: list, concurrency: int) -> dict:
+    try:
+        return await ingest_many(sources, concurrency, allow_local_paths=True)
+    finally:
+        await close_http_client()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    sources = list(args.sources)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            sources.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if not sources:
+        raise SystemExit("No documents given. Pass URLs/paths or --file.")
+    if args.concurrency < 1:
+        raise SystemExit("--concurrency must be at least 1.")
+
+    try:
+        report = asyncio.run(run(sources, args.concurrency))
+    finally:
+        shutdown_executors()
+        shutdown_extraction_pool()
+
+    print(json.dumps(report, indent=2))
+    if report["summary"]["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,218 @@
 import os
-import psycopg2
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2.extras import execute_values
 
+from app.utils.executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "4"))
+
+# --- Log sink settings ---
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "100"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "2.0"))
+LOG_SPILL_PATH = os.getenv("LOG_SPILL_PATH", os.path.join(tempfile.gettempdir(), "hackrx_logs_spill.jsonl"))
+# Rows that would grow the spill file past this are dropped (and logged)
+LOG_SPILL_MAX_BYTES = int(os.getenv("LOG_SPILL_MAX_BYTES", str(64 * 1024 * 1024)))
+
+INSERT_SQL = """
+    INSERT INTO hackrx_logs (file_id, file_link, questions, answers, total_time_ms, timings)
+    VALUES %s
+"""
+
+_pool = None
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+def write_log_rows(rows: list):
+    """
+    Inserts a batch of log rows with one multi-row INSERT on a pooled connection.
+    """
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, INSERT_SQL, rows)
+        conn.commit()
+    except Exception:
+        # Don't hand a broken connection back to the next caller
+        pool.putconn(conn, close=True)
+        raise
+    pool.putconn(conn)
+
+
+class LogSink:
+    """
+    Takes log rows off the request path. Rows go into a bounded in-memory queue
+    that a background task drains in batches, flushing when LOG_BATCH_SIZE rows
+    have built up or LOG_FLUSH_INTERVAL seconds have passed.
+
+    If Postgres can't be reached (or the queue is full, or the sink isn't
+    running), rows are appended to a local JSONL spill file and replayed after
+    the next successful flush.
+
+    The queue belongs to the event loop that called start(), so the sink can
+    be stopped and started again under a new loop (e.g. a second lifespan).
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._task = None
+        self._overflow = []
+        self._spill_task = None
+
+    def enqueue(self, file_id, file_link, questions_json, answers_json, total_time_ms, timings_json):
+        row = (file_id, file_link, questions_json, answers_json, total_time_ms, timings_json)
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(row)
+                return
+            except asyncio.QueueFull:
+                pass
+        # Spilling means file I/O, so it happens on a worker thread, not here
+        self._overflow.append(row)
+        if self._spill_task is None:
+            logger.warning("Log queue full or not running; spilling rows to disk.")
+            self._spill_task = asyncio.create_task(self._spill_overflow())
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes whatever is still queued and stops the background task."""
+        # Overflow rows land in the spill file first, so the last flush replays them
+        if self._spill_task is not None:
+            await self._spill_task
+        if self._task is not None:
+            # The sentinel goes behind every queued row, so they all get flushed first
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+            self._queue = None
+        # Rows enqueued from here on are spilled, to be replayed after the next start
+        if self._spill_task is not None:
+            await self._spill_task
+
+    async def _spill_overflow(self):
+        try:
+            while self._overflow:
+                rows, self._overflow = self._overflow, []
+                try:
+                    await run_blocking(_spill, rows)
+                except Exception:
+                    logger.exception(f"Spilling {len(rows)} log rows failed")
+        finally:
+            self._spill_task = None
+
+    async def _run(self):
+        while True:
+            row = await self._queue.get()
+            if row is None:
+                return
+            rows = [row]
+            stopping = False
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while len(rows) < LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
+            try:
+                await self._flush(rows)
+            except Exception:
+                # e.g. the spill file can't be written. Keep draining the queue
+                # rather than letting every later row pile up behind a dead task
+                logger.exception(f"Flushing {len(rows)} log rows failed")
+            if stopping:
+                return
+
+    async def _flush(self, rows: list):
+        try:
+            await run_blocking(write_log_rows, rows)
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} log rows; spilling to {LOG_SPILL_PATH}: {e}")
+            await run_blocking(_spill, rows)
+            return
+        # The database is reachable again, so replay anything spilled earlier
+        if os.path.exists(LOG_SPILL_PATH):
+            await run_blocking(_replay_spill)
+
+
+_spill_lock = threading.Lock()
+
+
+def _spill(rows: list):
+    lines = [json.dumps(row) + "\n" for row in rows]
+    with _spill_lock:
+        try:
+            size = os.path.getsize(LOG_SPILL_PATH)
+        except FileNotFoundError:
+            size = 0
+        kept = 0
+        for line in lines:
+            size += len(line.encode("utf-8"))
+            if size > LOG_SPILL_MAX_BYTES:
+                break
+            kept += 1
+        if kept < len(lines):
+            logger.error(f"Spill file {LOG_SPILL_PATH} is full; dropping {len(lines) - kept} log rows.")
+        if kept:
+            with open(LOG_SPILL_PATH, "a", encoding="utf-8") as f:
+                f.writelines(lines[:kept])
+
+
+def _replay_spill():
+    # Take ownership of the current spill file, so rows spilled while we
+    # replay go to a fresh one
+    replay_path = f"{LOG_SPILL_PATH}.{os.getpid()}.replay"
+    try:
+        with _spill_lock:
+            os.replace(LOG_SPILL_PATH, replay_path)
+    except FileNotFoundError:
+        return
+
+    with open(replay_path, "r", encoding="utf-8") as f:
+        rows = [tuple(json.loads(line)) for line in f if line.strip()]
+
+    try:
+        for start in range(0, len(rows), LOG_BATCH_SIZE):
+            write_log_rows(rows[start:start + LOG_BATCH_SIZE])
+        logger.info(f"Replayed {len(rows)} spilled log rows.")
+    except Exception as e:
+        logger.error(f"Replaying spilled log rows failed: {e}")
+        _spill(rows[start:])
+    os.remove(replay_path)
+
 
-def insert_hackrx_logs(file_id, file_link, questions_json, answers_json, total_time_ms, timings_json):
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
-
-    execute_values(
-        cur,
-        """
-        INSERT INTO hackrx_logs (file_id, file_link, questions, answers, total_time_ms, timings)
-        VALUES %s
-        """,
-        [(file_id, file_link, questions_json, answers_json, total_time_ms, timings_json)]
-    )
-
-    conn.commit()
-    cur.close()
-    conn.close()
+log_sink = LogSink()
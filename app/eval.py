@@ -0,0 +1,192 @@
+"""
+Offline retrieval eval: recall@k and search latency on a labelled Q/A set.
+
+    python -m app.eval qa.jsonl --k 1 3 5 --modes dense hybrid
+    python -m app.eval qa.jsonl --dtypes float32 float16 int8 --rescore 0 50
+
+Each line of the dataset is one labelled question:
+
+    {"document": "<url or local pdf>", "question": "...",
+     "expected_text": ["waiting period of 36 months"], "expected_pages": [12]}
+
+A retrieved chunk counts as relevant if it contains any expected_text
+(case and whitespace insensitive) or overlaps any expected_pages. Documents
+are ingested first if they aren't stored yet.
+
+With --dtypes, every mode is also run on quantized copies of each document
+(see vector_store.VECTOR_DTYPE), once per --rescore depth, and the bytes of
+the matrix each search scans are reported alongside recall. Every variant
+also reports top-10 agreement: the share of the float32 search's top 10
+chunks it returns too, averaged over questions.
+"""
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+import numpy as np
+
+from app.utils.ingestion import ingest_many
+from app.utils.embeddings import embed_questions
+from app.utils.vector_store import get_vector_store, DocumentIndex, VECTOR_DTYPES, VECTOR_RESCORE
+from app.utils.http_client import close_http_client
+from app.utils.executors import shutdown_executors
+from app.utils.text_extraction import shutdown_extraction_pool
+
+MODES = ("dense", "hybrid")
+AGREEMENT_K = 10
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure retrieval recall@k and latency on a labelled Q/A set.")
+    parser.add_argument("dataset", help="JSONL file of labelled questions")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="Cutoffs to report (default 1 3 5)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--repeat", type=int, default=20, help="Timed searches per document and mode (default 20)")
+    parser.add_argument("--dtypes", nargs="+", choices=VECTOR_DTYPES, default=["float32"],
+                        help="Vector precisions to compare (default float32)")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[VECTOR_RESCORE],
+                        help=f"Exact re-scoring depths for quantized dtypes (default {VECTOR_RESCORE})")
+    return parser.parse_args()
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def is_relevant(metadata: dict, example: dict) -> bool:
+    text = _normalize(metadata.get("text", ""))
+    if any(_normalize(expected) in text for expected in example.get("expected_text", [])):
+        return True
+    page_start, page_end = metadata.get("page_start"), metadata.get("page_end")
+    if page_start is None:
+        return False
+    return any(page_start <= page <= page_end for page in example.get("expected_pages", []))
+
+
+def run_search(doc_index, mode: str, query_vectors, questions: list, top_k: int) -> np.ndarray:
+    if mode == "hybrid":
+        return doc_index.hybrid_search(query_vectors, questions, top_k)[1]
+    return doc_index.search(query_vectors, top_k)[1]
+
+
+def variants(dtypes: list, rescores: list) -> list:
+    """(label, dtype, rescore) for every precision to evaluate; float32 is labelled by mode alone."""
+    return [("", "float32", 0) if dtype == "float32" else (f"/{dtype}/rescore={rescore}", dtype, rescore)
+            for dtype in dtypes for rescore in (rescores if dtype != "float32" else [0])]
+
+
+def evaluate_document(doc_index, examples: list, ks: list, modes: list, repeat: int,
+                      dtypes: list = ("float32",), rescores: list = (VECTOR_RESCORE,)) -> dict:
+    """
+    Scores one document's questions in every mode and precision. Query
+    embeddings are computed once and shared, so latencies only cover the
+    search itself.
+
+    Returns:
+        {label: {"hits": {k: relevant-in-top-k count}, "agreement": summed
+                 top-10 agreement with float32, "latencies_ms": [...],
+                 "scan_bytes": ...}}, where label is the mode plus any
+        dtype/rescore suffix
+    """
+    questions = [example["question"] for example in examples]
+    query_vectors = embed_questions(questions)
+    max_k = max(ks)
+
+    # The stored copy may itself be quantized (VECTOR_DTYPE), so build the reference
+    reference_index = DocumentIndex(doc_index.vectors, doc_index.metadatas, normalized=True,
+                                    lexical=doc_index.lexical)
+    reference = {mode: run_search(reference_index, mode, query_vectors, questions, AGREEMENT_K) for mode in modes}
+
+    results = {}
+    for suffix, dtype, rescore in variants(dtypes, rescores):
+        index = DocumentIndex(doc_index.vectors, doc_index.metadatas, normalized=True,
+                              lexical=doc_index.lexical, dtype=dtype, rescore=rescore)
+        for mode in modes:
+            indices = run_search(index, mode, query_vectors, questions, max_k)
+            hits = {k: 0 for k in ks}
+            for example, row in zip(examples, indices):
+                relevant = [is_relevant(index.metadatas[i], example) for i in row]
+                for k in ks:
+                    hits[k] += any(relevant[:k])
+
+            top = run_search(index, mode, query_vectors, questions, AGREEMENT_K)
+            agreement = sum(len(set(row) & set(expected)) / len(expected)
+                            for row, expected in zip(top, reference[mode]))
+
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter_ns()
+                run_search(index, mode, query_vectors, questions, max_k)
+                latencies.append((time.perf_counter_ns() - start) / 1e6)
+            results[mode + suffix] = {"hits": hits, "agreement": agreement, "latencies_ms": latencies,
+                                      "scan_bytes": index.scan_nbytes}
+    return results
+
+
+def summarize(per_document: list, ks: list, labels: list, num_questions: int) -> dict:
+    summary = {}
+    for label in labels:
+        latencies = [ms for doc in per_document for ms in doc[label]["latencies_ms"]]
+        summary[label] = {
+            **{f"recall@{k}": round(sum(doc[label]["hits"][k] for doc in per_document) / num_questions, 4) for k in ks},
+            f"top{AGREEMENT_K}_agreement": round(sum(doc[label]["agreement"] for doc in per_document) / num_questions, 4),
+            "search_p50_ms": round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+            "search_p99_ms": round(float(np.percentile(latencies, 99)), 3) if latencies else None,
+            "scan_mb": round(sum(doc[label]["scan_bytes"] for doc in per_document) / 1e6, 3),
+        }
+    return summary
+
+
+async def run(dataset: list, ks: list, modes: list, repeat: int,
+              dtypes: list = ("float32",), rescores: list = (VECTOR_RESCORE,)) -> dict:
+    by_document = {}
+    for example in dataset:
+        by_document.setdefault(example["document"], []).append(example)
+
+    ingest_report = await ingest_many(list(by_document), allow_local_paths=True)
+    vector_store = get_vector_store()
+
+    per_document = []
+    for result, examples in zip(ingest_report["results"], by_document.values()):
+        if result["status"] == "failed":
+            logging.error(f"Skipping {result['source']}: {result.get('error')}")
+            continue
+        doc_index = vector_store.get(result["file_id"])
+        per_document.append(evaluate_document(doc_index, examples, ks, modes, repeat, dtypes, rescores))
+
+    labels = [mode + suffix for suffix, _, _ in variants(dtypes, rescores) for mode in modes]
+    num_questions = sum(len(examples) for result, examples in zip(ingest_report["results"], by_document.values())
+                        if result["status"] != "failed")
+    return {
+        "questions": num_questions,
+        "documents": len(per_document),
+        "results": summarize(per_document, ks, labels, num_questions) if num_questions else {},
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    with open(args.dataset, "r", encoding="utf-8") as f:
+        dataset = [json.loads(line) for line in f if line.strip()]
+    if not dataset:
+        raise SystemExit("Dataset is empty.")
+
+    async def run_and_close():
+        try:
+            return await run(dataset, sorted(set(args.k)), args.modes, args.repeat, args.dtypes, args.rescore)
+        finally:
+            await close_http_client()
+
+    try:
+        report = asyncio.run(run_and_close())
+    finally:
+        shutdown_executors()
+        shutdown_extraction_pool()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
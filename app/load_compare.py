@@ -0,0 +1,405 @@
+"""
+Before/after load comparison: runs the same concurrent /hackrx/run load
+against two revisions of this app and reports p50/p99 latency for each.
+
+    python -m app.load_compare --baseline 07929ec --concurrency 1 8 32 --requests 64
+
+Each revision is checked out into a temporary git worktree and served by
+its own uvicorn process. Unlike app.bench, which swaps the app's own
+functions for fakes, the fakes here sit at the SDK level (the
+google.generativeai, pinecone and psycopg2 modules), so any revision can be
+measured, including ones from before the provider and vector store layers
+existed. The fakes sleep for the configured latencies, as the real services
+would. Documents come from a local HTTP server with its own latency.
+
+With --unique-documents every request downloads different bytes, so the
+current revision's document, text and vector caches can't answer for it.
+Without it all requests share one document, which is what those caches are
+for.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import httpx
+import numpy as np
+
+# Installed in each server process before the app is imported. Kept to the
+# calls the app makes (at any revision) on these SDKs.
+SERVER_SHIM = r'''
+import os
+import sys
+import json
+import time
+import types
+import zlib
+import threading
+
+import numpy as np
+
+LATENCY = json.loads(os.environ["LOAD_COMPARE_LATENCY_MS"])
+
+
+def _sleep(service):
+    time.sleep(LATENCY[service] / 1000)
+
+
+def _embedding(text, dim):
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in text.lower().split():
+        h = zlib.crc32(token.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 1 else -1.0
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+
+# --- google.generativeai ---
+genai = types.ModuleType("google.generativeai")
+genai.configure = lambda **kwargs: None
+
+
+def embed_content(model, content, task_type=None, output_dimensionality=768, **kwargs):
+    _sleep("embed")
+    texts = [content] if isinstance(content, str) else content
+    vectors = [_embedding(text, output_dimensionality) for text in texts]
+    return {"embedding": vectors[0] if isinstance(content, str) else vectors}
+
+
+def _answer(prompt, json_output):
+    if not json_output:
+        return "A fake answer."
+    questions = prompt.split("Questions:")[-1].strip().splitlines()
+    return json.dumps([{"id": i + 1, "answer": "A fake answer."} for i in range(len(questions))])
+
+
+class _Part:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+        self.candidates = [types.SimpleNamespace(content=types.SimpleNamespace(parts=[_Part(text)]))]
+        self.usage_metadata = None
+
+
+class GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        _sleep("llm")
+        json_output = bool(generation_config) and "json" in str(generation_config)
+        response = _Response(_answer(prompt, json_output))
+        return iter([response]) if stream else response
+
+
+genai.embed_content = embed_content
+genai.GenerativeModel = GenerativeModel
+import google
+google.generativeai = genai
+sys.modules["google.generativeai"] = genai
+
+
+# --- pinecone ---
+pinecone = types.ModuleType("pinecone")
+_namespaces = {}
+_pinecone_lock = threading.Lock()
+
+
+class _Index:
+    def upsert(self, vectors, namespace="", **kwargs):
+        _sleep("pinecone")
+        with _pinecone_lock:
+            stored = _namespaces.setdefault(namespace, {})
+            for vector_id, values, metadata in vectors:
+                stored[vector_id] = types.SimpleNamespace(values=list(values), metadata=dict(metadata))
+
+    def query(self, vector=None, top_k=10, namespace="", include_metadata=False, include_values=False, **kwargs):
+        _sleep("pinecone")
+        with _pinecone_lock:
+            stored = list(_namespaces.get(namespace, {}).values())[:top_k]
+        matches = [
+            {"metadata": v.metadata, **({"values": v.values} if include_values else {})}
+            for v in stored
+        ]
+        return types.SimpleNamespace(to_dict=lambda: {"matches": matches})
+
+    def fetch(self, ids, namespace="", **kwargs):
+        _sleep("pinecone")
+        with _pinecone_lock:
+            stored = _namespaces.get(namespace, {})
+            return types.SimpleNamespace(vectors={i: stored[i] for i in ids if i in stored})
+
+
+class Pinecone:
+    def __init__(self, api_key=None, **kwargs):
+        pass
+
+    def list_indexes(self):
+        return types.SimpleNamespace(names=lambda: ["hackrxindex"])
+
+    def create_index(self, **kwargs):
+        pass
+
+    def Index(self, name):
+        return _Index()
+
+
+pinecone.Pinecone = Pinecone
+pinecone.ServerlessSpec = lambda **kwargs: None
+sys.modules["pinecone"] = pinecone
+
+
+# --- psycopg2 ---
+psycopg2 = types.ModuleType("psycopg2")
+extras = types.ModuleType("psycopg2.extras")
+pool = types.ModuleType("psycopg2.pool")
+
+
+class _Cursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def cursor(self):
+        return _Cursor()
+
+    def commit(self):
+        _sleep("db")
+
+    def close(self):
+        pass
+
+
+class ThreadedConnectionPool:
+    def __init__(self, minconn, maxconn, dsn=None, **kwargs):
+        pass
+
+    def getconn(self):
+        return _Connection()
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+
+psycopg2.connect = lambda *args, **kwargs: _Connection()
+extras.execute_values = lambda cur, sql, rows, **kwargs: None
+pool.ThreadedConnectionPool = ThreadedConnectionPool
+psycopg2.extras, psycopg2.pool = extras, pool
+sys.modules.update({"psycopg2": psycopg2, "psycopg2.extras": extras, "psycopg2.pool": pool})
+
+import uvicorn
+uvicorn.run("app.main:app", host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare /hackrx/run latency under load between two revisions.")
+    parser.add_argument("--baseline", required=True, help="Git revision to compare against")
+    parser.add_argument("--current", default="HEAD", help="Git revision to compare (default HEAD)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level (default 64)")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per request (default 5)")
+    parser.add_argument("--pages", type=int, default=20, help="Pages in the served document (default 20)")
+    parser.add_argument("--unique-documents", action="store_true",
+                        help="Serve different bytes to every request, so no document cache can answer")
+    parser.add_argument("--download-latency-ms", type=float, default=100)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--pinecone-latency-ms", type=float, default=30)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--db-latency-ms", type=float, default=20)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds per request (default 300)")
+    parser.add_argument("--out", help="Write the JSON report here (it's always printed)")
+    return parser.parse_args()
+
+
+def make_document(pages: int) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        lines = [f"Section {page_number}. The grace period for premium payment is thirty days."]
+        lines += [f"Clause {page_number}.{i}: the insured person may claim hospital expenses under this policy."
+                  for i in range(40)]
+        doc.new_page().insert_text((36, 36), "\n".join(lines), fontsize=7)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def start_document_server(document: bytes, latency_ms: float, unique: bool):
+    """Serves the document at any path; with unique, a trailing comment makes each path's bytes differ."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _body(self):
+            return document + (f"\n% {self.path}\n".encode() if unique else b"")
+
+        def _headers(self, body):
+            time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+
+        def do_HEAD(self):
+            self._headers(self._body())
+
+        def do_GET(self):
+            body = self._body()
+            self._headers(body)
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(tree: str, shim_path: str, latency: dict, cache_dir: str):
+    """Launches the revision checked out at tree. Returns (process, base_url) once it answers."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": tree,
+        "LOAD_COMPARE_LATENCY_MS": json.dumps(latency),
+        "BEARER_API_KEY": "load-compare",
+        "GEMINI_API_KEY": "fake",
+        "PINECONE_API_KEY": "fake",
+        "GROQ_API_KEY": "fake",
+        "DATABASE_URL": "postgresql://fake",
+        "LLM_PRIMARY_PROVIDER": "gemini",
+        "LLM_FALLBACK_PROVIDER": "",
+        "HACKRX_CACHE_DIR": cache_dir,
+        "LOG_SPILL_PATH": os.path.join(cache_dir, "log_spill.jsonl"),
+    }
+    process = subprocess.Popen([sys.executable, shim_path, str(port)], cwd=tree, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app at {tree} exited with code {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/", timeout=1)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise TimeoutError(f"The app at {tree} did not start")
+
+
+async def run_load(base_url: str, document_url: str, concurrency: int, total_requests: int,
+                   num_questions: int, unique: bool, timeout: float, run_label: str) -> dict:
+    next_request = 0
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout,
+                                 headers={"Authorization": "Bearer load-compare"}) as client:
+        async def client_loop():
+            nonlocal next_request, errors
+            while next_request < total_requests:
+                i = next_request
+                next_request += 1
+                url = f"{document_url}/{run_label}-{i}.pdf" if unique else f"{document_url}/policy.pdf"
+                # Unique questions, so no answer cache can answer for the pipeline
+                questions = [f"What is the grace period? ({run_label}, request {i}, question {j})"
+                             for j in range(num_questions)]
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/hackrx/run", json={"documents": url, "questions": questions})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    result = {"concurrency": concurrency, "requests": total_requests, "errors": errors,
+              "requests_per_second": round(total_requests / elapsed, 3)}
+    if latencies:
+        result["latency_ms"] = {f"p{p}": round(float(np.percentile(latencies, p)), 1) for p in (50, 99)}
+    return result
+
+
+def measure_revision(revision: str, args, shim_path: str, latency: dict, document_url: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="hackrx_load_compare_") as workdir:
+        tree = os.path.join(workdir, "tree")
+        subprocess.run(["git", "worktree", "add", "--detach", tree, revision],
+                       check=True, capture_output=True)
+        process = None
+        try:
+            process, base_url = start_app(tree, shim_path, latency, os.path.join(workdir, "cache"))
+            # One request first, so imports and client setup aren't counted
+            asyncio.run(run_load(base_url, document_url, 1, 1, args.questions, args.unique_documents,
+                                 args.timeout, "warm-up"))
+            load = [
+                asyncio.run(run_load(base_url, document_url, concurrency, args.requests, args.questions,
+                                     args.unique_documents, args.timeout, f"c{concurrency}"))
+                for concurrency in args.concurrency
+            ]
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+            subprocess.run(["git", "worktree", "remove", "--force", tree], capture_output=True)
+    commit = subprocess.run(["git", "rev-parse", "--short", revision], capture_output=True, text=True).stdout.strip()
+    return {"revision": revision, "commit": commit, "load": load}
+
+
+def main():
+    args = parse_args()
+    latency = {"embed": args.embed_latency_ms, "pinecone": args.pinecone_latency_ms,
+               "llm": args.llm_latency_ms, "db": args.db_latency_ms}
+    server, document_url = start_document_server(make_document(args.pages), args.download_latency_ms,
+                                                 args.unique_documents)
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as shim:
+        shim.write(SERVER_SHIM)
+    try:
+        report = {
+            "settings": {k: v for k, v in vars(args).items() if k != "out"},
+            "baseline": measure_revision(args.baseline, args, shim.name, latency, document_url),
+            "current": measure_revision(args.current, args, shim.name, latency, document_url),
+        }
+    finally:
+        os.remove(shim.name)
+        server.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
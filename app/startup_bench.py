@@ -0,0 +1,233 @@
+"""
+Cold-start benchmark: import time and time to first response.
+
+    python -m app.startup_bench --runs 5 --top 15
+
+Import time comes from `python -X importtime -c "import app.main"` in a fresh
+interpreter; the slowest modules are listed by cumulative time.
+
+Time to first response launches uvicorn on a free port, polls GET / until it
+answers, then sends the first /hackrx/run for a small local PDF and times
+both from launch, once with WARM_STARTUP on and once with it off. The run
+uses the mock LLM provider and a hash embedding in place of embed_content,
+but the Gemini SDK is still really imported and configured, so the first
+request pays the same import cost it would in production.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import tempfile
+import threading
+import statistics
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Runs the app with fake embeddings. get_genai is wrapped before app.main is
+# imported, so every module that imports it gets the wrapper.
+SERVER_SHIM = r'''
+import sys
+import zlib
+
+import numpy as np
+import uvicorn
+
+from app.utils import clients
+
+_get_genai = clients.get_genai
+
+
+def _embedding(text, dim):
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in text.lower().split():
+        h = zlib.crc32(token.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 1 else -1.0
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+
+def embed_content(model, content, task_type=None, output_dimensionality=768, **kwargs):
+    texts = [content] if isinstance(content, str) else content
+    vectors = [_embedding(text, output_dimensionality) for text in texts]
+    return {"embedding": vectors[0] if isinstance(content, str) else vectors}
+
+
+def get_genai():
+    genai = _get_genai()
+    genai.embed_content = embed_content
+    return genai
+
+
+clients.get_genai = get_genai
+uvicorn.run("app.main:app", host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first response.")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per measurement (default 5)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list (default 15)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the server (default 60)")
+    parser.add_argument("--pages", type=int, default=5, help="Pages in the document for the first run (default 5)")
+    return parser.parse_args()
+
+
+def import_profile(env: dict) -> dict:
+    """Returns {module: cumulative microseconds} for one cold `import app.main`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative_us)
+    return modules
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_document(pages: int) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        lines = [f"Clause {page_number}.{i}: the grace period for premium payment is thirty days."
+                 for i in range(40)]
+        doc.new_page().insert_text((36, 36), "\n".join(lines), fontsize=7)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def start_document_server(document: bytes):
+    """Serves the document at any path, with a different trailing comment per
+    path so no run finds it in a cache left by another."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, with_body):
+            body = document + f"\n% {self.path}\n".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self._send(False)
+
+        def do_GET(self):
+            self._send(True)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def time_to_first_response(env: dict, shim_path: str, document_url: str, timeout: float) -> dict:
+    """
+    Seconds from launching uvicorn until GET / returns 200 ("ready"), and
+    until the first /hackrx/run has been answered ("first_run").
+    """
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, shim_path, str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ready = None
+        while ready is None:
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"No response within {timeout}s")
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            try:
+                with urllib.request.urlopen(f"{base_url}/", timeout=1) as response:
+                    if response.status == 200:
+                        ready = time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+
+        body = json.dumps({"documents": document_url, "questions": ["What is the grace period?"]}).encode()
+        request = urllib.request.Request(
+            f"{base_url}/hackrx/run", data=body, method="POST",
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {env['BEARER_API_KEY']}"}
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+        return {"ready": ready, "first_run": time.perf_counter() - start}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _summary(seconds: list) -> dict:
+    return {"median_ms": round(statistics.median(seconds) * 1000, 1), "min_ms": round(min(seconds) * 1000, 1)}
+
+
+def main():
+    args = parse_args()
+    env = dict(os.environ)
+
+    profiles = [import_profile(env) for _ in range(args.runs)]
+    import_seconds = [profile["app.main"] / 1e6 for profile in profiles]
+    slowest = sorted(profiles[-1].items(), key=lambda item: item[1], reverse=True)
+
+    report = {"import_app_main": _summary(import_seconds), "slowest_imports_ms": {}}
+    for name, cumulative_us in slowest:
+        if len(report["slowest_imports_ms"]) >= args.top:
+            break
+        # Only top-level packages; their submodules are already counted in them
+        if "." not in name or name == "app.main":
+            report["slowest_imports_ms"][name] = round(cumulative_us / 1000, 1)
+
+    server, document_url = start_document_server(make_document(args.pages))
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as shim:
+        shim.write(SERVER_SHIM)
+    try:
+        run = 0
+        for warm in ("true", "false"):
+            with tempfile.TemporaryDirectory(prefix="hackrx_startup_bench_") as cache_dir:
+                run_env = {
+                    **env,
+                    "PYTHONPATH": os.getcwd(),
+                    "WARM_STARTUP": warm,
+                    "BEARER_API_KEY": "startup-bench",
+                    "LLM_PRIMARY_PROVIDER": "mock",
+                    "LLM_FALLBACK_PROVIDER": "",
+                    "VECTOR_BACKEND": "local",
+                    "METRICS_MULTIPROCESS": "false",
+                    "HACKRX_CACHE_DIR": cache_dir,
+                    "LOG_SPILL_PATH": os.path.join(cache_dir, "log_spill.jsonl"),
+                }
+                results = []
+                for _ in range(args.runs):
+                    run += 1
+                    results.append(time_to_first_response(
+                        run_env, shim.name, f"{document_url}/run-{run}.pdf", args.timeout))
+            report[f"warm_startup_{warm}"] = {
+                "ready": _summary([r["ready"] for r in results]),
+                "first_run": _summary([r["first_run"] for r in results]),
+            }
+    finally:
+        os.remove(shim.name)
+        server.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
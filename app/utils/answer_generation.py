@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import logging
+
+from app.utils.executors import run_blocking
+from app.utils.rate_limit import is_retryable_error, backoff_delay, LoopLocalSemaphore
+from app.utils.metrics import observe_stage
+from app.utils.embeddings import generate_answer, generate_batch_answers
+
+logger = logging.getLogger(__name__)
+
+# --- Fan-out limits ---
+# Per request: how many questions of one request may be in flight at once.
+# Global: how many LLM calls this process may have in flight across all requests.
+LLM_REQUEST_CONCURRENCY = int(os.getenv("LLM_REQUEST_CONCURRENCY", "5"))
+LLM_GLOBAL_CONCURRENCY = int(os.getenv("LLM_GLOBAL_CONCURRENCY", "16"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+
+# "single" asks one question per LLM call; "batch" packs up to LLM_BATCH_SIZE
+# questions and their shared context into one call.
+ANSWER_MODE = os.getenv("ANSWER_MODE", "single")
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "5"))
+
+_global_semaphore = LoopLocalSemaphore(LLM_GLOBAL_CONCURRENCY)
+
+
+async def _call_with_retry(answer_fn, *args):
+    # answer_fn is either a coroutine function (the routed default) or a
+    # blocking function, which runs on the I/O pool
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _global_semaphore:
+                call = answer_fn(*args) if asyncio.iscoroutinefunction(answer_fn) else run_blocking(answer_fn, *args)
+                return await asyncio.wait_for(call, timeout=LLM_CALL_TIMEOUT)
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not is_retryable_error(e):
+                raise
+            # Back off outside the global semaphore so a waiting call doesn't hold a slot
+            delay = backoff_delay(attempt, LLM_BACKOFF_BASE)
+            logger.warning(f"LLM call failed ({type(e).__name__}); retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def generate_answers(questions: list, top_matches_all: dict, timings: dict,
+                           answer_fn=generate_answer,
+                           batch_answer_fn=generate_batch_answers, stats: dict = None) -> list:
+    """
+    Answers all questions concurrently, bounded by the per-request and global
+    limits. Answers are returned in the same order as the questions, and each
+    call's duration is recorded in timings as generate_answer_llm_<n> (ms).
+
+    In batch mode, questions are grouped into batches of LLM_BATCH_SIZE and each
+    batch is timed as generate_answer_batch_<n> (ms), and the estimated prompt
+    tokens saved go into stats as batch_tokens_saved. Questions whose answer
+    couldn't be parsed from the batch response fall back to a single-question call.
+    """
+    request_semaphore = asyncio.Semaphore(LLM_REQUEST_CONCURRENCY)
+    durations = [None] * len(questions)
+
+    async def answer_one(i, question):
+        async with request_semaphore:
+            start_time = time.perf_counter_ns()
+            answer = await _call_with_retry(answer_fn, question, top_matches_all)
+            durations[i] = time.perf_counter_ns() - start_time
+            return answer
+
+    if ANSWER_MODE == "batch" and len(questions) > 1:
+        answers = await _generate_batched(questions, top_matches_all, timings, batch_answer_fn, request_semaphore,
+                                          stats if stats is not None else {})
+        fallback = [i for i, answer in enumerate(answers) if answer is None]
+        if fallback:
+            logger.info(f"Falling back to single-question calls for {len(fallback)} unparsed answers.")
+            results = await asyncio.gather(*(answer_one(i, questions[i]) for i in fallback))
+            for i, answer in zip(fallback, results):
+                answers[i] = answer
+    else:
+        answers = await asyncio.gather(*(answer_one(i, q) for i, q in enumerate(questions)))
+
+    for i, duration in enumerate(durations):
+        if duration is not None:
+            observe_stage("llm_call", duration, timings, f"generate_answer_llm_{i+1}")
+    return list(answers)
+
+
+async def _generate_batched(questions: list, top_matches_all: dict, timings: dict,
+                            batch_answer_fn, request_semaphore, stats: dict) -> list:
+    batches = [questions[i:i + LLM_BATCH_SIZE] for i in range(0, len(questions), LLM_BATCH_SIZE)]
+    durations = [0] * len(batches)
+
+    async def answer_batch(b, batch):
+        async with request_semaphore:
+            start_time = time.perf_counter_ns()
+            try:
+                result = await _call_with_retry(batch_answer_fn, batch, top_matches_all)
+            except Exception as e:
+                # Every question in the batch will be retried on its own
+                logger.warning(f"Batch answer call failed: {e}")
+                result = [None] * len(batch), 0
+            durations[b] = time.perf_counter_ns() - start_time
+            return result
+
+    results = await asyncio.gather(*(answer_batch(b, batch) for b, batch in enumerate(batches)))
+
+    answers = []
+    tokens_saved = 0
+    for batch_answers, saved in results:
+        answers.extend(batch_answers)
+        tokens_saved += saved
+
+    for b, duration in enumerate(durations):
+        observe_stage("llm_batch_call", duration, timings, f"generate_answer_batch_{b+1}")
+    stats["batch_tokens_saved"] = tokens_saved
+    logger.info(f"Batched {len(questions)} questions into {len(batches)} calls; ~{tokens_saved} prompt tokens saved.")
+    return answers
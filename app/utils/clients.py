@@ -0,0 +1,32 @@
+import os
+import threading
+
+# --- Long-lived SDK clients ---
+# The Gemini and Groq SDKs are slow to import (google.generativeai alone is
+# most of our startup time), so each is imported and configured on first use
+# and then shared by the whole process.
+_genai = None
+_groq_client = None
+_lock = threading.Lock()
+
+
+def get_genai():
+    """The google.generativeai module, configured with GEMINI_API_KEY."""
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _genai = genai
+    return _genai
+
+
+def get_groq_client():
+    global _groq_client
+    if _groq_client is None:
+        with _lock:
+            if _groq_client is None:
+                from groq import Groq
+                _groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return _groq_client
@@ -0,0 +1,88 @@
+import os
+
+from app.utils.data_processing import split_into_sentences, CHUNK_OVERLAP
+
+# --- Context packing ---
+# Upper bound on the estimated tokens of context sent with each LLM call.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+PASSAGE_SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough estimate (~4 characters per token) so we can compare prompt sizes
+    # without an extra count_tokens round trip.
+    return len(text) // 4
+
+
+def _position(match: dict, fallback: int) -> int:
+    return match["metadata"].get("chunk", match.get("index", fallback))
+
+
+def _merge_words(left: list, right: list, max_overlap: int) -> list:
+    """
+    Joins two word lists, dropping the longest prefix of right that repeats
+    the end of left (the chunker's overlap).
+    """
+    for size in range(min(max_overlap, len(left), len(right)), 0, -1):
+        if left[-size:] == right[:size]:
+            return left + right[size:]
+    return left + right
+
+
+def assemble_context(matches: list, token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Turns retrieved chunks into a compact context string:
+
+    1. Chunks next to each other in the document are merged into one passage,
+       with the overlap the chunker repeats between them removed.
+    2. Sentences already included in an earlier passage are dropped.
+    3. Passages are added from most to least relevant until token_budget is
+       reached; the passage that crosses it is cut at a sentence boundary.
+    4. The kept passages are ordered by their position in the document.
+
+    Returns:
+        A tuple of (context, stats), where stats has the estimated tokens of
+        the raw chunks ("raw_tokens") and of the packed context ("tokens").
+    """
+    chunks = {}
+    for rank, match in enumerate(matches):
+        position = _position(match, rank)
+        # The same chunk can be retrieved more than once (e.g. by several questions)
+        if position not in chunks:
+            chunks[position] = (rank, match["metadata"]["text"])
+    raw_tokens = sum(estimate_tokens(text) for _, text in chunks.values())
+
+    passages = []  # [best_rank, first_position, words, last_position]
+    for position in sorted(chunks):
+        rank, text = chunks[position]
+        words = text.split()
+        if passages and passages[-1][3] == position - 1:
+            passage = passages[-1]
+            passage[0] = min(passage[0], rank)
+            passage[2] = _merge_words(passage[2], words, CHUNK_OVERLAP * 2)
+            passage[3] = position
+        else:
+            passages.append([rank, position, words, position])
+
+    seen = set()
+    selected = []
+    tokens = 0
+    for rank, first_position, words, _ in sorted(passages):
+        sentences = []
+        for sentence in split_into_sentences(" ".join(words)):
+            key = " ".join(sentence.casefold().split())
+            if key in seen:
+                continue
+            cost = estimate_tokens(sentence) + 1
+            if tokens + cost > token_budget:
+                break
+            seen.add(key)
+            sentences.append(sentence)
+            tokens += cost
+        if sentences:
+            selected.append((first_position, " ".join(sentences)))
+        if tokens >= token_budget:
+            break
+
+    context = PASSAGE_SEPARATOR.join(text for _, text in sorted(selected))
+    return context, {"raw_tokens": raw_tokens, "tokens": estimate_tokens(context)}
@@ -1,102 +1,299 @@
+import os
 import re
-from collections import Counter
-import nltk
+from bisect import bisect_right
+from collections import Counter, deque
+from itertools import chain, groupby
+from operator import itemgetter
 import unicodedata
 from pathlib import Path
-nltk.data.path.append(str(Path(__file__).resolve().parent.parent.parent / "nltk_data"))
-from nltk.tokenize import sent_tokenize
 
-def clean_text(text: str, page_count: int) -> str:
-    # Normalize encoding
-    text = text.encode('utf-8', errors='ignore').decode('utf-8')
-    text = unicodedata.normalize("NFKC",text)
+NLTK_DATA_DIR = str(Path(__file__).resolve().parent.parent.parent / "nltk_data")
+_sent_tokenize = None
 
-    # changing dash unicode to dash
-    text = text.replace("\u2013", "-")
+
+def sent_tokenize(text: str) -> list:
+    # nltk takes a noticeable share of startup, so it's imported on first use
+    global _sent_tokenize
+    if _sent_tokenize is None:
+        import nltk
+        if NLTK_DATA_DIR not in nltk.data.path:
+            nltk.data.path.append(NLTK_DATA_DIR)
+        from nltk.tokenize import sent_tokenize as nltk_sent_tokenize
+        _sent_tokenize = nltk_sent_tokenize
+    return _sent_tokenize(text)
+
+
+# v2: small documents are joined with spaces, and oversized sentences are split
+# v3: a sentence ending on a page no longer takes the next page as its last page
+# v4: in the tokens unit the overlap shrinks so chunks fit EMBEDDING_MAX_INPUT_TOKENS
+DATA_PROCESSING_VERSION = "v4"
+
+# Chunker parameters. These are part of the document id (see document_cache),
+# so changing any of them makes previously stored vectors miss the cache.
+MIN_WORDS_NO_CHUNK = 340
+MAX_CHUNK_WORDS = 500
+CHUNK_OVERLAP = 50
+# "words" budgets chunks by whitespace words; "tokens" budgets by an
+# approximate model token count, capped at the embedding model's input limit.
+CHUNK_BUDGET_UNIT = "words"
+EMBEDDING_MAX_INPUT_TOKENS = 2048
+
+# How many pages the streaming cleaner holds back, so that a header repeated
+# on every page has been counted enough times before its first copy is emitted.
+HEADER_WINDOW_PAGES = 3
+
+class CleaningProfile:
+    """
+    The cleaning rules for one family of documents. Patterns are compiled once,
+    when the profile is created.
+
+    Rules run in the same order as they always have: page footers, standalone
+    numbers, emails, URLs, then any extra patterns. The order matters (removing
+    a footer can leave a number alone on its line). Merging emails and URLs into
+    one alternation was measured slower than two passes, because it defeats the
+    regex engine's literal-prefix scan for "http".
+    """
+
+    def __init__(self, page_footers=True, standalone_numbers=True, emails=True, urls=True,
+                 extra_patterns=(), repeated_line_min_words=7, repeated_line_max_threshold=3):
+        self.page_footer_re = re.compile(
+            r'\bPage\s*[:\-]?\s*\d+\s*(of|out\s+of)?\s*\d*\b', re.IGNORECASE
+        ) if page_footers else None
+        self.standalone_number_re = re.compile(r'^\s*\d+\s*$', re.MULTILINE) if standalone_numbers else None
+
+        # Same matches as \S+@\S+ (the leftmost match always starts at the
+        # beginning of a whitespace-delimited run), but the lookbehind stops the
+        # engine from retrying at every character inside long runs
+        self.email_re = re.compile(r'(?<!\S)\S+@\S+') if emails else None
+        self.url_re = re.compile(r'http\S+') if urls else None
+        self.extra_res = [re.compile(p) for p in extra_patterns]
+
+        self.repeated_line_min_words = repeated_line_min_words
+        self.repeated_line_max_threshold = repeated_line_max_threshold
+
+CLEANING_PROFILES = {
+    "default": CleaningProfile(),
+    # For documents where contact details are content (e.g. claim procedures)
+    "keep_contacts": CleaningProfile(emails=False, urls=False),
+}
+# The profile used for every document. Its name is part of the document id,
+# so switching profiles re-processes documents instead of reusing old vectors.
+CLEANING_PROFILE = os.getenv("CLEANING_PROFILE", "default")
+if CLEANING_PROFILE not in CLEANING_PROFILES:
+    raise ValueError(f"Unknown CLEANING_PROFILE {CLEANING_PROFILE!r}; expected one of {sorted(CLEANING_PROFILES)}")
+DEFAULT_CLEANING_PROFILE = CLEANING_PROFILES[CLEANING_PROFILE]
+
+def _normalize_and_strip(text: str, profile: CleaningProfile = DEFAULT_CLEANING_PROFILE) -> str:
+    # Normalizing encoding and unicode is a no-op for pure ASCII text, which
+    # str.isascii() answers without scanning the string
+    if not text.isascii():
+        text = text.encode('utf-8', errors='ignore').decode('utf-8')
+        text = unicodedata.normalize("NFKC",text)
+
+        # changing dash unicode to dash
+        text = text.replace("\u2013", "-")
 
     # Remove common patterns
-    text = re.sub(r'\bPage\s*[:\-]?\s*\d+\s*(of|out\s+of)?\s*\d*\b','', text, flags=re.IGNORECASE)
-    text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)  # standalone numbers
-    text = re.sub(r'\S+@\S+', '', text)  # emails
-    text = re.sub(r'http\S+', '', text)  # urls
-
-    # Split into lines
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-
-    # Count frequency of lines
-    line_counts = Counter(lines)
-
-    # Threshold: max 3
-    freq_threshold = min(page_count, 3)
-
-    # Remove frequent lines
-    cleaned_lines = [
-        line for line in lines 
-        if not (line_counts[line] >= freq_threshold and len(line.split()) > 7)
-    ]
-    # Join list back into a string
-    text = " ".join(cleaned_lines)
-
-    # Normalize spaces
-    text = re.sub(r'\s+', ' ', text).strip()
+    if profile.page_footer_re:
+        text = profile.page_footer_re.sub('', text)
+    if profile.standalone_number_re:
+        text = profile.standalone_number_re.sub('', text)
+    # The substring checks are much cheaper than a regex scan that finds nothing
+    if profile.email_re and "@" in text:
+        text = profile.email_re.sub('', text)  # emails
+    if profile.url_re and "http" in text:
+        text = profile.url_re.sub('', text)  # urls
+    for extra_re in profile.extra_res:
+        text = extra_re.sub('', text)
     return text
 
+def clean_text(text: str, page_count: int, profile: CleaningProfile = DEFAULT_CLEANING_PROFILE) -> str:
+    """
+    Cleans a whole document in one go. This is the streaming cleaner
+    (iter_clean_lines) given the text as a single page, so every line is
+    counted before any is dropped and both paths share the same rules.
+    """
+    return " ".join(line for _, line in iter_clean_lines([(1, text)], page_count, profile))
+
 def split_into_sentences(text):
     # If it's a list, join with spaces
     if isinstance(text, list):
         text = " ".join(text)
     return sent_tokenize(text)
 
-def create_chunks(sentences, min_words_no_chunk=340, max_chunk_words=500, overlap=50):
+def iter_clean_lines(pages, page_count: int, profile: CleaningProfile = DEFAULT_CLEANING_PROFILE):
+    """
+    Streaming counterpart of clean_text. Takes (page_number, text) tuples and
+    yields (page_number, line) for every line that survives cleaning.
+
+    Repeated long lines (headers/footers) are counted as pages arrive. Lines are
+    held back for HEADER_WINDOW_PAGES pages before being emitted, so a header on
+    every page is already known to be repeated by the time its first copy would
+    go out. Only hashes are kept for counting, never the page text.
+    """
+    freq_threshold = min(page_count, profile.repeated_line_max_threshold)
+    line_counts = Counter()
+    window = deque()
+
+    def emit(page_no, lines):
+        for line in lines:
+            if len(line.split()) > profile.repeated_line_min_words and line_counts[hash(line)] >= freq_threshold:
+                continue
+            yield page_no, " ".join(line.split())
+
+    for page_no, page_text in pages:
+        lines = [line for line in map(str.strip, _normalize_and_strip(page_text, profile).splitlines()) if line]
+        for line in lines:
+            if len(line.split()) > profile.repeated_line_min_words:
+                line_counts[hash(line)] += 1
 
-    # Count total words
-    total_words = sum(len(s.split()) for s in sentences)
+        window.append((page_no, lines))
+        if len(window) > HEADER_WINDOW_PAGES:
+            yield from emit(*window.popleft())
+
+    while window:
+        yield from emit(*window.popleft())
+
+def iter_sentences(lines):
+    """
+    Takes (page_number, line) tuples and yields (sentence, first_page, last_page).
+    A sentence that runs over a page break is carried into the next page before
+    it's emitted.
+    """
+    carry, carry_first, carry_last = "", None, None
+
+    for page_no, page_lines in groupby(lines, key=itemgetter(0)):
+        page_text = " ".join(line for _, line in page_lines)
+        buffer = f"{carry} {page_text}" if carry else page_text
+        sentences = sent_tokenize(buffer)
+        if not sentences:
+            continue
+
+        first_page = carry_first if carry else page_no
+        # The carried sentence only reaches this page if the tokenizer joined
+        # it with text from here; otherwise it ended where it was carried from
+        first_last = page_no if not carry or len(sentences[0]) > len(carry) else carry_last
+        for i, sent in enumerate(sentences[:-1]):
+            if i == 0:
+                yield sent, first_page, first_last
+            else:
+                yield sent, page_no, page_no
+
+        # The last sentence may continue on the next page
+        carry = sentences[-1]
+        carry_first = first_page if len(sentences) == 1 else page_no
+        carry_last = first_last if len(sentences) == 1 else page_no
+
+    if carry:
+        yield carry, carry_first, carry_last
+
+def estimate_word_tokens(word: str) -> int:
+    # ~4 characters per token, and never less than one token per word
+    return max(1, (len(word) + 3) // 4)
+
+def _budget_cost(words: list, unit: str) -> int:
+    if unit == "tokens":
+        return sum(estimate_word_tokens(w) for w in words)
+    return len(words)
+
+def _split_oversized(words: list, budget: int, unit: str):
+    """
+    Splits a sentence longer than the whole chunk budget (e.g. a flattened
+    table) into pieces that fit, so no chunk exceeds the model's input limit.
+    """
+    piece, piece_cost = [], 0
+    for word in words:
+        cost = _budget_cost([word], unit)
+        if piece and piece_cost + cost > budget:
+            yield piece
+            piece, piece_cost = [], 0
+        piece.append(word)
+        piece_cost += cost
+    if piece:
+        yield piece
+
+def iter_chunks(sentences, min_words_no_chunk=MIN_WORDS_NO_CHUNK, max_chunk_words=MAX_CHUNK_WORDS,
+                overlap=CHUNK_OVERLAP, unit=CHUNK_BUDGET_UNIT):
+    """
+    Takes (sentence, first_page, last_page) tuples and yields
+    (chunk, page_start, page_end) as soon as each chunk is complete.
+
+    Each sentence is split into words once. The current chunk is kept as a flat
+    word list with the word offset where each sentence starts, so the overlap
+    is a slice of that list rather than a re-join and re-split of the chunk.
+    Sizes are measured in the given unit ("words" or "tokens").
+    """
+    tokenized = ((sent.split(), first_page, last_page) for sent, first_page, last_page in sentences)
+
+    # Small documents change how we chunk, so buffer sentences until we know
+    # whether this is one (at most ~1000 units are held)
+    head = []
+    total = 0
+    for sent in tokenized:
+        head.append(sent)
+        total += _budget_cost(sent[0], unit)
+        if total > max(1000, min_words_no_chunk):
+            break
 
     # If document is small, don't chunk
-    if total_words <= min_words_no_chunk:
-        return ["".join(sentences)]
+    if total <= min_words_no_chunk:
+        yield " ".join(w for words, _, _ in head for w in words), (head[0][1] if head else None), (head[-1][2] if head else None)
+        return
 
     # Determine chunk size
-    if 700 <= total_words <= 1000:
+    if 700 <= total <= 1000:
         target_chunks = 3
-        chunk_size = max(min(total_words // target_chunks, max_chunk_words), 250)
+        chunk_size = max(min(total // target_chunks, max_chunk_words), 250)
     else:
         chunk_size = max_chunk_words
+    if unit == "tokens":
+        chunk_size = min(chunk_size, EMBEDDING_MAX_INPUT_TOKENS)
 
-    chunks = []
-    current_chunk = []
+    current_words = []
     current_len = 0
+    # Word offset, first page and last page of each sentence in the chunk
+    offsets, first_pages, last_pages = [], [], []
 
-    for sent in sentences:
-        words = sent.split()
-        # If adding this sentence exceeds the chunk size
-        if current_len + len(words) > chunk_size:
-            chunks.append(" ".join(current_chunk))
-
-            # Create overlap
-            if overlap > 0:
-                overlap_words = " ".join(
-                    " ".join(current_chunk).split()[-overlap:]
-                )
-                current_chunk = [overlap_words]
-                current_len = len(overlap_words.split())
-            else:
-                current_chunk = []
-                current_len = 0
+    for words, first_page, last_page in chain(head, tokenized):
+        cost = _budget_cost(words, unit)
+        pieces = _split_oversized(words, chunk_size, unit) if cost > chunk_size else [words]
 
-        # Add sentence to chunk
-        current_chunk.append(sent)
-        current_len += len(words)
+        for piece in pieces:
+            cost = _budget_cost(piece, unit) if piece is not words else cost
+            # If adding this sentence exceeds the chunk size
+            if current_words and current_len + cost > chunk_size:
+                yield " ".join(current_words), first_pages[0], last_pages[-1]
 
-    # Add final chunk
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+                # Create overlap from the tail of the current chunk
+                tail = current_words[-overlap:] if overlap > 0 else []
+                if unit == "tokens":
+                    # The model's input limit is hard, so the overlap gives way to it
+                    while tail and _budget_cost(tail, unit) + cost > EMBEDDING_MAX_INPUT_TOKENS:
+                        tail = tail[1:]
+                if tail:
+                    start = bisect_right(offsets, len(current_words) - len(tail)) - 1
+                    first_pages, last_pages = [first_pages[start]], [last_pages[-1]]
+                    offsets = [0]
+                    current_words = tail
+                    current_len = _budget_cost(tail, unit)
+                else:
+                    current_words, offsets, first_pages, last_pages = [], [], [], []
+                    current_len = 0
 
-    return chunks
+            # Add sentence to chunk
+            offsets.append(len(current_words))
+            first_pages.append(first_page)
+            last_pages.append(last_page)
+            current_words.extend(piece)
+            current_len += cost
 
+    # Add final chunk
+    if current_words:
+        yield " ".join(current_words), first_pages[0], last_pages[-1]
 
-def prepare_for_embeddings(text, page):
-    cleaned_text = clean_text(text, page)
-    sentences = split_into_sentences("".join(cleaned_text)) # don't add space it will create space between every character
-    chunks = create_chunks(sentences)
-    return chunks
+def iter_document_chunks(pages, page_count: int, profile: CleaningProfile = DEFAULT_CLEANING_PROFILE):
+    """
+    The streaming pipeline: pages -> cleaned lines -> sentences -> chunks.
+    Yields (chunk, page_start, page_end) while later pages are still unread.
+    """
+    return iter_chunks(iter_sentences(iter_clean_lines(pages, page_count, profile)))
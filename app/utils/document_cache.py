@@ -0,0 +1,155 @@
+import os
+import time
+import fcntl
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from app.utils.data_processing import (DATA_PROCESSING_VERSION, MIN_WORDS_NO_CHUNK,
+                                       MAX_CHUNK_WORDS, CHUNK_OVERLAP, CHUNK_BUDGET_UNIT,
+                                       CLEANING_PROFILE)
+from app.utils.text_extraction import TEXT_EXTRACTION_VERSION
+
+# --- Local cache location ---
+# Shared by every worker process on the host, so anything read-modify-written
+# here must hold a file_lock, not just a threading lock.
+CACHE_DIR = os.getenv("HACKRX_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hackrx_cache"))
+URL_INDEX_PATH = os.path.join(CACHE_DIR, "url_index.sqlite3")
+URL_INDEX_MAX_ENTRIES = int(os.getenv("URL_INDEX_MAX_ENTRIES", "100000"))
+URL_INDEX_BUSY_TIMEOUT = float(os.getenv("URL_INDEX_BUSY_TIMEOUT", "30"))
+LOCK_DIR = os.path.join(CACHE_DIR, "locks")
+
+_url_index_lock = threading.Lock()
+_url_index_conn = None
+
+
+@contextmanager
+def file_lock(name: str):
+    """
+    Holds an exclusive flock on <CACHE_DIR>/locks/<name>.lock, blocking until
+    any other process (or thread) holding it lets go. The lock is released
+    by the OS if its holder dies.
+    """
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    with open(os.path.join(LOCK_DIR, f"{name}.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_document_id(content_digest: str) -> str:
+    """
+    Builds the deterministic document id used as the Pinecone namespace.
+
+    The id covers the document bytes, the extractor and processing versions,
+    the chunker parameters and the embedding model, so the same PDF always
+    maps to the same stored vectors while a change to how documents are
+    processed or embedded starts a fresh namespace.
+    """
+    # Imported here: embeddings imports the caches, which import this module
+    from app.utils.embeddings import EMBEDDING_MODEL, EMBEDDING_DIM
+
+    key = "|".join([
+        content_digest,
+        f"extract={TEXT_EXTRACTION_VERSION}",
+        DATA_PROCESSING_VERSION,
+        f"min={MIN_WORDS_NO_CHUNK}",
+        f"max={MAX_CHUNK_WORDS}",
+        f"overlap={CHUNK_OVERLAP}",
+        f"unit={CHUNK_BUDGET_UNIT}",
+        f"clean={CLEANING_PROFILE}",
+        f"embedding={EMBEDDING_MODEL}",
+        f"dim={EMBEDDING_DIM}",
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _get_url_index_conn():
+    global _url_index_conn
+    if _url_index_conn is None:
+        os.makedirs(os.path.dirname(URL_INDEX_PATH), exist_ok=True)
+        # Shared by every worker process, like the embedding cache: WAL lets
+        # them read while one writes, and writers queue on the busy timeout
+        _url_index_conn = sqlite3.connect(URL_INDEX_PATH, check_same_thread=False, timeout=URL_INDEX_BUSY_TIMEOUT)
+        _url_index_conn.execute("PRAGMA journal_mode=WAL")
+        _url_index_conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                content_digest TEXT NOT NULL,
+                file_extension TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        _url_index_conn.execute("CREATE INDEX IF NOT EXISTS urls_last_used ON urls (last_used)")
+        _url_index_conn.commit()
+    return _url_index_conn
+
+
+def get_url_entry(doc_url: str):
+    """
+    Returns the cached entry for a URL, or None if the URL has not been seen.
+
+    An entry looks like:
+        {"content_digest": ..., "file_extension": ..., "etag": ..., "last_modified": ...}
+
+    The entry holds the content digest rather than the document id, so the id
+    is rebuilt with the current processing versions (make_document_id) each
+    time.
+    """
+    with _url_index_lock:
+        conn = _get_url_index_conn()
+        row = conn.execute(
+            "SELECT content_digest, file_extension, etag, last_modified FROM urls WHERE url = ?", (doc_url,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE urls SET last_used = ? WHERE url = ?", (time.time(), doc_url))
+        conn.commit()
+    return dict(zip(("content_digest", "file_extension", "etag", "last_modified"), row))
+
+
+def record_url_entry(doc_url: str, content_digest: str, file_extension: str, etag=None, last_modified=None):
+    """
+    Remembers which content a URL resolved to, along with the validators
+    needed to revalidate it later. URLs without an ETag or Last-Modified
+    header can't be revalidated, so they are not recorded.
+
+    Past URL_INDEX_MAX_ENTRIES, the least recently used URLs are forgotten.
+    """
+    if not etag and not last_modified:
+        return
+
+    with _url_index_lock:
+        conn = _get_url_index_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO urls (url, content_digest, file_extension, etag, last_modified, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (doc_url, content_digest, file_extension, etag, last_modified, time.time())
+        )
+        (count,) = conn.execute("SELECT COUNT(*) FROM urls").fetchone()
+        overflow = count - URL_INDEX_MAX_ENTRIES
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM urls WHERE url IN (SELECT url FROM urls ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+        conn.commit()
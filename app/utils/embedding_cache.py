@@ -0,0 +1,125 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+from app.utils.document_cache import CACHE_DIR
+from app.utils.metrics import register_stats
+
+# --- Persistent chunk-embedding cache ---
+# Vectors are stored as float32 blobs in SQLite, keyed by a hash of the chunk
+# text, model and dimensionality. Revisions of the same policy share most of
+# their chunks, so only the changed chunks need to go to the embedding API.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(CACHE_DIR, "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_BUSY_TIMEOUT = float(os.getenv("EMBEDDING_CACHE_BUSY_TIMEOUT", "30"))
+
+_lock = threading.Lock()
+_conn = None
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH), exist_ok=True)
+        # Every worker process opens the same file. WAL lets them read while
+        # one writes; the timeout makes writers queue instead of failing with
+        # "database is locked".
+        _conn = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False, timeout=EMBEDDING_CACHE_BUSY_TIMEOUT)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        _conn.commit()
+    return _conn
+
+
+def embedding_key(text: str, model: str, dimensionality: int) -> str:
+    return hashlib.sha256(f"{model}|{dimensionality}|{text}".encode("utf-8")).hexdigest()
+
+
+def get_cached_embeddings(texts: list, model: str, dimensionality: int) -> list:
+    """
+    Looks up each text in the cache.
+
+    Returns:
+        A list the same length as texts, holding the cached vector (list of
+        floats) or None for each miss.
+    """
+    keys = [embedding_key(t, model, dimensionality) for t in texts]
+    found = {}
+
+    with _lock:
+        conn = _get_conn()
+        # SQLite limits the number of bound parameters, so look up in slices
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            found.update(rows)
+
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+            conn.commit()
+
+        hits = sum(1 for k in keys if k in found)
+        _stats["hits"] += hits
+        _stats["misses"] += len(keys) - hits
+
+    return [
+        np.frombuffer(found[k], dtype=np.float32).tolist() if k in found else None
+        for k in keys
+    ]
+
+
+def put_cached_embeddings(texts: list, vectors: list, model: str, dimensionality: int):
+    """
+    Stores vectors for the given texts, then evicts the least recently used
+    entries if the cache has grown past EMBEDDING_CACHE_MAX_ENTRIES.
+    """
+    now = time.time()
+    rows = [
+        (embedding_key(t, model, dimensionality), np.asarray(v, dtype=np.float32).tobytes(), now)
+        for t, v in zip(texts, vectors)
+    ]
+
+    with _lock:
+        conn = _get_conn()
+        conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - EMBEDDING_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+            _stats["evictions"] += overflow
+        conn.commit()
+
+
+def get_embedding_cache_stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+register_stats("embeddings", get_embedding_cache_stats)
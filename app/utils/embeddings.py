@@ -1,221 +1,249 @@
-from pinecone import Pinecone, ServerlessSpec
 import os
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from groq import Groq
-# from google import genai
-import google.generativeai as genai
+import re
+import json
+import threading
 from dotenv import load_dotenv
 
+from app.utils.embedding_cache import get_cached_embeddings, put_cached_embeddings
+from app.utils.memo_cache import query_embedding_cache, normalize_question
+from app.utils.executors import submit_blocking
+from app.utils.rate_limit import RateLimiter, call_with_retry
+from app.utils.metrics import stage, CONTEXT_TOKENS
+from app.utils.llm_providers import llm_router, GEMINI_MODEL
+from app.utils.context_assembly import assemble_context, estimate_tokens, CONTEXT_TOKEN_BUDGET
+from app.utils.clients import get_genai
+
 load_dotenv()
 index_name = "hackrxindex"
-DATA_PROCESSING_VERSION = "v1"
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIM = 768
+# Bump when the answer prompts change, so cached answers from the old prompt are not served
+ANSWER_PROMPT_VERSION = "p1"
+# "hybrid" fuses dense and BM25 rankings; "dense" ranks by cosine similarity alone
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+ANSWER_CACHE_VERSION = f"{GEMINI_MODEL}|{ANSWER_PROMPT_VERSION}|{RETRIEVAL_MODE}"
+
+# --- Batching for document embeddings and upserts ---
+# Chunks per embed_content call and vectors per Pinecone upsert. Each batch is
+# its own request, paced by a rate limiter and retried with backoff on
+# transient errors.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+EMBED_REQUESTS_PER_SECOND = float(os.getenv("EMBED_REQUESTS_PER_SECOND", "20"))
+UPSERT_REQUESTS_PER_SECOND = float(os.getenv("UPSERT_REQUESTS_PER_SECOND", "20"))
+STORE_MAX_RETRIES = int(os.getenv("STORE_MAX_RETRIES", "4"))
+STORE_BACKOFF_BASE = float(os.getenv("STORE_BACKOFF_BASE", "0.5"))
+# Vector ids per Pinecone fetch. Fetch is a GET with the ids in the query
+# string, so batches stay well short of URL length limits.
+FETCH_BATCH_SIZE = int(os.getenv("FETCH_BATCH_SIZE", "100"))
+
+embed_rate_limiter = RateLimiter(EMBED_REQUESTS_PER_SECOND)
+upsert_rate_limiter = RateLimiter(UPSERT_REQUESTS_PER_SECOND)
 
 pc_key=os.getenv("PINECONE_API_KEY")
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY")) 
-
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=gemini_api_key)
 
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+_pinecone_index = None
+_pinecone_lock = threading.Lock()
 
 def get_pinecone_index():
-    if index_name not in pc.list_indexes().names():
-        pc.create_index(
-            name=index_name,
-            dimension=768,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-    return pc.Index(index_name)
-
-def get_embeddings_from_namespace(pinecone_index, id_to_check, top_k: int = 1000):
-    dummy_vector = [0] * 768  # Adjust dimension
+    """
+    The Pinecone index handle. The client is created, and the index checked
+    (and created if missing), on the first call only; later calls reuse it.
+    """
+    global _pinecone_index
+    if _pinecone_index is None:
+        with _pinecone_lock:
+            if _pinecone_index is None:
+                from pinecone import Pinecone, ServerlessSpec
+                pc = Pinecone(api_key=pc_key)
+                if index_name not in pc.list_indexes().names():
+                    pc.create_index(
+                        name=index_name,
+                        dimension=EMBEDDING_DIM,
+                        metric="cosine",
+                        spec=ServerlessSpec(cloud="aws", region="us-east-1")
+                    )
+                _pinecone_index = pc.Index(index_name)
+    return _pinecone_index
+
+def _query_namespace(pinecone_index, namespace: str, top_k: int, include_values: bool) -> list:
     result = pinecone_index.query(
-        vector=dummy_vector,
+        vector=[0] * EMBEDDING_DIM,
         top_k=top_k,
-        namespace=id_to_check,
+        namespace=namespace,
         include_metadata=True,
-        include_values=True
-    )
-    matches = result.to_dict().get("matches", [])
-
-    # Convert to desired structure
-    embeddings = [
-        {"embedding": m["values"], "metadata": m["metadata"]}
-        for m in matches
-    ]
-
-    return embeddings
-
-def store_embeddings(chunks: list, index_id: str, pinecone_index):
-    response = genai.embed_content(
-        model="models/text-embedding-004",
-        content=chunks,  
-        task_type="RETRIEVAL_DOCUMENT",
-        output_dimensionality=768
+        include_values=include_values
     )
+    return result.to_dict().get("matches", [])
 
-    embeddings_list = response['embedding']
+def get_embeddings_from_namespace(pinecone_index, id_to_check):
+    """
+    Reads every vector stored for a document, in chunk order.
+
+    A query returns at most 1000 matches, so it's only used to read one
+    vector's chunk_count. The vectors themselves are fetched by their ids
+    (see upsert_to_namespace), FETCH_BATCH_SIZE at a time. Ids that are
+    missing are skipped, so a half-written namespace comes back short of
+    its chunk_count. Namespaces written before chunk_count was stored
+    fall back to a single query.
+    """
+    matches = _query_namespace(pinecone_index, id_to_check, 1, include_values=False)
+    if not matches:
+        return []
+    chunk_count = matches[0]["metadata"].get("chunk_count")
+    if chunk_count is None:
+        return [
+            {"embedding": m["values"], "metadata": m["metadata"]}
+            for m in _query_namespace(pinecone_index, id_to_check, 1000, include_values=True)
+        ]
 
-    vectors_to_upsert = []
+    ids = [f"{id_to_check}-{i}" for i in range(int(chunk_count))]
     embeddings = []
-
-    for i, emb_vector in enumerate(embeddings_list):
-        metadata = {
-            "text": chunks[i],
-            "version": DATA_PROCESSING_VERSION
-        }
-
-        vectors_to_upsert.append((
-            f"{index_id}-{i}",
-            emb_vector, 
-            metadata
-        ))
-
-        # For the return value
-        embeddings.append({
-            "embedding": emb_vector, 
-            "metadata": metadata
-        })
-
-    pinecone_index.upsert(
-        vectors=vectors_to_upsert,
-        namespace=index_id
-    )
+    for start in range(0, len(ids), FETCH_BATCH_SIZE):
+        batch = ids[start:start + FETCH_BATCH_SIZE]
+        with stage("vector_fetch"):
+            vectors = pinecone_index.fetch(ids=batch, namespace=id_to_check).vectors
+        for vector_id in batch:
+            vector = vectors.get(vector_id)
+            if vector is not None:
+                embeddings.append({"embedding": list(vector.values), "metadata": dict(vector.metadata or {})})
     return embeddings
 
-def create_embeddings(chunks,index_id, pinecone_index):
-    embeddings = store_embeddings(chunks, index_id, pinecone_index)
-    return embeddings
+def _upsert_batch(pinecone_index, index_id: str, batch: list):
+    with stage("vector_upsert"):
+        pinecone_index.upsert(vectors=batch, namespace=index_id)
 
-def search_relevant_chunks(questions, embeddings: list, top_k: int = 3):
+def upsert_to_namespace(pinecone_index, index_id: str, vectors: list, metadatas: list):
     """
-    Given one or more questions and pre-computed embeddings,
-    returns the top_k relevant chunks for each question using Gemini embeddings.
+    Upserts the vectors in UPSERT_BATCH_SIZE batches, sent concurrently.
+    Vector ids are the chunk's position in the document, and the document id
+    is a content hash, so retrying a failed upsert overwrites rather than
+    duplicates whatever made it in the first time.
     """
-    if not embeddings:
-        raise ValueError("No embeddings were provided to search_relevant_chunks.")
+    vectors_to_upsert = [
+        (f"{index_id}-{i}", list(map(float, emb_vector)), metadata)
+        for i, (emb_vector, metadata) in enumerate(zip(vectors, metadatas))
+    ]
+    futures = [
+        submit_blocking(
+            call_with_retry, _upsert_batch, pinecone_index, index_id,
+            vectors_to_upsert[start:start + UPSERT_BATCH_SIZE],
+            retries=STORE_MAX_RETRIES, backoff_base=STORE_BACKOFF_BASE,
+            limiter=upsert_rate_limiter
+        )
+        for start in range(0, len(vectors_to_upsert), UPSERT_BATCH_SIZE)
+    ]
+    for future in futures:
+        future.result()
+
+def _embed_documents(chunks: list) -> list:
+    with stage("embed_request"):
+        response = get_genai().embed_content(
+            model=EMBEDDING_MODEL,
+            content=chunks,
+            task_type="RETRIEVAL_DOCUMENT",
+            output_dimensionality=EMBEDDING_DIM
+        )
+    return response['embedding']
 
-    # Ensure questions is a list
-    if isinstance(questions, str):
-        questions = [questions]
+def embed_chunks(chunks: list) -> list:
+    """
+    Returns a document embedding per chunk. Only chunks we haven't embedded
+    before go to the embedding API, in EMBED_BATCH_SIZE batches. Each batch is
+    cached as soon as it comes back, so if a later batch fails, a retry of the
+    document only re-embeds what's still missing.
+    """
+    embeddings_list = get_cached_embeddings(chunks, EMBEDDING_MODEL, EMBEDDING_DIM)
+    missing = [i for i, emb_vector in enumerate(embeddings_list) if emb_vector is None]
+
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        batch_chunks = [chunks[i] for i in batch]
+        batch_vectors = call_with_retry(
+            _embed_documents, batch_chunks,
+            retries=STORE_MAX_RETRIES, backoff_base=STORE_BACKOFF_BASE,
+            limiter=embed_rate_limiter
+        )
+        for i, emb_vector in zip(batch, batch_vectors):
+            embeddings_list[i] = emb_vector
+        put_cached_embeddings(batch_chunks, batch_vectors, EMBEDDING_MODEL, EMBEDDING_DIM)
 
-    # Precompute chunk vectors once
-    chunk_vectors = np.array([np.array(item["embedding"]) for item in embeddings])
+    return embeddings_list
 
-    results_all = {}
+def embed_questions(questions: list) -> list:
     """
-    for question in questions:
-        # Generate embedding for the question using Gemini
-        query_response = genai.embed_content(
-            model="models/text-embedding-004", # models/text-embedding-004
-            content=[question],
+    Returns a query embedding per question. Embeddings are memoized by the
+    normalized question text, so only unseen questions go to the API.
+    """
+    keys = [(EMBEDDING_MODEL, EMBEDDING_DIM, normalize_question(q)) for q in questions]
+    vectors = [query_embedding_cache.get(key) for key in keys]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+    if missing:
+        query_response = get_genai().embed_content(
+            model=EMBEDDING_MODEL,
+            content=[questions[i] for i in missing],
             task_type="RETRIEVAL_QUERY",
-            output_dimensionality=768
+            output_dimensionality=EMBEDDING_DIM
         )
-        # Extract the embedding vector
-        query_embedding = np.array(
-            query_response['embedding']
-        ).reshape(1, -1)
-
-        # Compute cosine similarity
-        similarity_scores = cosine_similarity(query_embedding, chunk_vectors)[0]
+        for i, vector in zip(missing, query_response['embedding']):
+            vectors[i] = vector
+            query_embedding_cache.set(keys[i], vector)
 
-        # Sort indices in descending order of similarity
-        ranked_indices = np.argsort(similarity_scores)[::-1][:top_k]
+    return vectors
 
-        # Collect top matches with their similarity score
-        results = [(similarity_scores[i], embeddings[i]) for i in ranked_indices]
-
-        results_all[question] = results
+def search_relevant_chunks(questions, doc_index, top_k: int = 3, timings: dict = None):
     """
-    query_response = genai.embed_content(
-        model="models/text-embedding-004",  # <--- UPGRADED MODEL
-        content=questions,
-        task_type="RETRIEVAL_QUERY",
-        output_dimensionality=768 # Optional: specify dimension for text-embedding-004
-    )
+    Given one or more questions and a document's DocumentIndex,
+    returns the top_k relevant chunks for each question using Gemini embeddings,
+    fused with BM25 keyword scores unless RETRIEVAL_MODE is "dense".
+    Query embedding and vector search times go into timings, if given.
+    """
+    if doc_index is None or not len(doc_index):
+        raise ValueError("No embeddings were provided to search_relevant_chunks.")
 
-    query_embeddings = np.array(query_response['embedding'])
-    similarity_matrix = cosine_similarity(query_embeddings, chunk_vectors)
+    # Ensure questions is a list
+    if isinstance(questions, str):
+        questions = [questions]
+
+    with stage("embed_query", timings):
+        query_embeddings = embed_questions(questions)
+    with stage("vector_query", timings):
+        if RETRIEVAL_MODE == "hybrid":
+            scores, indices, dense_scores, lexical_scores = doc_index.hybrid_search(query_embeddings, questions, top_k)
+        else:
+            scores, indices = doc_index.search(query_embeddings, top_k)
+            dense_scores, lexical_scores = scores, None
 
     results_all = {}
 
     for i, question in enumerate(questions):
-        # Get all scores for the current question from the matrix
-        similarity_scores = similarity_matrix[i]
-
-        # Get the indices of the top_k scores
-        ranked_indices = np.argsort(similarity_scores)[::-1][:top_k]
-
-        # Use a list comprehension for clean and efficient result formatting
-        results_all[question] = [
-            {
-                "score": similarity_scores[index],
-                "metadata": embeddings[index]["metadata"]
+        matches = []
+        for j, index in enumerate(indices[i]):
+            match = {
+                "score": float(scores[i][j]),
+                "dense_score": float(dense_scores[i][j]),
+                "index": int(index),
+                "metadata": doc_index.metadatas[index]
             }
-            for index in ranked_indices
-        ]
+            if lexical_scores is not None:
+                match["lexical_score"] = float(lexical_scores[i][j])
+            matches.append(match)
+        results_all[question] = matches
 
     return results_all
 
-def generate_answer_with_groq(question: str, top_matches_all: dict, top_k: int = 3):
-
-    # search_relevant_chunks returns a dict {question: [(score, {embedding, metadata})]}
-    top_matches = top_matches_all[question][:top_k]
-
-    # 2. Build context string from metadata["text"]
-    context = "\n\n".join([
-        match_item["metadata"]["text"] for _, match_item in top_matches
-    ])
-
-    # 3. Construct prompt
-    prompt = f"""Answer clearly and concisely using only the information from the provided document, in one short paragraph.
-    If there are minor typos or formatting errors in the document, correct them when forming the answer.
-    If the answer is not found in the document, reply with "I don't know" and briefly explain why it might be missing.
-    Do not use external knowledge and keep the response strictly based on the given text.
-
-
-        Context:
-        {context}
-
-        Question:
-        {question}
-    """
-
-    # 4. Call Groq's chat completion
-    chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        model="gemma2-9b-it",
-    )
-
-    # 5. Return the answer text
-    return chat_completion.choices[0].message.content.strip()
-
-def generate_answer_with_gemini(question: str, top_matches_all: dict, top_k: int = 3):
-    
-    # 1. Select the top k matching text snippets for context
-    # This part of the logic remains the same.
-
+def build_context(matches: list, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
     """
-    if question not in top_matches_all or not top_matches_all[question]:
-        return "I don't have any context to answer this question."
+    Packs the retrieved chunks for one LLM call (see assemble_context) and
+    records the context size before and after packing.
     """
+    context, stats = assemble_context(matches, token_budget)
+    CONTEXT_TOKENS.observe(stats["raw_tokens"], kind="raw")
+    CONTEXT_TOKENS.observe(stats["tokens"], kind="packed")
+    return context
 
-    top_matches = top_matches_all[question][:top_k]
-
-    context = "\n\n".join([
-        # match_item["metadata"]["text"] for _, match_item in top_matches
-        match_item["metadata"]["text"] for match_item in top_matches
-    ])
-
-    # 2. Construct the prompt for the Gemini model
-    # The prompt structure is clear and works well with Gemini.
-    prompt = f"""
+ANSWER_PROMPT = """
     You are an expert Question & Answer assistant giving human like response. Your task is to answer the user's question based ONLY on the provided context.
 
     **Do not use any of your own internal knowledge.**
@@ -233,11 +261,108 @@ def generate_answer_with_gemini(question: str, top_matches_all: dict, top_k: int
     {question}
     """
 
-    # 3. Initialize the Gemini model
-    model = genai.GenerativeModel("gemini-1.5-flash-8b-latest") # gemini-1.5-flash-8b-latest # gemini-2.5-flash-lite
+def build_answer_prompt(question: str, top_matches_all: dict, top_k: int = 3) -> str:
+    # search_relevant_chunks returns a dict {question: [{score, metadata}, ...]}
+    top_matches = top_matches_all[question][:top_k]
+    return ANSWER_PROMPT.format(context=build_context(top_matches), question=question)
+
+async def generate_answer(question: str, top_matches_all: dict, top_k: int = 3) -> str:
+    """
+    Answers one question through the LLM router, which picks the provider
+    and hedges to the fallback when the primary is slow.
+    """
+    prompt = build_answer_prompt(question, top_matches_all, top_k)
+    return (await llm_router.complete(prompt)).strip()
+
+# --- Batched multi-question prompting ---
 
-    # 4. Generate the content using the Gemini API
-    response = model.generate_content(prompt)
+BATCH_PROMPT_INSTRUCTIONS = """
+    You are an expert Question & Answer assistant giving human like responses. Answer each of the numbered questions below based ONLY on the provided context.
 
-    # 5. Return the cleaned-up response text
-    return response.text.strip()
\ No newline at end of file
+    **Do not use any of your own internal knowledge.**
+
+    **Follow these instructions precisely:**
+    1. Read the context passages below carefully.
+    2. Answer each question clearly and concisely using only the information from the provided document, in one short paragraph.
+    3. If the answer to a question cannot be found in the context, answer it with: "I'm sorry, but I cannot answer this question based on the information provided."
+    4. Respond with ONLY a JSON array, one object per question, in the form:
+       [{"id": 1, "answer": "..."}, {"id": 2, "answer": "..."}]
+    """
+
+
+def build_batch_prompt(questions: list, top_matches_all: dict, top_k: int = 3):
+    """
+    Packs several questions and the union of their top_k contexts into one prompt.
+    The context is assembled once for the whole batch, so chunks retrieved by
+    more than one question are only included once. Each question brings its own
+    CONTEXT_TOKEN_BUDGET, so a batch has as much room as the separate calls would.
+
+    Returns:
+        A tuple of (prompt, tokens_saved), where tokens_saved estimates how many
+        prompt tokens this saves over asking each question separately.
+    """
+    # The prompts the single path would send (see build_answer_prompt). Packed
+    # with assemble_context directly, so CONTEXT_TOKENS only sees real prompts
+    single_prompt_tokens = 0
+    for question in questions:
+        context, _ = assemble_context(top_matches_all[question][:top_k])
+        single_prompt_tokens += estimate_tokens(ANSWER_PROMPT.format(context=context, question=question))
+
+    # Interleaved by rank, so every question's best chunk is kept ahead of
+    # anyone's second best if the token budget runs out
+    matches = [
+        top_matches_all[question][rank]
+        for rank in range(top_k)
+        for question in questions
+        if rank < len(top_matches_all[question])
+    ]
+    context = build_context(matches, CONTEXT_TOKEN_BUDGET * len(questions))
+    numbered_questions = "\n".join(f"{i+1}. {q}" for i, q in enumerate(questions))
+
+    prompt = f"""{BATCH_PROMPT_INSTRUCTIONS}
+    Context:
+    {context}
+
+    Questions:
+    {numbered_questions}
+    """
+    return prompt, single_prompt_tokens - estimate_tokens(prompt)
+
+
+def parse_batch_answers(response_text: str, num_questions: int) -> list:
+    """
+    Maps the model's JSON array back to the questions, in order. Any answer that
+    is missing or malformed comes back as None so the caller can retry it alone.
+    """
+    answers = [None] * num_questions
+
+    # Models often wrap JSON in a ```json fence or add a sentence around it
+    match = re.search(r"\[.*\]", response_text, flags=re.DOTALL)
+    if not match:
+        return answers
+    try:
+        items = json.loads(match.group(0))
+    except ValueError:
+        return answers
+    if not isinstance(items, list):
+        return answers
+
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        idx, answer = item.get("id"), item.get("answer")
+        if isinstance(idx, int) and 1 <= idx <= num_questions and isinstance(answer, str) and answer.strip():
+            answers[idx - 1] = answer.strip()
+    return answers
+
+
+async def generate_batch_answers(questions: list, top_matches_all: dict, top_k: int = 3):
+    """
+    Answers several questions with a single call through the LLM router.
+
+    Returns:
+        A tuple of (answers, tokens_saved). Unparseable answers are None.
+    """
+    prompt, tokens_saved = build_batch_prompt(questions, top_matches_all, top_k)
+    response_text = await llm_router.complete(prompt, json_output=True, call="batch")
+    return parse_batch_answers(response_text, len(questions)), tokens_saved
@@ -0,0 +1,68 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking network SDK calls (Gemini, Pinecone, Groq, Postgres) spend most of
+# their time waiting, so they get a wider pool than the CPU-bound stages.
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+# Embedding and upsert batches fanned out from inside ingestion get a pool of
+# their own. Their callers block on them while running on the I/O pool, so
+# sharing that pool would let enough concurrent ingestions fill every thread
+# with waiters and leave none to run the batches.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "32"))
+
+_POOL_SIZES = {"io": IO_WORKERS, "cpu": CPU_WORKERS, "batch": BATCH_WORKERS}
+
+# Pools are created on first use and dropped by shutdown_executors, so the
+# app can be started again in the same process (e.g. a second lifespan)
+_executors = {}
+_lock = threading.Lock()
+
+
+def _get_executor(kind: str) -> ThreadPoolExecutor:
+    executor = _executors.get(kind)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(kind)
+            if executor is None:
+                executor = _executors[kind] = ThreadPoolExecutor(
+                    max_workers=_POOL_SIZES[kind], thread_name_prefix=f"hackrx-{kind}"
+                )
+    return executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking I/O call (e.g. an SDK request) without stalling the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor("io"), functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """
+    Runs a CPU-heavy stage (extraction, chunking) on the bounded CPU pool, so a
+    burst of large documents can't starve the I/O pool or the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor("cpu"), functools.partial(func, *args, **kwargs))
+
+
+def submit_blocking(func, *args, **kwargs):
+    """
+    Submits a blocking I/O call from synchronous code (e.g. a worker thread)
+    to the batch pool and returns a concurrent.futures.Future. The call must
+    not itself wait on work in any of these pools.
+    """
+    return _get_executor("batch").submit(func, *args, **kwargs)
+
+
+def shutdown_executors():
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,351 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager, ExitStack
+
+from app.utils.text_extraction import open_pdf_pages
+from app.utils.data_processing import iter_document_chunks, DATA_PROCESSING_VERSION
+from app.utils.embeddings import embed_chunks, EMBED_BATCH_SIZE
+from app.utils.executors import submit_blocking, run_blocking, run_cpu_bound
+from app.utils.validators import validate_document_url, download_document
+from app.utils.document_cache import (hash_file, make_document_id, get_url_entry, record_url_entry,
+                                     file_lock)
+from app.utils.vector_store import get_vector_store
+from app.utils.text_cache import (get_cached_pages, iter_caching_pages, get_cached_chunks, put_cached_chunks,
+                                  TEXT_CACHE_ENABLED)
+from app.utils.metrics import (stage, observe_stage, timed_iter,
+                               DOCUMENT_BYTES, DOCUMENT_PAGES, DOCUMENT_CHUNKS)
+
+logger = logging.getLogger(__name__)
+
+# Documents ingested at once by /hackrx/ingest and the CLI
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+
+
+def chunk_metadata(chunk: str, page_start, page_end, position: int) -> dict:
+    # "chunk" is the chunk's position in the document, used to put retrieved
+    # chunks back in reading order (Pinecone returns them by score)
+    metadata = {"text": chunk, "version": DATA_PROCESSING_VERSION, "chunk": position}
+    # Pinecone rejects null metadata values, so only add pages we know
+    if page_start is not None:
+        metadata["page_start"] = page_start
+        metadata["page_end"] = page_end
+    return metadata
+
+
+@contextmanager
+def open_document_chunks(source, file_id: str, content_digest: str = None, elapsed: dict = None):
+    """
+    Yields (page_count, chunks, cache), where chunks produces (chunk,
+    page_start, page_end) and cache says which layer of the text cache they
+    came from: "chunks", "text" (re-chunked from cached page texts) or
+    "miss" (the PDF was parsed, and its pages and chunks are cached for next
+    time). Without a content_digest only the chunk layer is used. Time spent
+    waiting on pages is added to elapsed["extract"].
+    """
+    elapsed = elapsed if elapsed is not None else {}
+    cached = get_cached_chunks(file_id) if TEXT_CACHE_ENABLED else None
+    if cached is not None:
+        page_count, chunks = cached
+        yield page_count, iter(chunks), "chunks"
+        return
+
+    with ExitStack() as stack:
+        pages = get_cached_pages(content_digest) if TEXT_CACHE_ENABLED and content_digest else None
+        if pages is not None:
+            page_count, cache = len(pages), "text"
+            page_iter = enumerate(pages, start=1)
+        else:
+            cache = "miss"
+            page_count, page_iter = stack.enter_context(open_pdf_pages(source))
+            if TEXT_CACHE_ENABLED and content_digest:
+                page_iter = iter_caching_pages(page_iter, content_digest)
+                # Drops the half-written cache file if chunking fails part way
+                stack.callback(page_iter.close)
+
+        produced = []
+
+        def chunks():
+            for chunk in iter_document_chunks(timed_iter(page_iter, elapsed, "extract"), page_count):
+                produced.append(chunk)
+                yield chunk
+            if TEXT_CACHE_ENABLED:
+                put_cached_chunks(file_id, page_count, produced)
+
+        yield page_count, chunks(), cache
+
+
+def chunk_document(source, file_id: str, stats: dict = None, content_digest: str = None):
+    """
+    The CPU-bound half of ingestion. Streams a PDF (a file path or an
+    in-memory buffer) through extraction, cleaning, sentence splitting and
+    chunking, dispatching embedding batches to the I/O pool as chunks are
+    produced. Pages and chunks come from the text cache when it has them
+    (content_digest, the SHA-256 of the PDF, keys the page layer).
+
+    Returns:
+        (page_count, cache, metadatas, futures), where futures are the
+        pending embedding batches in chunk order.
+    """
+    # Embedding batches are sent as soon as they fill up, while later pages
+    # are still being parsed
+    futures = []
+    metadatas = []
+    batch = []
+    # Extraction and chunking are interleaved, so time spent waiting on the
+    # page iterator is extraction and the rest of the loop is chunking
+    elapsed = {"extract": 0}
+
+    loop_start = time.perf_counter_ns()
+    with open_document_chunks(source, file_id, content_digest, elapsed) as (page_count, chunks, cache):
+        for chunk, page_start, page_end in chunks:
+            metadatas.append(chunk_metadata(chunk, page_start, page_end, len(metadatas)))
+            batch.append(chunk)
+            if len(batch) >= EMBED_BATCH_SIZE:
+                futures.append(submit_blocking(embed_chunks, batch))
+                batch = []
+
+    if batch:
+        futures.append(submit_blocking(embed_chunks, batch))
+    loop_ns = time.perf_counter_ns() - loop_start
+
+    stage_timings = stats if stats is not None else {}
+    observe_stage("extract", elapsed["extract"], stage_timings, "extract_ms")
+    observe_stage("chunk", loop_ns - elapsed["extract"], stage_timings, "chunk_ms")
+    return page_count, cache, metadatas, futures
+
+
+# The entries store_document adds to a stats dict that aren't durations
+INGEST_STAT_KEYS = ("pages", "chunks", "text_cache")
+
+
+def store_document(file_id: str, vector_store, page_count: int, cache: str, metadatas: list, futures: list,
+                   stats: dict = None):
+    """
+    The I/O-bound half of ingestion: waits for the embedding batches that
+    chunk_document dispatched and stores the vectors under file_id. If a
+    stats dict is given, the page and chunk counts, the cache layer used and
+    the time (ms) spent in each stage are recorded in it.
+
+    Returns:
+        The document's DocumentIndex.
+    """
+    stage_timings = stats if stats is not None else {}
+    # Only the embedding time not already hidden behind parsing
+    with stage("embed_wait", stage_timings, "embed_wait_ms"):
+        vectors = [vector for future in futures for vector in future.result()]
+    logger.info(f"Ingested {page_count} pages into {len(vectors)} chunks for {file_id} (text cache: {cache})")
+    DOCUMENT_PAGES.observe(page_count)
+    DOCUMENT_CHUNKS.observe(len(vectors))
+    if stats is not None:
+        stats["pages"] = page_count
+        stats["chunks"] = len(vectors)
+        stats["text_cache"] = cache
+    with stage("vector_store_put", stage_timings, "store_ms"):
+        return vector_store.put(file_id, vectors, metadatas)
+
+
+async def ingest_pdf_once(source, file_id: str, vector_store, stats: dict = None, content_digest: str = None):
+    """
+    Ingests a PDF, serialized across worker processes: whoever gets the
+    document's lock first ingests it, and the rest find it stored when their
+    turn comes.
+
+    Only chunk_document runs on the CPU pool. Waiting for the lock, the
+    embeddings and the vector store happens on the I/O pool, so a worker
+    with a single CPU thread (see gunicorn.conf.py) keeps parsing other
+    documents meanwhile.
+    """
+    with ExitStack() as stack:
+        await run_blocking(stack.enter_context, file_lock(f"ingest-{file_id}"))
+        doc_index = await run_blocking(vector_store.get, file_id)
+        if doc_index is not None:
+            logger.info(f"{file_id} was ingested by another worker while we waited.")
+            return doc_index
+        chunked = await run_cpu_bound(chunk_document, source, file_id, stats, content_digest)
+        return await run_blocking(store_document, file_id, vector_store, *chunked, stats)
+
+
+# Ingestions running in this process, by file_id
+_inflight = {}
+
+
+async def ingest_document(source, file_id: str, vector_store, stats: dict = None, content_digest: str = None):
+    """
+    Ingests a document unless it's already being ingested, in which case this
+    waits for that ingestion and shares its result. Only the caller that
+    started the ingestion gets stats filled in.
+    """
+    task = _inflight.get(file_id)
+    if task is None:
+        task = asyncio.ensure_future(ingest_pdf_once(source, file_id, vector_store, stats, content_digest))
+        _inflight[file_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(file_id, None))
+    else:
+        logger.info(f"{file_id} is already being ingested; waiting for it.")
+    # Shielded so one cancelled request doesn't cancel the others' ingestion
+    return await asyncio.shield(task)
+
+
+async def identify_document(validated_url: str, document) -> str:
+    """
+    Turns a downloaded document's content hash into its File ID and remembers
+    the URL's ETag/Last-Modified so the next request for it can be revalidated.
+    """
+    file_id = make_document_id(document.sha256)
+    logger.info(f"Computed File ID: {file_id}")
+    await run_blocking(
+        record_url_entry,
+        validated_url, document.sha256, document.file_extension,
+        etag=document.validators.get("etag"),
+        last_modified=document.validators.get("last_modified")
+    )
+    return file_id
+
+
+async def fetch_document(validated_url: str, timings: dict):
+    """
+    Downloads a document and works out its File ID.
+
+    If we've seen this URL before, it's revalidated instead of downloaded again.
+    A 304 means the document is unchanged, so its File ID is rebuilt from the
+    cached content digest (picking up any processing version change) and
+    nothing is downloaded.
+
+    Returns:
+        A tuple of (file_id, file_extension, document). document is a
+        DownloadedDocument the caller must close, or None when the cached
+        copy was still current.
+    """
+    with stage("download", timings, "download_file"):
+        cached_entry = await run_blocking(get_url_entry, validated_url)
+        if cached_entry:
+            document = await download_document(
+                validated_url,
+                etag=cached_entry.get("etag"),
+                last_modified=cached_entry.get("last_modified")
+            )
+            if document is None:
+                file_id = make_document_id(cached_entry["content_digest"])
+                logger.info(f"Document not modified since last request; File ID: {file_id}")
+                return file_id, cached_entry["file_extension"], None
+        else:
+            document = await download_document(validated_url)
+
+    DOCUMENT_BYTES.observe(document.size)
+    file_id = await identify_document(validated_url, document)
+    return file_id, document.file_extension, document
+
+
+async def ingest_source(source: str, allow_local_paths: bool = False) -> dict:
+    """
+    Makes sure one document is embedded and stored. Sources are URLs; local
+    PDF paths are only accepted when allow_local_paths is set (the CLI), never
+    from the API.
+
+    Returns:
+        A summary with the document's file_id, whether it was already stored,
+        and per-stage timings in seconds.
+    """
+    timings = {}
+    summary = {"source": source}
+    document = None
+    vector_store = get_vector_store()
+
+    try:
+        if allow_local_paths and os.path.isfile(source):
+            pdf_source = source
+            start_time = time.perf_counter()
+            content_digest = await run_cpu_bound(hash_file, pdf_source)
+            file_id = make_document_id(content_digest)
+            timings["hash_document"] = round(time.perf_counter() - start_time, 3)
+            revalidated = False
+        else:
+            validated_url = validate_document_url(source)
+            start_time = time.perf_counter()
+            file_id, _, document = await fetch_document(validated_url, {})
+            timings["download_file"] = round(time.perf_counter() - start_time, 3)
+            revalidated = document is None
+            if document is not None:
+                summary["bytes"] = document.size
+
+        summary["file_id"] = file_id
+        if await run_blocking(vector_store.get, file_id) is not None:
+            summary["status"] = "cached"
+            return {**summary, "timings": timings}
+
+        if revalidated:
+            # Revalidated, but the vectors are gone; fetch the body after all.
+            # Its content decides the File ID, as in fetch_document
+            document = await download_document(validated_url)
+            summary["bytes"] = document.size
+            file_id = await identify_document(validated_url, document)
+            summary["file_id"] = file_id
+            if await run_blocking(vector_store.get, file_id) is not None:
+                summary["status"] = "cached"
+                return {**summary, "timings": timings}
+        if document is not None:
+            pdf_source = document.source()
+            content_digest = document.sha256
+
+        start_time = time.perf_counter()
+        await ingest_document(pdf_source, file_id, vector_store, summary, content_digest)
+        timings["ingest_document"] = round(time.perf_counter() - start_time, 3)
+        summary["status"] = "ingested"
+        return {**summary, "timings": timings}
+
+    except Exception as e:
+        logger.error(f"Failed to ingest {source}: {e}")
+        detail = getattr(e, "detail", None) or str(e)
+        return {**summary, "status": "failed", "error": detail, "timings": timings}
+
+    finally:
+        if document is not None:
+            document.close()
+
+
+async def ingest_many(sources: list, concurrency: int = INGEST_CONCURRENCY, allow_local_paths: bool = False) -> dict:
+    """
+    Ingests documents concurrently, at most `concurrency` at a time, logging
+    progress as each one finishes.
+
+    Returns:
+        The per-document summaries (in input order) plus overall throughput.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+    start_time = time.perf_counter()
+
+    async def run_one(source):
+        nonlocal done
+        async with semaphore:
+            result = await ingest_source(source, allow_local_paths)
+        done += 1
+        logger.info(f"[{done}/{len(sources)}] {result['status']}: {source}")
+        return result
+
+    results = await asyncio.gather(*(run_one(source) for source in sources))
+    elapsed = time.perf_counter() - start_time
+
+    ingested = [r for r in results if r["status"] == "ingested"]
+    pages = sum(r.get("pages", 0) for r in ingested)
+    chunks = sum(r.get("chunks", 0) for r in ingested)
+    download_bytes = sum(r.get("bytes", 0) for r in results)
+    download_time = sum(r["timings"].get("download_file", 0) for r in results)
+    ingest_time = sum(r["timings"].get("ingest_document", 0) for r in ingested)
+
+    return {
+        "results": list(results),
+        "summary": {
+            "documents": len(results),
+            "ingested": len(ingested),
+            "cached": sum(1 for r in results if r["status"] == "cached"),
+            "failed": sum(1 for r in results if r["status"] == "failed"),
+            "elapsed_seconds": round(elapsed, 3),
+            "documents_per_second": round(len(results) / elapsed, 3) if elapsed else None,
+            "download_mb_per_second": round(download_bytes / 1e6 / download_time, 3) if download_time else None,
+            "pages_per_second": round(pages / ingest_time, 3) if ingest_time else None,
+            "chunks_per_second": round(chunks / ingest_time, 3) if ingest_time else None,
+        },
+    }
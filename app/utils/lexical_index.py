@@ -0,0 +1,130 @@
+import os
+import re
+import math
+
+import numpy as np
+
+# --- BM25 settings ---
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Bump when tokenization or the stored layout changes, so old indexes are rebuilt
+LEXICAL_INDEX_VERSION = "l1"
+
+# Keeps section numbers ("4.2", "3.1.14") and hyphenated terms ("co-payment")
+# together as single tokens
+TOKEN_RE = re.compile(r"[^\W_]+(?:[.\-/][^\W_]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it its of on or "
+    "the this that to under was what when where which who will with".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased word tokens with stopwords removed. A hyphenated or slashed
+    token such as "co-payment" is kept whole and also split into its parts,
+    so it still matches text that writes "co payment".
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(text.casefold()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "-" in token or "/" in token:
+            tokens.extend(part for part in re.split(r"[\-/]", token) if part and part not in STOPWORDS)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    A per-document BM25 inverted index, stored as compressed sparse postings:
+    the chunks containing term t are doc_ids[indptr[t]:indptr[t + 1]], with
+    their precomputed BM25 term-frequency weights in the same slice of weights.
+    """
+
+    def __init__(self, terms, idf, indptr, doc_ids, weights, num_chunks: int):
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+        self.idf = idf
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_chunks = num_chunks
+
+    @classmethod
+    def build(cls, texts: list, k1: float = BM25_K1, b: float = BM25_B):
+        postings = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for chunk_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[chunk_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((chunk_id, tf))
+
+        terms = sorted(postings)
+        avg_length = float(lengths.mean()) if len(texts) and lengths.mean() > 0 else 1.0
+        num_chunks = len(texts)
+
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        idf = np.zeros(len(terms), dtype=np.float32)
+        doc_ids = []
+        tfs = []
+        for t, term in enumerate(terms):
+            entries = postings[term]
+            indptr[t + 1] = indptr[t] + len(entries)
+            idf[t] = math.log(1 + (num_chunks - len(entries) + 0.5) / (len(entries) + 0.5))
+            for chunk_id, tf in entries:
+                doc_ids.append(chunk_id)
+                tfs.append(tf)
+
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        norm = k1 * (1 - b + b * lengths[doc_ids] / avg_length)
+        weights = (tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+        return cls(np.asarray(terms, dtype=str), idf, indptr, doc_ids, weights, num_chunks)
+
+    def save(self, path: str):
+        np.savez(
+            path, version=np.asarray(LEXICAL_INDEX_VERSION), params=np.asarray([BM25_K1, BM25_B]),
+            terms=self.terms, idf=self.idf, indptr=self.indptr, doc_ids=self.doc_ids,
+            weights=self.weights, num_chunks=np.asarray(self.num_chunks)
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """Returns the saved index, or None if it's missing or was built with other settings."""
+        try:
+            with np.load(path) as data:
+                if str(data["version"]) != LEXICAL_INDEX_VERSION or list(data["params"]) != [BM25_K1, BM25_B]:
+                    return None
+                return cls(data["terms"], data["idf"], data["indptr"], data["doc_ids"],
+                           data["weights"], int(data["num_chunks"]))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def score(self, queries: list) -> np.ndarray:
+        """
+        BM25 scores for every query against every chunk, as a
+        (num_queries, num_chunks) matrix. All postings for the batch are
+        gathered at once and summed with a single bincount.
+        """
+        rows, cols, values = [], [], []
+        for q, query in enumerate(queries):
+            for token in set(tokenize(query)):
+                t = self.vocabulary.get(token)
+                if t is None:
+                    continue
+                start, stop = self.indptr[t], self.indptr[t + 1]
+                rows.append(np.full(stop - start, q, dtype=np.int64))
+                cols.append(self.doc_ids[start:stop])
+                values.append(self.weights[start:stop] * self.idf[t])
+
+        size = len(queries) * self.num_chunks
+        if not rows:
+            return np.zeros((len(queries), self.num_chunks), dtype=np.float32)
+        flat = np.concatenate(rows) * self.num_chunks + np.concatenate(cols)
+        scores = np.bincount(flat, weights=np.concatenate(values), minlength=size)
+        return scores.reshape(len(queries), self.num_chunks).astype(np.float32)
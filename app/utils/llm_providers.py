@@ -0,0 +1,279 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+
+from app.utils.executors import run_blocking
+from app.utils.rate_limit import LoopLocalSemaphore
+from app.utils.context_assembly import estimate_tokens
+from app.utils.metrics import observe_stage, PROMPT_TOKENS
+from app.utils.clients import get_genai, get_groq_client
+
+logger = logging.getLogger(__name__)
+
+# --- LLM providers ---
+# Answers go to LLM_PRIMARY_PROVIDER. If it hasn't produced its first token
+# within LLM_HEDGE_AFTER_MS, the same prompt is also sent to
+# LLM_FALLBACK_PROVIDER and whichever answers first wins. A primary that fails
+# outright falls back immediately. With LLM_ROUTING=latency the provider with
+# the lower recent latency is tried first instead.
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-8b-latest")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "gemma2-9b-it")
+LLM_PRIMARY_PROVIDER = os.getenv("LLM_PRIMARY_PROVIDER", "gemini")
+LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER", "groq" if os.getenv("GROQ_API_KEY") else "")
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "3000"))
+LLM_ROUTING = os.getenv("LLM_ROUTING", "fixed")
+# Calls each provider may have in flight at once, across all requests
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "16"))
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", "8"))
+# Weight of the newest call in each provider's moving-average latency
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class LLMProvider:
+    """
+    One LLM backend. Subclasses implement stream(); the client behind it is
+    created once and reused for every call.
+    """
+
+    name = "base"
+
+    def __init__(self, concurrency: int):
+        self.semaphore = LoopLocalSemaphore(concurrency)
+        self.latency_ewma = None
+        self._lock = threading.Lock()
+
+    def stream(self, prompt: str, json_output: bool = False):
+        """
+        Yields the response text in pieces as they arrive. The generator's
+        return value is the provider's usage object (or None).
+        """
+        raise NotImplementedError
+
+    def complete(self, prompt: str, json_output: bool = False, call: str = "single", on_first_token=None) -> str:
+        """
+        Runs a whole call (blocking) and returns the response text. Records
+        the prompt tokens and updates the provider's latency average.
+        """
+        start = time.perf_counter_ns()
+        parts = []
+        stream = self.stream(prompt, json_output)
+        while True:
+            try:
+                part = next(stream)
+            except StopIteration as stop:
+                usage = stop.value
+                break
+            if not parts and on_first_token is not None:
+                on_first_token()
+            parts.append(part)
+
+        elapsed_ns = time.perf_counter_ns() - start
+        observe_stage(f"llm_{self.name}", elapsed_ns)
+        with self._lock:
+            seconds = elapsed_ns / 1e9
+            self.latency_ewma = seconds if self.latency_ewma is None else \
+                LATENCY_EWMA_ALPHA * seconds + (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma
+        _record_prompt_tokens(self.name, call, prompt, usage)
+        return "".join(parts)
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL, concurrency: int = GEMINI_CONCURRENCY):
+        super().__init__(concurrency)
+        self.model_name = model_name
+        self._model = None
+
+    def _get_model(self):
+        if self._model is None:
+            self._model = get_genai().GenerativeModel(self.model_name)
+        return self._model
+
+    def stream(self, prompt: str, json_output: bool = False):
+        generation_config = {"response_mime_type": "application/json"} if json_output else None
+        response = self._get_model().generate_content(prompt, generation_config=generation_config, stream=True)
+        usage = None
+        for chunk in response:
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            text = _gemini_chunk_text(chunk)
+            if text:
+                yield text
+        return usage
+
+
+def _gemini_chunk_text(chunk) -> str:
+    # chunk.text raises ValueError when a chunk carries no parts (the final
+    # finish-reason chunk, a safety block, MAX_TOKENS), so read the parts directly
+    candidates = getattr(chunk, "candidates", None)
+    if not candidates or not candidates[0].content:
+        return ""
+    return "".join(part.text for part in candidates[0].content.parts if getattr(part, "text", ""))
+
+
+class GroqProvider(LLMProvider):
+    name = "groq"
+
+    def __init__(self, model_name: str = GROQ_MODEL, concurrency: int = GROQ_CONCURRENCY):
+        super().__init__(concurrency)
+        self.model_name = model_name
+
+    def stream(self, prompt: str, json_output: bool = False):
+        response = get_groq_client().chat.completions.create(
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            model=self.model_name,
+            stream=True,
+        )
+        usage = None
+        for chunk in response:
+            # Groq reports usage on the final chunk
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(x_groq, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        return usage
+
+
+class MockProvider(LLMProvider):
+    """
+    A local provider for tests and benchmarks. It answers "answer to: <question>"
+    after latency_ms, or a JSON array of such answers for batch prompts. It
+    raises `error` for the first `fail_times` calls.
+    """
+
+    name = "mock"
+
+    def __init__(self, latency_ms: float = 0, concurrency: int = 64, fail_times: int = 0,
+                 error: Exception = None, name: str = "mock"):
+        super().__init__(concurrency)
+        self.name = name
+        self.latency_ms = latency_ms
+        self.fail_times = fail_times
+        self.error = error or RuntimeError("mock provider failure")
+        self.calls = 0
+
+    def stream(self, prompt: str, json_output: bool = False):
+        with self._lock:
+            self.calls += 1
+            fail = self.calls <= self.fail_times
+        time.sleep(self.latency_ms / 1000)
+        if fail:
+            raise self.error
+        numbered = re.findall(r"^\s*(\d+)\. (.+)$", prompt.split("Questions:")[-1], flags=re.MULTILINE)
+        if json_output and numbered:
+            yield json.dumps([{"id": int(i), "answer": f"answer to: {q.strip()}"} for i, q in numbered])
+        else:
+            question = prompt.strip().splitlines()[-1].strip()
+            yield "answer to: "
+            yield question
+        return None
+
+
+def _record_prompt_tokens(provider: str, call: str, prompt: str, usage=None):
+    # The provider's own count when the response has one, our estimate otherwise
+    tokens = getattr(usage, "prompt_token_count", None) or getattr(usage, "prompt_tokens", None)
+    if tokens is None:
+        tokens = estimate_tokens(prompt)
+    PROMPT_TOKENS.observe(tokens, call=call)
+    logger.info(f"LLM {call} call on {provider}: {tokens} prompt tokens")
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+PROVIDER_FACTORIES = {
+    "gemini": GeminiProvider,
+    "groq": GroqProvider,
+    "mock": MockProvider,
+}
+
+
+def get_provider(name: str) -> LLMProvider:
+    with _providers_lock:
+        if name not in _providers:
+            if name not in PROVIDER_FACTORIES:
+                raise ValueError(f"Unknown LLM provider '{name}'")
+            _providers[name] = PROVIDER_FACTORIES[name]()
+        return _providers[name]
+
+
+def register_provider(provider: LLMProvider):
+    """Makes a provider instance (e.g. a configured MockProvider) available by its name."""
+    with _providers_lock:
+        _providers[provider.name] = provider
+
+
+class LLMRouter:
+    """
+    Sends each prompt to a primary provider and hedges to a fallback when
+    the primary is slow to start answering or fails.
+    """
+
+    def __init__(self, primary: str = LLM_PRIMARY_PROVIDER, fallback: str = LLM_FALLBACK_PROVIDER,
+                 hedge_after_ms: float = LLM_HEDGE_AFTER_MS, routing: str = LLM_ROUTING):
+        self.primary = primary
+        self.fallback = fallback
+        self.hedge_after_ms = hedge_after_ms
+        self.routing = routing
+
+    def route(self) -> list:
+        providers = [get_provider(self.primary)]
+        if self.fallback:
+            providers.append(get_provider(self.fallback))
+        if self.routing == "latency" and all(p.latency_ewma is not None for p in providers):
+            providers.sort(key=lambda p: p.latency_ewma)
+        return providers
+
+    async def _call(self, provider: LLMProvider, prompt: str, json_output: bool, call: str, first_token: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        async with provider.semaphore:
+            return await run_blocking(
+                provider.complete, prompt, json_output, call,
+                lambda: loop.call_soon_threadsafe(first_token.set)
+            )
+
+    async def complete(self, prompt: str, json_output: bool = False, call: str = "single") -> str:
+        providers = self.route()
+        first_token = asyncio.Event()
+        primary = asyncio.create_task(self._call(providers[0], prompt, json_output, call, first_token))
+        if len(providers) == 1:
+            return await primary
+
+        # Wait until the primary finishes, starts streaming, or runs out of time
+        token_wait = asyncio.create_task(first_token.wait())
+        await asyncio.wait({primary, token_wait}, timeout=self.hedge_after_ms / 1000,
+                           return_when=asyncio.FIRST_COMPLETED)
+        token_wait.cancel()
+        if primary.done() and primary.exception() is None:
+            return primary.result()
+        if not primary.done() and first_token.is_set():
+            # The primary is already answering; stick with it
+            return await primary
+
+        if primary.done():
+            logger.warning(f"{providers[0].name} failed ({type(primary.exception()).__name__}); falling back to {providers[1].name}")
+        else:
+            logger.info(f"{providers[0].name} silent after {self.hedge_after_ms:.0f}ms; hedging to {providers[1].name}")
+        fallback = asyncio.create_task(self._call(providers[1], prompt, json_output, call, asyncio.Event()))
+        pending = {fallback} if primary.done() else {primary, fallback}
+        error = primary.exception() if primary.done() else None
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    # The loser keeps running in its worker thread; its result is dropped
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+
+llm_router = LLMRouter()
@@ -0,0 +1,127 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from app.utils.document_cache import CACHE_DIR
+from app.utils.metrics import register_stats
+
+# --- In-process memoization for repeated questions ---
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "10000"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Each worker has its own answer cache, so invalidating a document also
+# leaves a marker here (one file per document, holding the time of the
+# invalidation) that every worker checks before serving a cached answer
+ANSWER_INVALIDATION_DIR = os.getenv("ANSWER_INVALIDATION_DIR", os.path.join(CACHE_DIR, "answer_invalidations"))
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries also expire after ttl seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_where(self, predicate) -> int:
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+query_embedding_cache = TTLCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL)
+answer_cache = TTLCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL)
+register_stats("query_embeddings", query_embedding_cache.stats)
+register_stats("answers", answer_cache.stats)
+
+
+def normalize_question(question: str) -> str:
+    # "What is the grace period?" and "  what is the  Grace Period? " are the same question
+    return " ".join(question.casefold().split())
+
+
+def _invalidation_path(doc_id: str) -> str:
+    # The document id comes from the request path, so it's hashed rather than trusted as a file name
+    return os.path.join(ANSWER_INVALIDATION_DIR, hashlib.sha256(doc_id.encode("utf-8")).hexdigest())
+
+
+def _invalidated_at(doc_id: str) -> int:
+    """When the document was last invalidated by any worker (ns since the epoch), or 0."""
+    try:
+        with open(_invalidation_path(doc_id), "r", encoding="utf-8") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def get_cached_answers(doc_id: str, questions: list, version: str) -> list:
+    """
+    Returns the cached answer for each question on this document, or None.
+    Answers cached before the document was last invalidated are misses.
+    """
+    invalidated_at = _invalidated_at(doc_id)
+    answers = []
+    for q in questions:
+        item = answer_cache.get((doc_id, normalize_question(q), version))
+        answers.append(item[0] if item is not None and item[1] > invalidated_at else None)
+    return answers
+
+
+def put_cached_answers(doc_id: str, questions: list, answers: list, version: str):
+    stored_at = time.time_ns()
+    for q, answer in zip(questions, answers):
+        answer_cache.set((doc_id, normalize_question(q), version), (answer, stored_at))
+
+
+def invalidate_document(doc_id: str) -> int:
+    """
+    Drops every cached answer for a document, in every worker. This worker's
+    entries are removed now (the returned count); other workers skip theirs
+    from their next lookup on, via the on-disk marker.
+    """
+    os.makedirs(ANSWER_INVALIDATION_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=ANSWER_INVALIDATION_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, _invalidation_path(doc_id))
+    return answer_cache.delete_where(lambda key: key[0] == doc_id)
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import asyncio
+import bisect
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+from app.utils.document_cache import CACHE_DIR
+from app.utils.executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# --- Latency and size metrics ---
+# Stage durations are measured with perf_counter_ns and kept as Prometheus
+# histograms, rendered by the /metrics endpoint. If TRACING_ENABLED is set and
+# opentelemetry is installed, every stage is also opened as a span.
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Under gunicorn every worker process has its own histograms and cache
+# counters, and a scrape reaches whichever worker answers. With
+# METRICS_MULTIPROCESS on (gunicorn.conf.py turns it on), each worker writes
+# a snapshot of them to METRICS_DIR, one file per pid, every
+# METRICS_SNAPSHOT_INTERVAL seconds and on shutdown, and /metrics and
+# /hackrx/cache/stats report the sum over every worker's snapshot. Snapshots
+# of workers that have exited are kept, because their counts still
+# happened; the gunicorn master clears the directory when it starts.
+METRICS_MULTIPROCESS = os.getenv("METRICS_MULTIPROCESS", "").lower() in ("1", "true", "yes")
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(CACHE_DIR, "metrics"))
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 25.0, 60.0)
+BYTES_BUCKETS = tuple(2 ** p for p in range(14, 31, 2))  # 16 KiB .. 1 GiB
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000)
+
+_tracer = None
+if TRACING_ENABLED:
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("hackrx")
+    except ImportError:
+        logger.warning("TRACING_ENABLED is set but opentelemetry is not installed; spans are disabled.")
+
+
+class Histogram:
+    """
+    A thread-safe Prometheus histogram with optional labels.
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: tuple, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        # Index of the first bucket the value fits in; counts are made
+        # cumulative when rendering
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> list:
+        """The series as JSON-friendly [labels, bucket counts, sum, count] lists."""
+        with self._lock:
+            return [[list(key), list(counts), total, count] for key, (counts, total, count) in self._series.items()]
+
+    def render(self, snapshots: list = None) -> list:
+        """
+        The histogram in the Prometheus text format. Given snapshots (from
+        any number of processes), renders their sum instead of this
+        process's own series.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        series = {}
+        for snapshot in (snapshots if snapshots is not None else [self.snapshot()]):
+            for labels, counts, total, count in snapshot:
+                merged = series.setdefault(tuple(labels), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f'{{{",".join(labels)}}}' if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "hackrx_stage_duration_seconds", "Time spent in each stage of a request or ingestion.",
+    LATENCY_BUCKETS, ("stage",)
+)
+DOCUMENT_BYTES = Histogram("hackrx_document_bytes", "Size of downloaded documents.", BYTES_BUCKETS)
+DOCUMENT_PAGES = Histogram("hackrx_document_pages", "Pages per ingested document.", COUNT_BUCKETS)
+DOCUMENT_CHUNKS = Histogram("hackrx_document_chunks", "Chunks per ingested document.", COUNT_BUCKETS)
+REQUEST_QUESTIONS = Histogram("hackrx_request_questions", "Questions per /hackrx/run request.", COUNT_BUCKETS)
+PROMPT_TOKENS = Histogram("hackrx_llm_prompt_tokens", "Prompt tokens per LLM call.", TOKEN_BUCKETS, ("call",))
+CONTEXT_TOKENS = Histogram(
+    "hackrx_context_tokens", "Estimated context tokens per LLM call, before (raw) and after (packed) context assembly.",
+    TOKEN_BUCKETS, ("kind",)
+)
+
+REGISTRY = [STAGE_SECONDS, DOCUMENT_BYTES, DOCUMENT_PAGES, DOCUMENT_CHUNKS, REQUEST_QUESTIONS,
+            PROMPT_TOKENS, CONTEXT_TOKENS]
+
+# Per-process counters (e.g. cache hits) reported by /hackrx/cache/stats, by
+# name. Each source returns a dict of numbers; see register_stats.
+STATS_SOURCES = {}
+
+
+def register_stats(name: str, source):
+    STATS_SOURCES[name] = source
+
+
+def observe_stage(name: str, elapsed_ns: int, timings: dict = None, key: str = None):
+    """
+    Records a stage duration in the histogram and, if a timings dict is given,
+    as milliseconds under timings[key or name].
+    """
+    STAGE_SECONDS.observe(elapsed_ns / 1e9, stage=name)
+    if timings is not None:
+        timings[key or name] = round(elapsed_ns / 1e6, 3)
+
+
+@contextmanager
+def stage(name: str, timings: dict = None, key: str = None):
+    """
+    Times the enclosed block as one stage. See observe_stage.
+    """
+    span = _tracer.start_as_current_span(name) if _tracer is not None else nullcontext()
+    start = time.perf_counter_ns()
+    with span:
+        try:
+            yield
+        finally:
+            observe_stage(name, time.perf_counter_ns() - start, timings, key)
+
+
+def timed_iter(iterable, totals: dict, key: str):
+    """
+    Yields from iterable, adding the nanoseconds spent producing each item to
+    totals[key]. Used to split a streaming pipeline's time between its stages.
+    """
+    iterator = iter(iterable)
+    totals.setdefault(key, 0)
+    while True:
+        start = time.perf_counter_ns()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            totals[key] += time.perf_counter_ns() - start
+        yield item
+
+
+def write_snapshot():
+    """Saves this process's histograms and stats for the other workers to read."""
+    snapshot = {
+        "histograms": {histogram.name: histogram.snapshot() for histogram in REGISTRY},
+        "stats": {name: source() for name, source in STATS_SOURCES.items()},
+    }
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+
+
+def read_snapshots() -> list:
+    """Every worker's latest snapshot, this one's written fresh first."""
+    write_snapshot()
+    snapshots = []
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name), "r", encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def clear_snapshots():
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+
+async def write_snapshots_periodically():
+    while True:
+        await asyncio.sleep(METRICS_SNAPSHOT_INTERVAL)
+        try:
+            await run_blocking(write_snapshot)
+        except OSError as e:
+            logger.warning(f"Writing the metrics snapshot failed: {e}")
+
+
+def render_metrics() -> str:
+    snapshots = read_snapshots() if METRICS_MULTIPROCESS else None
+    lines = []
+    for histogram in REGISTRY:
+        histogram_snapshots = None
+        if snapshots is not None:
+            histogram_snapshots = [s["histograms"].get(histogram.name, []) for s in snapshots]
+        lines.extend(histogram.render(histogram_snapshots))
+    return "\n".join(lines) + "\n"
+
+
+def collect_stats() -> dict:
+    """
+    The registered stats, summed over every worker when METRICS_MULTIPROCESS
+    is on. Hit rates are recomputed from the summed hits and misses.
+    """
+    if not METRICS_MULTIPROCESS:
+        return {name: source() for name, source in STATS_SOURCES.items()}
+    snapshots = read_snapshots()
+    totals = {}
+    for snapshot in snapshots:
+        for name, values in snapshot["stats"].items():
+            merged = totals.setdefault(name, {})
+            for key, value in values.items():
+                if key != "hit_rate":
+                    merged[key] = merged.get(key, 0) + value
+    for merged in totals.values():
+        lookups = merged.get("hits", 0) + merged.get("misses", 0)
+        merged["hit_rate"] = round(merged.get("hits", 0) / lookups, 4) if lookups else 0.0
+    totals["workers"] = len(snapshots)
+    return totals
@@ -0,0 +1,106 @@
+import time
+import random
+import asyncio
+import logging
+import weakref
+import threading
+
+logger = logging.getLogger(__name__)
+
+# SDK exceptions we treat as transient. Gemini raises google.api_core
+# exceptions and Groq/Pinecone raise their own, so match on the class name and
+# status code rather than importing every SDK's exception types.
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "RateLimitError", "TooManyRequests",
+    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+    "APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout",
+}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """
+    True for rate limits, timeouts, connection errors and 5xx responses.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    return code in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float) -> float:
+    # Exponential backoff with jitter
+    return base * (2 ** attempt) * (1 + random.random())
+
+
+def call_with_retry(func, *args, retries: int = 3, backoff_base: float = 0.5, limiter=None, **kwargs):
+    """
+    Calls func, retrying transient errors with backoff. If a RateLimiter is
+    given, every attempt waits for a slot first.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(attempt, backoff_base)
+            logger.warning(f"{getattr(func, '__name__', 'call')} failed ({type(e).__name__}); retry {attempt + 1} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Spaces calls so that at most `rate_per_second` start per second, across
+    all threads. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class LoopLocalSemaphore:
+    """
+    An asyncio.Semaphore for each event loop, created the first time that
+    loop uses it. A plain asyncio.Semaphore belongs to the loop that first
+    waits on it, so a long-lived one fails under any later loop (a second
+    lifespan, or each asyncio.run in tests and the CLIs).
+
+        async with semaphore:
+            ...
+    """
+
+    def __init__(self, value: int):
+        self.value = value
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.value)
+            return semaphore
+
+    async def __aenter__(self):
+        await self.get().acquire()
+
+    async def __aexit__(self, *exc):
+        self.get().release()
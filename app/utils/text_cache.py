@@ -0,0 +1,77 @@
+import os
+import json
+import tempfile
+
+from app.utils.document_cache import CACHE_DIR
+from app.utils.text_extraction import TEXT_EXTRACTION_VERSION
+
+# --- Extracted-text and chunk cache ---
+# Two layers, each keyed by everything that went into it:
+#   text/<content digest>-<TEXT_EXTRACTION_VERSION>.jsonl  a PDF's page texts
+#   chunks/<doc_id>.json                                  its chunks
+# The document id covers the content digest, the extractor and processing
+# versions and the chunker parameters (see make_document_id). So a chunker
+# change re-chunks from the cached text without parsing the PDF again, and
+# only an extractor change re-parses.
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", os.path.join(CACHE_DIR, "text"))
+CHUNK_CACHE_DIR = os.getenv("CHUNK_CACHE_DIR", os.path.join(CACHE_DIR, "chunks"))
+
+
+def _pages_path(content_digest: str) -> str:
+    return os.path.join(TEXT_CACHE_DIR, f"{content_digest}-{TEXT_EXTRACTION_VERSION}.jsonl")
+
+
+def _chunks_path(doc_id: str) -> str:
+    return os.path.join(CHUNK_CACHE_DIR, f"{doc_id}.json")
+
+
+def get_cached_pages(content_digest: str):
+    """
+    Returns the document's page texts (a list, first page first), or None on a miss.
+    """
+    try:
+        with open(_pages_path(content_digest), "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+    except (OSError, ValueError):
+        return None
+
+
+def iter_caching_pages(pages, content_digest: str):
+    """
+    Passes (page_number, text) tuples through unchanged while writing the
+    texts to the cache. The entry only appears (by rename) once every page
+    has been read, so an interrupted extraction leaves nothing behind.
+    """
+    os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=TEXT_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for page_number, text in pages:
+                f.write(json.dumps(text) + "\n")
+                yield page_number, text
+        os.replace(tmp_path, _pages_path(content_digest))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_cached_chunks(doc_id: str):
+    """
+    Returns (page_count, chunks) for a document id, where chunks is a list of
+    (chunk, page_start, page_end), or None on a miss.
+    """
+    try:
+        with open(_chunks_path(doc_id), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        return entry["page_count"], [tuple(chunk) for chunk in entry["chunks"]]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def put_cached_chunks(doc_id: str, page_count: int, chunks: list):
+    os.makedirs(CHUNK_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CHUNK_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"page_count": page_count, "chunks": chunks}, f)
+    os.replace(tmp_path, _chunks_path(doc_id))
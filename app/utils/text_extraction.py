@@ -1,10 +1,105 @@
-import fitz
+import os
+import tempfile
+import multiprocessing
+from itertools import repeat
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_text_from_pdf(file_path: str):
+# Large PDFs are extracted across a process pool: each worker opens the file
+# itself and returns the text for a contiguous range of pages.
+PARALLEL_EXTRACT_MIN_PAGES = int(os.getenv("PARALLEL_EXTRACT_MIN_PAGES", "300"))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "25"))
 
+# Bump when extraction output changes, so cached page texts (and the document
+# ids built on them) are recomputed
+TEXT_EXTRACTION_VERSION = "x1"
+
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the server process has live threads and SDK clients
+        _pool = ProcessPoolExecutor(
+            max_workers=EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_extraction_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> list:
+    import fitz
     with fitz.open(file_path) as doc:
-        page_count = doc.page_count
-        text = ""
+        return [doc[i].get_text("text") for i in range(start, stop)]
+
+
+def _open_document(source):
+    """
+    Opens a PDF from a file path, or straight from an in-memory buffer
+    (bytes, bytearray or memoryview) without writing it to disk.
+    """
+    # Imported here rather than at module load to keep startup fast
+    import fitz
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _iter_page_texts(doc, source):
+    """
+    Yields each page's text in order, switching to the process pool for
+    documents of PARALLEL_EXTRACT_MIN_PAGES pages or more.
+    """
+    page_count = doc.page_count
+    if page_count < PARALLEL_EXTRACT_MIN_PAGES or EXTRACT_WORKERS < 2:
         for page in doc:
-            text += page.get_text("text")
-    return text, page_count
\ No newline at end of file
+            yield page.get_text("text")
+        return
+
+    # Workers open the file themselves, so an in-memory document is written
+    # out once rather than pickled to every task
+    temp_path = None
+    if not isinstance(source, (str, os.PathLike)):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+            temp_file.write(source)
+            temp_path = source = temp_file.name
+
+    try:
+        starts = range(0, page_count, PAGES_PER_TASK)
+        stops = [min(start + PAGES_PER_TASK, page_count) for start in starts]
+        # map() returns results in submission order, so pages come back in order
+        for texts in _get_pool().map(_extract_page_range, repeat(source), starts, stops):
+            yield from texts
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+def extract_text_from_pdf(source):
+    """
+    Returns (text, page_count). source is a file path or an in-memory buffer.
+    """
+    with _open_document(source) as doc:
+        page_count = doc.page_count
+        text = "".join(_iter_page_texts(doc, source))
+    return text, page_count
+
+@contextmanager
+def open_pdf_pages(source):
+    """
+    Opens a PDF (a file path or an in-memory buffer) for streaming. Yields
+    (page_count, pages), where pages lazily produces (page_number, text)
+    tuples with 1-based page numbers, so only one page's text is held at a time.
+    """
+    with _open_document(source) as doc:
+        pages = enumerate(_iter_page_texts(doc, source), start=1)
+        yield doc.page_count, pages
@@ -1,19 +1,33 @@
 import os
+import hashlib
 import secrets
-import requests
-from mimetypes import guess_type
+import tempfile
+import httpx
 from urllib.parse import urlparse
 
 from fastapi import Header, HTTPException, status
 
+from app.utils.http_client import get_http_client
+
 # --- Environment Variable Loading ---
 BEARER_API_KEY = os.getenv("BEARER_API_KEY")
 
 # --- Allowed File Types ---
-ALLOWED_MIME_TYPES = {
-    "application/pdf": "pdf",
+# Documents are identified by their leading bytes. Per the PDF spec the header
+# may sit anywhere in the first 1024 bytes.
+MAGIC_BYTES = {
+    b"%PDF-": "pdf",
     # Add other supported types here
 }
+MAGIC_SEARCH_BYTES = 1024
+# Content-Types that are never a document, so the download stops before any body is read
+REJECTED_MIME_TYPES = {"application/json", "application/xml", "application/xhtml+xml", "application/javascript"}
+
+# --- Download limits ---
+MAX_DOCUMENT_BYTES = int(os.getenv("MAX_DOCUMENT_BYTES", str(100 * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+# Bodies up to this size stay in memory; larger ones spill to a temp file
+DOWNLOAD_MEMORY_LIMIT = int(os.getenv("DOWNLOAD_MEMORY_LIMIT", str(20 * 1024 * 1024)))
 
 def verify_bearer(authorization: str = Header(None)):
     """
@@ -42,63 +56,198 @@ def verify_bearer(authorization: str = Header(None)):
             detail="Invalid or expired token."
         )
 
-def validate_document_url(doc_url: str) -> tuple[str, str]:
+def validate_document_url(doc_url: str) -> str:
     """
-    Validates the document URL and its content type without downloading the file.
-
-    Args:
-        doc_url: The URL of the document to validate.
+    Checks that the document URL is an absolute http(s) URL. The content type
+    is checked while downloading (see download_document), so no request is
+    made here.
 
-    Returns:
-        A tuple containing the (validated_url, file_extension).
-    
     Raises:
-        HTTPException: If the URL is invalid or the file type is not supported.
+        HTTPException: If the URL is malformed or not http(s).
     """
-    try:
-        # Check the Content-Type header first using a HEAD request
-        resp = requests.head(doc_url, stream=True, allow_redirects=True, timeout=10)
-        resp.raise_for_status()  # Raise an exception for 4xx/5xx status codes
-        doc_type = resp.headers.get("Content-Type", "").lower().split(";")[0].strip()
-    except requests.exceptions.RequestException as e:
+    parsed = urlparse(doc_url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Failed to access document URL: {e}"
+            detail=f"Invalid document URL '{doc_url}'. Must be an http(s) URL."
         )
-    finally:
-        if 'resp' in locals():
-            resp.close()
-
-    # If Content-Type is missing, try to guess from the URL path extension
-    if not doc_type:
-        parsed_path = urlparse(doc_url).path
-        mime, _ = guess_type(parsed_path)
-        doc_type = mime or ""
-
-    # Check if the determined MIME type is in our allowed list
-    if doc_type not in ALLOWED_MIME_TYPES:
-        raise HTTPException(
-            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            detail=f"Unsupported file type '{doc_type}'. Only PDF files are allowed."
-        )
-    
-    file_extension = ALLOWED_MIME_TYPES[doc_type]
-    return doc_url, file_extension
+    return doc_url
+
+
+class DownloadedDocument:
+    """
+    A downloaded document body. Bytes are kept in memory up to
+    DOWNLOAD_MEMORY_LIMIT and spill to a temp file beyond that. The SHA-256 of
+    the content is computed as it arrives, so hashing needs no second pass.
+    """
+
+    def __init__(self, file_extension: str):
+        self.file_extension = file_extension
+        self.validators = {}
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._memory = bytearray()
+        self._file = None
+        self._path = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._path is None
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def write(self, data: bytes):
+        self._digest.update(data)
+        self.size += len(data)
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self._memory += data
+        if len(self._memory) > DOWNLOAD_MEMORY_LIMIT:
+            self._spill()
+
+    def _spill(self):
+        self._file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{self.file_extension}")
+        self._path = self._file.name
+        self._file.write(self._memory)
+        self._memory = bytearray()
+
+    def finish(self):
+        """Called once the download is complete."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def getbuffer(self) -> memoryview:
+        """The content as a memoryview, if it's held in memory."""
+        if not self.in_memory:
+            raise ValueError("Document was spooled to disk; use path() instead.")
+        return memoryview(self._memory)
+
+    def source(self):
+        """
+        What the PDF readers should open: the in-memory buffer when there is
+        one, so small documents never touch disk, otherwise the spooled file.
+        """
+        return self.getbuffer() if self.in_memory else self._path
 
+    def path(self) -> str:
+        """
+        A file path with the content, for readers that need one. In-memory
+        documents are written out on first use.
+        """
+        if self._path is None:
+            self._spill()
+            self.finish()
+        return self._path
 
-def download_file(doc_url: str, temp_path: str):
+    def close(self):
+        self.finish()
+        self._memory = bytearray()
+        if self._path and os.path.exists(self._path):
+            os.remove(self._path)
+        self._path = None
+
+
+def sniff_file_extension(head: bytes):
+    """
+    Works out the file type from the first bytes of the body. The magic bytes
+    decide, not the Content-Type: blob stores often send application/octet-stream
+    for PDFs, and an HTML error page labelled application/pdf is not a PDF.
     """
-    Downloads a file from a URL to a temporary path.
+    for magic, file_extension in MAGIC_BYTES.items():
+        if magic in head[:MAGIC_SEARCH_BYTES]:
+            return file_extension
+    return None
+
+
+async def download_document(doc_url: str, etag: str = None, last_modified: str = None):
     """
+    Downloads a document with a single GET on the pooled client.
+
+    The response is rejected early if its Content-Type is clearly not a
+    document, if its first bytes aren't a supported file type, or once it
+    grows past MAX_DOCUMENT_BYTES.
+
+    If an ETag or Last-Modified value from an earlier download is given, the
+    request is made conditional, and None is returned on 304 Not Modified.
+
+    Returns:
+        A DownloadedDocument (the caller closes it), or None if the cached
+        copy is still current.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
     try:
-        with requests.get(doc_url, timeout=15, stream=True) as r:
+        async with get_http_client().stream("GET", doc_url, headers=headers) as r:
+            if r.status_code == 304:
+                return None
             r.raise_for_status()
-            with open(temp_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-    except requests.exceptions.RequestException as e:
+
+            content_type = r.headers.get("Content-Type", "").lower().split(";")[0].strip()
+            if content_type in REJECTED_MIME_TYPES or content_type.startswith(("text/", "image/", "video/", "audio/")):
+                raise HTTPException(
+                    status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                    detail=f"Unsupported file type '{content_type}'. Only PDF files are allowed."
+                )
+            content_length = r.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > MAX_DOCUMENT_BYTES:
+                raise _too_large()
+
+            document = None
+            head = b""
+            try:
+                async for chunk in r.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if document is None:
+                        # Sniff once we have enough bytes to be sure
+                        head += chunk
+                        if len(head) < MAGIC_SEARCH_BYTES:
+                            continue
+                        document = _start_document(head, content_type)
+                        chunk, head = head, b""
+                    document.write(chunk)
+                    if document.size > MAX_DOCUMENT_BYTES:
+                        raise _too_large()
+                if document is None:
+                    document = _start_document(head, content_type)
+                    document.write(head)
+            except BaseException:
+                if document is not None:
+                    document.close()
+                raise
+
+            document.finish()
+            document.validators = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+            return document
+    except httpx.HTTPError as e:
         # Catch specific request-related errors
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Download failed: {e}"
-        )
\ No newline at end of file
+        )
+
+
+def _start_document(head: bytes, content_type: str) -> DownloadedDocument:
+    file_extension = sniff_file_extension(head)
+    if file_extension is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Document content is not a supported file type (Content-Type '{content_type or 'unknown'}'). Only PDF files are allowed."
+        )
+    return DownloadedDocument(file_extension)
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Document is larger than the {MAX_DOCUMENT_BYTES / (1024 * 1024):g} MB ({MAX_DOCUMENT_BYTES} bytes) limit."
+    )
@@ -0,0 +1,397 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.utils.document_cache import CACHE_DIR
+from app.utils.lexical_index import LexicalIndex
+from app.utils.embeddings import (get_pinecone_index, get_embeddings_from_namespace,
+                                  upsert_to_namespace)
+
+# --- Vector storage backends ---
+# "local" keeps everything on this machine, "pinecone" only uses the remote
+# index, and "tiered" reads locally first and falls back to (and backfills
+# from) Pinecone. "memory" keeps nothing past the process (benchmarks, tests).
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "tiered" if os.getenv("PINECONE_API_KEY") else "local")
+VECTOR_DIR = os.getenv("VECTOR_DIR", os.path.join(CACHE_DIR, "vectors"))
+VECTOR_MEMORY_CACHE_SIZE = int(os.getenv("VECTOR_MEMORY_CACHE_SIZE", "64"))
+
+# --- Hybrid retrieval ---
+# Dense and BM25 rankings are fused with reciprocal rank fusion over each
+# ranking's top HYBRID_CANDIDATES chunks.
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+
+# --- Vector precision ---
+# Local documents are scanned at VECTOR_DTYPE: float32, float16 (half the
+# memory) or int8 (a quarter, plus one float32 scale per vector). With a
+# compact dtype, each query's top VECTOR_RESCORE chunks are re-scored
+# exactly against the float32 vectors, which stay memory-mapped on disk so
+# only the rows being re-scored are read.
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_RESCORE = int(os.getenv("VECTOR_RESCORE", "50"))
+VECTOR_DTYPES = ("float32", "float16", "int8")
+# Rows converted back to float32 at a time while scanning a compact matrix
+SCAN_BLOCK_ROWS = 4096
+
+
+class DocumentIndex:
+    """
+    The vectors of one document as a float32 matrix, with rows normalized to
+    unit length so cosine similarity is a single matmul, plus a BM25 index
+    over the chunk texts for hybrid search.
+
+    With a dtype other than float32, searches scan a quantized copy (codes,
+    and for int8 per-row scales) and only re-score the best `rescore`
+    candidates per query with the float32 vectors.
+    """
+
+    def __init__(self, vectors, metadatas: list, normalized: bool = False, lexical: LexicalIndex = None,
+                 dtype: str = "float32", codes=None, scales=None, rescore: int = VECTOR_RESCORE):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}'")
+        # A memory-mapped float32 matrix is used as is
+        if not (isinstance(vectors, np.ndarray) and vectors.dtype == np.float32):
+            vectors = np.asarray(vectors, dtype=np.float32)
+        if not normalized:
+            vectors = _normalize(vectors)
+        if dtype != "float32" and codes is None:
+            codes, scales = quantize(vectors, dtype)
+        self.vectors = vectors
+        self.metadatas = metadatas
+        self.dtype = dtype
+        self.codes = codes if dtype != "float32" else None
+        self.scales = scales
+        self.rescore = rescore
+        self._lexical = lexical
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        # Built on first use for documents stored without one (Pinecone, older local copies)
+        if self._lexical is None:
+            self._lexical = LexicalIndex.build([m.get("text", "") for m in self.metadatas])
+        return self._lexical
+
+    def __len__(self):
+        return len(self.metadatas)
+
+    @property
+    def scan_nbytes(self) -> int:
+        """Bytes of the matrix every search scans (what the memory cache holds)."""
+        if self.codes is None:
+            return self.vectors.nbytes
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def dense_scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of each normalized query with every chunk, as a
+        (num_queries, num_chunks) matrix. For a quantized index the scores
+        are approximate, except each query's top `rescore`, which are exact.
+        """
+        if self.codes is None:
+            return queries @ self.vectors.T
+
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales
+
+        n = min(self.rescore, scores.shape[1])
+        if n > 0:
+            top = _top_indices(scores, n)
+            # Only these rows of the float32 matrix are read: (queries, n, dim) @ (queries, dim, 1)
+            exact = np.matmul(np.asarray(self.vectors[top]), queries[:, :, None])[:, :, 0]
+            np.put_along_axis(scores, top, exact, axis=1)
+        return scores
+
+    def search(self, query_vectors, top_k: int):
+        """
+        Returns (scores, indices), each of shape (num_queries, k), with each
+        row's matches sorted from most to least similar.
+        """
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32))
+        scores = self.dense_scores(queries)
+
+        top = _top_indices(scores, min(top_k, scores.shape[1]))
+        return np.take_along_axis(scores, top, axis=1), top
+
+    def hybrid_search(self, query_vectors, query_texts: list, top_k: int,
+                      candidates: int = HYBRID_CANDIDATES, rrf_k: int = RRF_K):
+        """
+        Ranks chunks by reciprocal rank fusion of cosine similarity and BM25:
+        each chunk scores sum(1 / (rrf_k + rank)) over the rankings whose top
+        `candidates` it appears in. Every query in the batch is scored at once.
+
+        Returns:
+            (fused_scores, indices, dense_scores, lexical_scores), each of
+            shape (num_queries, k), best match first.
+        """
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32))
+        dense = self.dense_scores(queries)
+        lexical = self.lexical.score(query_texts)
+
+        num_queries, num_chunks = dense.shape
+        n = min(candidates, num_chunks)
+        rank_weights = 1.0 / (rrf_k + np.arange(1, n + 1, dtype=np.float32))
+        fused = np.zeros((num_queries, num_chunks), dtype=np.float32)
+
+        dense_top = _top_indices(dense, n)
+        np.put_along_axis(fused, dense_top, np.broadcast_to(rank_weights, dense_top.shape), axis=1)
+
+        lexical_top = _top_indices(lexical, n)
+        # A chunk sharing no terms with the question isn't a lexical candidate at all
+        lexical_weights = np.where(np.take_along_axis(lexical, lexical_top, axis=1) > 0, rank_weights, 0.0)
+        np.put_along_axis(fused, lexical_top, np.take_along_axis(fused, lexical_top, axis=1) + lexical_weights, axis=1)
+
+        k = min(top_k, num_chunks)
+        indices = _top_indices(fused, k)
+        return (np.take_along_axis(fused, indices, axis=1), indices,
+                np.take_along_axis(dense, indices, axis=1), np.take_along_axis(lexical, indices, axis=1))
+
+
+def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    # argpartition finds the top k in linear time; only those k get sorted
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Compacts a float32 matrix for scanning. float16 is a plain cast; int8
+    scales each row so its largest component maps to 127.
+
+    Returns:
+        (codes, scales), where scales is None unless dtype is int8.
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorStore:
+    """
+    Stores and loads the vectors for a document id. Subclasses implement get and put.
+    """
+
+    def get(self, doc_id: str):
+        """Returns the document's DocumentIndex, or None if nothing is stored."""
+        raise NotImplementedError
+
+    def put(self, doc_id: str, vectors: list, metadatas: list) -> DocumentIndex:
+        raise NotImplementedError
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Persists each document as <root>/<doc_id>/vectors.npy (float32, already
+    normalized) plus metadata.json, and memory-maps the matrix on load. With
+    a compact dtype, the quantized copy is saved next to it as codes.npy
+    (and scales.npy for int8) and loaded into memory. Recently used
+    documents stay open in memory.
+    """
+
+    def __init__(self, root: str = VECTOR_DIR, memory_cache_size: int = VECTOR_MEMORY_CACHE_SIZE,
+                 dtype: str = VECTOR_DTYPE):
+        self.root = root
+        self.memory_cache_size = memory_cache_size
+        self.dtype = dtype
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, doc_id: str, doc_index: DocumentIndex):
+        with self._lock:
+            self._loaded[doc_id] = doc_index
+            self._loaded.move_to_end(doc_id)
+            while len(self._loaded) > self.memory_cache_size:
+                self._loaded.popitem(last=False)
+
+    def get(self, doc_id: str):
+        with self._lock:
+            if doc_id in self._loaded:
+                self._loaded.move_to_end(doc_id)
+                return self._loaded[doc_id]
+
+        doc_index = self._load(doc_id)
+        if doc_index is not None:
+            self._remember(doc_id, doc_index)
+        return doc_index
+
+    def _load(self, doc_id: str):
+        doc_dir = os.path.join(self.root, doc_id)
+        try:
+            vectors = np.load(os.path.join(doc_dir, "vectors.npy"), mmap_mode="r")
+            with open(os.path.join(doc_dir, "metadata.json"), "r", encoding="utf-8") as f:
+                metadatas = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        codes, scales = None, None
+        if self.dtype != "float32":
+            codes, scales = self._load_codes(doc_dir, vectors)
+        lexical = LexicalIndex.load(os.path.join(doc_dir, "lexical.npz"))
+        return DocumentIndex(vectors, metadatas, normalized=True, lexical=lexical,
+                             dtype=self.dtype, codes=codes, scales=scales)
+
+    def _load_codes(self, doc_dir: str, vectors: np.ndarray):
+        try:
+            codes = np.load(os.path.join(doc_dir, "codes.npy"))
+            scales = np.load(os.path.join(doc_dir, "scales.npy")) if self.dtype == "int8" else None
+            if codes.dtype == np.dtype(self.dtype):
+                return codes, scales
+        except (OSError, ValueError):
+            pass
+        # Stored before quantization was enabled (or at another dtype); quantize
+        # once and keep the result for next time
+        codes, scales = quantize(vectors, self.dtype)
+        try:
+            self._save_codes(doc_dir, codes, scales)
+        except OSError:
+            pass
+        return codes, scales
+
+    @staticmethod
+    def _save_codes(doc_dir: str, codes: np.ndarray, scales):
+        # Scales first, so whoever sees the new codes also sees their scales
+        for name, array in (("scales.npy", scales), ("codes.npy", codes)):
+            if array is None:
+                continue
+            fd, tmp_path = tempfile.mkstemp(dir=doc_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(doc_dir, name))
+
+    def put(self, doc_id: str, vectors: list, metadatas: list) -> DocumentIndex:
+        doc_index = DocumentIndex(vectors, metadatas, dtype=self.dtype)
+
+        # Write into a scratch directory and rename it into place, so readers
+        # never see a document with vectors but no metadata
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.root, prefix=f".{doc_id}-")
+        try:
+            np.save(os.path.join(tmp_dir, "vectors.npy"), doc_index.vectors)
+            with open(os.path.join(tmp_dir, "metadata.json"), "w", encoding="utf-8") as f:
+                json.dump(metadatas, f)
+            doc_index.lexical.save(os.path.join(tmp_dir, "lexical.npz"))
+            if doc_index.codes is not None:
+                self._save_codes(tmp_dir, doc_index.codes, doc_index.scales)
+            os.replace(tmp_dir, os.path.join(self.root, doc_id))
+        except OSError:
+            # Another request stored the same document first; theirs is just as good
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if doc_index.codes is not None:
+            # Keep the float32 vectors on disk rather than in the memory cache
+            doc_index = self._load(doc_id) or doc_index
+        self._remember(doc_id, doc_index)
+        return doc_index
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    The remote tier: one Pinecone namespace per document id. Every vector's
+    metadata carries the document's chunk_count, so a namespace left half
+    written by a failed upsert reads as missing and gets ingested again.
+    """
+
+    def get(self, doc_id: str):
+        embeddings = get_embeddings_from_namespace(get_pinecone_index(), doc_id)
+        if not embeddings:
+            return None
+        if any(item["metadata"].get("chunk_count", len(embeddings)) != len(embeddings) for item in embeddings):
+            return None
+        return DocumentIndex(
+            [item["embedding"] for item in embeddings],
+            [item["metadata"] for item in embeddings]
+        )
+
+    def put(self, doc_id: str, vectors: list, metadatas: list) -> DocumentIndex:
+        chunk_count = len(metadatas)
+        remote_metadatas = [{**metadata, "chunk_count": chunk_count} for metadata in metadatas]
+        upsert_to_namespace(get_pinecone_index(), doc_id, vectors, remote_metadatas)
+        return DocumentIndex(vectors, metadatas)
+
+
+class MemoryVectorStore(VectorStore):
+    """
+    Holds every document in a dict; nothing is written anywhere. For
+    benchmarks and tests that shouldn't depend on, or leave behind, local
+    files or Pinecone namespaces.
+    """
+
+    def __init__(self, dtype: str = VECTOR_DTYPE):
+        self.dtype = dtype
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def get(self, doc_id: str):
+        with self._lock:
+            return self._documents.get(doc_id)
+
+    def put(self, doc_id: str, vectors: list, metadatas: list) -> DocumentIndex:
+        doc_index = DocumentIndex(vectors, metadatas, dtype=self.dtype)
+        with self._lock:
+            self._documents[doc_id] = doc_index
+        return doc_index
+
+
+class TieredVectorStore(VectorStore):
+    """
+    Reads from the local store first. On a local miss, the remote store is
+    tried and anything found there is saved locally for next time.
+    """
+
+    def __init__(self, local: VectorStore, remote: VectorStore):
+        self.local = local
+        self.remote = remote
+
+    def get(self, doc_id: str):
+        doc_index = self.local.get(doc_id)
+        if doc_index is None:
+            doc_index = self.remote.get(doc_id)
+            if doc_index is not None:
+                doc_index = self.local.put(doc_id, doc_index.vectors, doc_index.metadatas)
+        return doc_index
+
+    def put(self, doc_id: str, vectors: list, metadatas: list) -> DocumentIndex:
+        self.remote.put(doc_id, vectors, metadatas)
+        return self.local.put(doc_id, vectors, metadatas)
+
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    global _vector_store
+    if _vector_store is None:
+        # The startup warm-up can race the first request here, and two
+        # MemoryVectorStores would each hold only part of the documents
+        with _vector_store_lock:
+            if _vector_store is None:
+                if VECTOR_BACKEND == "local":
+                    _vector_store = LocalVectorStore()
+                elif VECTOR_BACKEND == "pinecone":
+                    _vector_store = PineconeVectorStore()
+                elif VECTOR_BACKEND == "tiered":
+                    _vector_store = TieredVectorStore(LocalVectorStore(), PineconeVectorStore())
+                elif VECTOR_BACKEND == "memory":
+                    _vector_store = MemoryVectorStore()
+                else:
+                    raise ValueError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}'")
+    return _vector_store
@@ -0,0 +1,37 @@
+import os
+import multiprocessing
+
+# --- Multi-worker deployment ---
+# gunicorn -c gunicorn.conf.py app.main:app
+#
+# One uvicorn worker per core by default. Workers share the on-disk caches
+# (HACKRX_CACHE_DIR: URL index, embedding cache, local vectors), which are
+# safe to use from several processes; in-memory caches stay per worker.
+cores = multiprocessing.cpu_count()
+workers = int(os.getenv("WEB_CONCURRENCY", str(cores)))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker sizes its CPU-bound pools from these, so split the cores
+# between workers instead of letting every worker assume it has them all.
+# Both stay at 2 or more: parallel extraction needs EXTRACT_WORKERS >= 2
+# (text_extraction falls back to a single process below that), and a second
+# CPU thread lets one document chunk while another waits on that pool. The
+# extraction pool is only started for PARALLEL_EXTRACT_MIN_PAGES-page
+# documents, so the brief oversubscription is cheaper than serial extraction.
+per_worker = str(max(2, cores // workers))
+os.environ.setdefault("CPU_WORKERS", per_worker)
+os.environ.setdefault("EXTRACT_WORKERS", per_worker)
+
+# Every worker writes its metrics to the shared cache directory, so /metrics
+# and /hackrx/cache/stats report the whole server rather than one worker
+os.environ.setdefault("METRICS_MULTIPROCESS", "true")
+
+
+def on_starting(server):
+    # Counts from a previous run of the server would otherwise be summed in
+    from app.utils.metrics import clear_snapshots
+    clear_snapshots()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Cache paths are read when the app modules are imported, so point them at a
+# scratch directory before any test imports them
+os.environ.setdefault("HACKRX_CACHE_DIR", tempfile.mkdtemp(prefix="hackrx_test_cache_"))
+os.environ.setdefault("VECTOR_BACKEND", "memory")
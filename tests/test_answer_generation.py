@@ -0,0 +1,181 @@
+import time
+import asyncio
+
+import pytest
+
+from app.utils import answer_generation, embeddings, llm_providers
+from app.utils.llm_providers import LLMRouter, MockProvider
+from app.utils.rate_limit import LoopLocalSemaphore
+
+
+def _answer_for(question):
+    return f"Answer to {question}"
+
+
+@pytest.fixture
+def batch_mode(monkeypatch):
+    monkeypatch.setattr(answer_generation, "ANSWER_MODE", "batch")
+    monkeypatch.setattr(answer_generation, "LLM_BATCH_SIZE", 2)
+
+
+def _run(questions, batch_answer_fn, single_calls):
+    async def answer_fn(question, top_matches_all):
+        single_calls.append(question)
+        return _answer_for(question)
+
+    timings, stats = {}, {}
+    answers = asyncio.run(answer_generation.generate_answers(
+        questions, {}, timings, answer_fn=answer_fn, batch_answer_fn=batch_answer_fn, stats=stats))
+    return answers, timings, stats
+
+
+def test_unparsed_batch_answers_fall_back_to_single_calls(batch_mode):
+    async def batch_answer_fn(batch, top_matches_all):
+        # The model drops the second question of every batch
+        return [_answer_for(batch[0])] + [None] * (len(batch) - 1), 10
+
+    questions = ["q1", "q2", "q3", "q4", "q5"]
+    single_calls = []
+    answers, timings, stats = _run(questions, batch_answer_fn, single_calls)
+
+    assert answers == [_answer_for(q) for q in questions]
+    assert sorted(single_calls) == ["q2", "q4"]
+    assert stats == {"batch_tokens_saved": 30}
+    assert all(isinstance(ms, float) for ms in timings.values())
+
+
+def test_a_failed_batch_call_falls_back_for_every_question(batch_mode):
+    async def batch_answer_fn(batch, top_matches_all):
+        if "q3" in batch:
+            raise ValueError("not retryable")
+        return [_answer_for(q) for q in batch], 0
+
+    questions = ["q1", "q2", "q3", "q4"]
+    single_calls = []
+    answers, _, _ = _run(questions, batch_answer_fn, single_calls)
+
+    assert answers == [_answer_for(q) for q in questions]
+    assert sorted(single_calls) == ["q3", "q4"]
+
+
+# --- Concurrency, retries and limits, against the mock LLM provider ---
+
+
+@pytest.fixture
+def mock_llm(monkeypatch):
+    """Routes generate_answer to a MockProvider; returns a function that installs one."""
+    def install(**kwargs):
+        provider = MockProvider(**kwargs)
+        monkeypatch.setitem(llm_providers._providers, "mock", provider)
+        monkeypatch.setattr(embeddings, "llm_router", LLMRouter(primary="mock", fallback=""))
+        return provider
+
+    monkeypatch.setattr(answer_generation, "ANSWER_MODE", "single")
+    monkeypatch.setattr(answer_generation, "LLM_BACKOFF_BASE", 0)
+    return install
+
+
+def _top_matches(questions):
+    return {q: [{"score": 1.0, "index": 0, "metadata": {"text": f"Context for {q}", "chunk": 0}}] for q in questions}
+
+
+def _answer_all(questions, timings=None):
+    timings = {} if timings is None else timings
+    return asyncio.run(answer_generation.generate_answers(questions, _top_matches(questions), timings))
+
+
+def test_answers_keep_question_order_while_running_concurrently(mock_llm):
+    provider = mock_llm(latency_ms=100)
+    _answer_all(["Warm up?"])  # first use loads the sentence tokenizer and pools
+    questions = [f"Question {i}?" for i in range(5)]
+    timings = {}
+
+    start = time.perf_counter()
+    answers = _answer_all(questions, timings)
+    elapsed = time.perf_counter() - start
+
+    assert answers == [f"answer to: {q}" for q in questions]
+    assert provider.calls == 6
+    assert elapsed < 0.4  # five 100ms calls, not one after another
+    assert all(f"generate_answer_llm_{i}" in timings for i in range(1, 6))
+
+
+def test_answers_stay_in_order_when_calls_finish_out_of_order(monkeypatch):
+    monkeypatch.setattr(answer_generation, "ANSWER_MODE", "single")
+    finished = []
+
+    async def answer_fn(question, top_matches_all):
+        # The first question is the slowest
+        await asyncio.sleep(0.05 * (5 - int(question)))
+        finished.append(question)
+        return question
+
+    questions = [str(i) for i in range(5)]
+    answers = asyncio.run(answer_generation.generate_answers(questions, {}, {}, answer_fn=answer_fn))
+
+    assert finished == questions[::-1]
+    assert answers == questions
+
+
+def test_retryable_errors_are_retried(mock_llm):
+    provider = mock_llm(fail_times=2, error=ConnectionError("reset"))
+    assert _answer_all(["Question?"]) == ["answer to: Question?"]
+    assert provider.calls == 3
+
+
+def test_other_errors_are_not_retried(mock_llm):
+    provider = mock_llm(fail_times=1, error=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        _answer_all(["Question?"])
+    assert provider.calls == 1
+
+
+def test_slow_calls_time_out_and_give_up_after_the_retries(mock_llm, monkeypatch):
+    monkeypatch.setattr(answer_generation, "LLM_CALL_TIMEOUT", 0.05)
+    monkeypatch.setattr(answer_generation, "LLM_MAX_RETRIES", 2)
+    provider = mock_llm(latency_ms=300)
+
+    with pytest.raises(asyncio.TimeoutError):
+        _answer_all(["Question?"])
+    assert provider.calls == 3
+
+
+def test_the_global_limit_bounds_calls_across_requests(monkeypatch):
+    monkeypatch.setattr(answer_generation, "ANSWER_MODE", "single")
+    monkeypatch.setattr(answer_generation, "_global_semaphore", LoopLocalSemaphore(3))
+    in_flight, peak = 0, 0
+
+    async def answer_fn(question, top_matches_all):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return question
+
+    async def three_requests():
+        # Each request may have LLM_REQUEST_CONCURRENCY (5) calls in flight
+        return await asyncio.gather(*(
+            answer_generation.generate_answers([f"{r}-{i}" for i in range(5)], {}, {}, answer_fn=answer_fn)
+            for r in range(3)
+        ))
+
+    results = asyncio.run(three_requests())
+    assert results == [[f"{r}-{i}" for i in range(5)] for r in range(3)]
+    assert peak == 3
+
+
+def test_the_limits_work_under_a_new_event_loop(mock_llm):
+    # More calls than the global limit, so every semaphore is waited on in both loops
+    mock_llm(latency_ms=20, concurrency=1)
+    questions = [f"Question {i}?" for i in range(answer_generation.LLM_GLOBAL_CONCURRENCY + 4)]
+
+    async def requests():
+        return await asyncio.gather(*(
+            answer_generation.generate_answers(questions[i:i + 5], _top_matches(questions[i:i + 5]), {})
+            for i in range(0, len(questions), 5)
+        ))
+
+    for _ in range(2):
+        answers = [a for batch in asyncio.run(requests()) for a in batch]
+        assert answers == [f"answer to: {q}" for q in questions]
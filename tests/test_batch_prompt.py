@@ -0,0 +1,64 @@
+import json
+
+from app.utils import embeddings
+from app.utils.context_assembly import CONTEXT_TOKEN_BUDGET
+
+
+def _matches(question_number, count=3):
+    # Chunks far apart in the document, so none of them merge or dedupe
+    return [
+        {"score": 1.0 - rank / 10, "index": question_number * 100 + rank * 10,
+         "metadata": {"chunk": question_number * 100 + rank * 10,
+                      "text": " ".join(f"Question {question_number} passage {rank} makes point {n}."
+                                       for n in range(150))}}
+        for rank in range(count)
+    ]
+
+
+def test_the_batch_context_budget_grows_with_the_batch():
+    questions = [f"Question {i}?" for i in range(5)]
+    top_matches_all = {q: _matches(i) for i, q in enumerate(questions)}
+
+    prompt, _ = embeddings.build_batch_prompt(questions, top_matches_all)
+
+    context = prompt.split("Context:")[1].split("Questions:")[0]
+    assert embeddings.estimate_tokens(context) > CONTEXT_TOKEN_BUDGET
+    # A 2000-token budget shared by five questions wouldn't fit each one's best chunk
+    for i in range(len(questions)):
+        assert f"Question {i} passage 0 makes point 149." in context
+
+
+def test_tokens_saved_is_measured_against_the_single_prompts():
+    questions = [f"Question {i}?" for i in range(3)]
+    # Every question retrieves the same chunks, which the batch only sends once
+    shared = _matches(0)
+    top_matches_all = {q: shared for q in questions}
+
+    prompt, tokens_saved = embeddings.build_batch_prompt(questions, top_matches_all)
+
+    single_prompts = [embeddings.build_answer_prompt(q, top_matches_all) for q in questions]
+    expected = sum(embeddings.estimate_tokens(p) for p in single_prompts) - embeddings.estimate_tokens(prompt)
+    assert tokens_saved == expected
+    assert tokens_saved > 0
+
+
+def test_parse_batch_answers_maps_ids_back_to_questions():
+    response = 'Sure! ```json\n[{"id": 2, "answer": " Two. "}, {"id": 1, "answer": "One."}]\n```'
+    assert embeddings.parse_batch_answers(response, 3) == ["One.", "Two.", None]
+
+
+def test_parse_batch_answers_skips_malformed_items():
+    response = json.dumps([
+        {"id": 1, "answer": ""},            # empty
+        {"id": "2", "answer": "Two."},      # id isn't an int
+        {"id": 4, "answer": "Four."},       # out of range
+        "3: Three.",                        # not an object
+        {"id": 3, "answer": "Three."},
+    ])
+    assert embeddings.parse_batch_answers(response, 3) == [None, None, "Three."]
+
+
+def test_parse_batch_answers_without_a_json_array():
+    assert embeddings.parse_batch_answers("I cannot answer these.", 2) == [None, None]
+    assert embeddings.parse_batch_answers("[1, 2", 2) == [None, None]
+    assert embeddings.parse_batch_answers('[{"id": 1, "answer": "One."', 2) == [None, None]
@@ -0,0 +1,82 @@
+from hypothesis import given, settings, strategies as st
+
+from app.utils import data_processing
+from app.utils.data_processing import iter_chunks, estimate_word_tokens
+
+
+def _budget(total, max_chunk_words):
+    # Mirrors iter_chunks: mid-sized documents are split into about three chunks
+    if 700 <= total <= 1000:
+        return max(min(total // 3, max_chunk_words), 250)
+    return max_chunk_words
+
+
+@st.composite
+def documents(draw, max_sentences=120):
+    """Sentences of unique words (so positions can be traced) on non-decreasing pages."""
+    lengths = draw(st.lists(st.lists(st.integers(1, 40), min_size=1, max_size=60), max_size=max_sentences))
+    sentences, page, n = [], 1, 0
+    for word_lengths in lengths:
+        words = []
+        for length in word_lengths:
+            word = f"w{n}"
+            words.append(word + "x" * max(0, length - len(word)))
+            n += 1
+        first_page = page
+        page += draw(st.integers(0, 2))
+        sentences.append((" ".join(words), first_page, page))
+    return sentences
+
+
+def _words(sentences):
+    return [w for sent, _, _ in sentences for w in sent.split()]
+
+
+chunk_params = st.tuples(st.integers(0, 400), st.integers(20, 600), st.integers(0, 60))
+
+
+@settings(max_examples=200, deadline=None)
+@given(documents(), chunk_params)
+def test_chunks_stay_within_budget_plus_overlap(sentences, params):
+    min_words, max_words, overlap = params
+    budget = _budget(len(_words(sentences)), max_words)
+    chunks = list(iter_chunks(sentences, min_words, max_words, overlap, "words"))
+    if len(chunks) > 1:
+        assert all(len(chunk.split()) <= budget + overlap for chunk, _, _ in chunks)
+
+
+@settings(max_examples=200, deadline=None)
+@given(documents(), chunk_params)
+def test_every_word_is_covered_in_order_with_the_previous_tail_as_overlap(sentences, params):
+    min_words, max_words, overlap = params
+    chunks = [chunk.split() for chunk, _, _ in iter_chunks(sentences, min_words, max_words, overlap, "words")]
+    covered = list(chunks[0]) if chunks else []
+    for previous, chunk in zip(chunks, chunks[1:]):
+        k = min(overlap, len(previous))
+        assert chunk[:k] == previous[-k:] if k else True
+        covered.extend(chunk[k:])
+    assert covered == _words(sentences)
+
+
+@settings(max_examples=100, deadline=None)
+@given(documents(max_sentences=10))
+def test_small_documents_are_one_chunk_joined_with_spaces(sentences):
+    words = _words(sentences)
+    chunks = list(iter_chunks(sentences, min_words_no_chunk=len(words) + 1))
+    if sentences:
+        assert chunks == [(" ".join(words), sentences[0][1], sentences[-1][2])]
+    else:
+        assert chunks == [("", None, None)]
+
+
+@settings(max_examples=200, deadline=None)
+@given(documents(), st.integers(0, 60), st.integers(20, 200))
+def test_token_chunks_fit_the_embedding_input_limit(sentences, overlap, max_input_tokens):
+    original = data_processing.EMBEDDING_MAX_INPUT_TOKENS
+    data_processing.EMBEDDING_MAX_INPUT_TOKENS = max_input_tokens
+    try:
+        chunks = list(iter_chunks(sentences, 0, 10_000, overlap, "tokens"))
+    finally:
+        data_processing.EMBEDDING_MAX_INPUT_TOKENS = original
+    for chunk, _, _ in chunks:
+        assert sum(estimate_word_tokens(w) for w in chunk.split()) <= max_input_tokens
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import pytest
+
+from app.utils.data_processing import clean_text, iter_clean_lines, CLEANING_PROFILES
+
+# Each <case>.txt is one document with pages separated by form feeds. Its
+# expected cleaned output is <case>.<profile>.expected.txt (create an empty
+# one to add a case). Every case runs through clean_text and through the
+# page-by-page streaming cleaner that ingestion uses, and both must match.
+# After a deliberate change to the cleaning rules, regenerate the
+# expectations with
+#   python -m tests.test_clean_text_golden
+GOLDEN_DIR = Path(__file__).parent / "golden" / "clean_text"
+
+
+def _golden_cases():
+    cases = []
+    for expected_path in sorted(GOLDEN_DIR.glob("*.expected.txt")):
+        case, profile = expected_path.name[:-len(".expected.txt")].rsplit(".", 1)
+        cases.append(pytest.param(GOLDEN_DIR / f"{case}.txt", profile, expected_path, id=f"{case}-{profile}"))
+    return cases
+
+
+def _pages(input_path: Path) -> list:
+    return input_path.read_text(encoding="utf-8").split("\f")
+
+
+def _clean(input_path: Path, profile: str) -> str:
+    pages = _pages(input_path)
+    return clean_text("\n".join(pages), len(pages), CLEANING_PROFILES[profile])
+
+
+def _clean_streaming(input_path: Path, profile: str) -> str:
+    pages = _pages(input_path)
+    lines = iter_clean_lines(enumerate(pages, start=1), len(pages), CLEANING_PROFILES[profile])
+    return " ".join(line for _, line in lines)
+
+
+@pytest.mark.parametrize("input_path, profile, expected_path", _golden_cases())
+def test_clean_text_matches_golden_output(input_path, profile, expected_path):
+    assert _clean(input_path, profile) == expected_path.read_text(encoding="utf-8")
+
+
+@pytest.mark.parametrize("input_path, profile, expected_path", _golden_cases())
+def test_streaming_cleaner_matches_golden_output(input_path, profile, expected_path):
+    assert _clean_streaming(input_path, profile) == expected_path.read_text(encoding="utf-8")
+
+
+if __name__ == "__main__":
+    for input_path, profile, expected_path in (case.values for case in _golden_cases()):
+        expected_path.write_text(_clean_streaming(input_path, profile), encoding="utf-8")
@@ -0,0 +1,24 @@
+from app.utils.data_processing import iter_sentences
+
+
+def _lines(pages):
+    return [(page, text) for page, text in pages if text]
+
+
+def test_sentence_ending_on_a_page_keeps_that_page():
+    pages = [(2, "The first page ends. Another one."), (3, "Third page sentence."), (4, ""), (5, "Last.")]
+    assert list(iter_sentences(_lines(pages))) == [
+        ("The first page ends.", 2, 2),
+        ("Another one.", 2, 2),
+        ("Third page sentence.", 3, 3),
+        ("Last.", 5, 5),
+    ]
+
+
+def test_sentence_crossing_a_page_break_spans_both_pages():
+    pages = [(1, "A complete sentence. This one continues"), (2, "onto the next page. Done.")]
+    assert list(iter_sentences(_lines(pages))) == [
+        ("A complete sentence.", 1, 1),
+        ("This one continues onto the next page.", 1, 2),
+        ("Done.", 2, 2),
+    ]
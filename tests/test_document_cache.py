@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.utils import document_cache, embeddings, ingestion
+
+
+@pytest.fixture
+def url_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(document_cache, "URL_INDEX_PATH", str(tmp_path / "url_index.sqlite3"))
+    monkeypatch.setattr(document_cache, "_url_index_conn", None)
+    yield
+    if document_cache._url_index_conn is not None:
+        document_cache._url_index_conn.close()
+
+
+def test_revalidated_url_picks_up_new_processing_version(monkeypatch, url_index):
+    document_cache.record_url_entry("https://example.com/a.pdf", "abc123", "pdf", etag='"v1"')
+
+    async def not_modified(url, etag=None, last_modified=None):
+        assert etag == '"v1"'
+        return None
+
+    monkeypatch.setattr(ingestion, "download_document", not_modified)
+    old_id, _, document = asyncio.run(ingestion.fetch_document("https://example.com/a.pdf", {}))
+    assert document is None
+    assert old_id == document_cache.make_document_id("abc123")
+
+    monkeypatch.setattr(document_cache, "DATA_PROCESSING_VERSION", "v-next")
+    new_id, _, _ = asyncio.run(ingestion.fetch_document("https://example.com/a.pdf", {}))
+    assert new_id == document_cache.make_document_id("abc123")
+    assert new_id != old_id
+
+
+@pytest.mark.parametrize("setting, value", [("EMBEDDING_MODEL", "models/next-embedding"), ("EMBEDDING_DIM", 1024)])
+def test_a_new_embedding_model_gets_new_document_ids(monkeypatch, setting, value):
+    old_id = document_cache.make_document_id("abc123")
+    monkeypatch.setattr(embeddings, setting, value)
+    assert document_cache.make_document_id("abc123") != old_id
+
+
+def test_urls_without_validators_are_not_recorded(url_index):
+    document_cache.record_url_entry("https://example.com/a.pdf", "abc123", "pdf")
+    assert document_cache.get_url_entry("https://example.com/a.pdf") is None
+
+
+def test_the_least_recently_used_urls_are_evicted(monkeypatch, url_index):
+    monkeypatch.setattr(document_cache, "URL_INDEX_MAX_ENTRIES", 2)
+    document_cache.record_url_entry("https://example.com/a.pdf", "a", "pdf", etag='"a"')
+    document_cache.record_url_entry("https://example.com/b.pdf", "b", "pdf", etag='"b"')
+    assert document_cache.get_url_entry("https://example.com/a.pdf")["content_digest"] == "a"
+
+    document_cache.record_url_entry("https://example.com/c.pdf", "c", "pdf", last_modified="Mon, 01 Jan 2024")
+
+    assert document_cache.get_url_entry("https://example.com/b.pdf") is None
+    assert document_cache.get_url_entry("https://example.com/a.pdf") == {
+        "content_digest": "a", "file_extension": "pdf", "etag": '"a"', "last_modified": None}
+    assert document_cache.get_url_entry("https://example.com/c.pdf")["last_modified"] == "Mon, 01 Jan 2024"
@@ -0,0 +1,23 @@
+from app import eval as retrieval_eval
+from app.utils.vector_store import DocumentIndex
+from tests.test_vector_store import clustered_corpus
+
+
+def test_reports_top10_agreement_with_float32(monkeypatch):
+    vectors, queries = clustered_corpus()
+    metadatas = [{"text": f"chunk {i}"} for i in range(len(vectors))]
+    examples = [{"question": f"question {i}", "expected_text": ["chunk 0"]} for i in range(len(queries))]
+    monkeypatch.setattr(retrieval_eval, "embed_questions", lambda questions: queries)
+    # A quantized stored copy still gets compared against exact float32 search
+    doc_index = DocumentIndex(vectors, metadatas, dtype="int8")
+
+    per_document = retrieval_eval.evaluate_document(
+        doc_index, examples, ks=[1], modes=["dense", "hybrid"], repeat=1,
+        dtypes=["float32", "int8"], rescores=[0, 50])
+    labels = list(per_document)
+    summary = retrieval_eval.summarize([per_document], [1], labels, len(examples))
+
+    assert summary["dense"]["top10_agreement"] == 1.0
+    assert summary["hybrid"]["top10_agreement"] == 1.0
+    assert summary["dense/int8/rescore=50"]["top10_agreement"] == 1.0
+    assert 0.9 <= summary["dense/int8/rescore=0"]["top10_agreement"] <= 1.0
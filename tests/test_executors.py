@@ -0,0 +1,13 @@
+import asyncio
+
+from app.utils.executors import run_blocking, run_cpu_bound, submit_blocking, shutdown_executors
+
+
+def test_pools_are_recreated_after_shutdown():
+    async def use_pools():
+        return await run_blocking(sum, [1, 2]), await run_cpu_bound(max, 3, 4), submit_blocking(min, 5, 6).result()
+
+    assert asyncio.run(use_pools()) == (3, 4, 5)
+    shutdown_executors()
+    # A second app lifespan in the same process runs on fresh pools
+    assert asyncio.run(use_pools()) == (3, 4, 5)
@@ -0,0 +1,42 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.utils import validators
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(validators, "BEARER_API_KEY", "test-key")
+    calls = []
+
+    async def fake_ingest_many(documents, concurrency):
+        calls.append(concurrency)
+        return {"documents": [], "concurrency": concurrency}
+
+    monkeypatch.setattr(main, "ingest_many", fake_ingest_many)
+    client = TestClient(main.app)
+    client.headers["Authorization"] = "Bearer test-key"
+    client.calls = calls
+    return client
+
+
+@pytest.mark.parametrize("concurrency", ["abc", "4", -1, 0, 2.5, True])
+def test_invalid_concurrency_is_a_bad_request(client, concurrency):
+    response = client.post("/hackrx/ingest", json={"documents": ["https://example.com/a.pdf"], "concurrency": concurrency})
+    assert response.status_code == 400
+    assert client.calls == []
+
+
+@pytest.mark.parametrize("requested, expected", [(1, 1), (main.INGEST_CONCURRENCY + 10, main.INGEST_CONCURRENCY)])
+def test_concurrency_is_clamped_to_the_server_limit(client, requested, expected):
+    response = client.post("/hackrx/ingest", json={"documents": ["https://example.com/a.pdf"], "concurrency": requested})
+    assert response.status_code == 200
+    assert client.calls == [expected]
+
+
+@pytest.mark.parametrize("body", [{}, {"concurrency": None}])
+def test_concurrency_defaults_to_the_server_limit(client, body):
+    response = client.post("/hackrx/ingest", json={"documents": ["https://example.com/a.pdf"], **body})
+    assert response.status_code == 200
+    assert client.calls == [main.INGEST_CONCURRENCY]
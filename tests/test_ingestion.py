@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.utils import executors, ingestion
+from app.utils.document_cache import file_lock
+from app.utils.vector_store import MemoryVectorStore
+
+
+def _fake_chunk_document(source, file_id, stats=None, content_digest=None):
+    embeddings = Future()
+    embeddings.set_result([[1.0, 0.0]])
+    return 1, "miss", [{"text": source, "chunk": 0}], [embeddings]
+
+
+def test_a_lock_wait_does_not_hold_the_cpu_pool(monkeypatch):
+    # gunicorn gives each worker a single CPU thread by default
+    cpu_executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setitem(executors._executors, "cpu", cpu_executor)
+    monkeypatch.setattr(ingestion, "chunk_document", _fake_chunk_document)
+    store = MemoryVectorStore()
+
+    # Another process is ingesting "locked-doc"
+    held, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with file_lock("ingest-locked-doc"):
+            held.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    held.wait()
+
+    async def scenario():
+        waiting = asyncio.ensure_future(ingestion.ingest_document("a", "locked-doc", store))
+        await asyncio.sleep(0.1)
+        other = await asyncio.wait_for(ingestion.ingest_document("b", "free-doc", store), timeout=5)
+        assert not waiting.done()
+        release.set()
+        return other, await asyncio.wait_for(waiting, timeout=5)
+
+    try:
+        other, waited = asyncio.run(scenario())
+    finally:
+        release.set()
+        holder.join()
+        cpu_executor.shutdown()
+    assert other.metadatas[0]["text"] == "b"
+    assert waited.metadatas[0]["text"] == "a"
+
+
+def test_upserts_do_not_wait_for_a_thread_held_by_their_caller(monkeypatch):
+    from tests.test_pinecone_store import FakePineconeIndex
+    from app.utils import vector_store
+    from app.utils.vector_store import PineconeVectorStore
+
+    # One I/O thread: store_document takes it, then fans out upsert batches
+    io_executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setitem(executors._executors, "io", io_executor)
+    monkeypatch.setattr(ingestion, "chunk_document", _fake_chunk_document)
+    index = FakePineconeIndex()
+    monkeypatch.setattr(vector_store, "get_pinecone_index", lambda: index)
+
+    async def scenario():
+        return await asyncio.wait_for(ingestion.ingest_document("c", "pinecone-doc", PineconeVectorStore()), timeout=5)
+
+    try:
+        doc_index = asyncio.run(scenario())
+    finally:
+        io_executor.shutdown(wait=False, cancel_futures=True)
+    assert doc_index.metadatas[0]["text"] == "c"
+    assert set(index.namespaces["pinecone-doc"]) == {"pinecone-doc-0"}
+
+
+class _FakeDocument:
+    def __init__(self, sha256):
+        self.sha256 = sha256
+        self.size = 100
+        self.file_extension = "pdf"
+        self.validators = {"etag": f'"{sha256}"'}
+
+    def source(self):
+        return f"/tmp/{self.sha256}.pdf"
+
+    def close(self):
+        pass
+
+
+def test_a_redownload_after_revalidation_gets_its_own_file_id(monkeypatch):
+    url = "https://example.com/revalidated.pdf"
+    ingestion.record_url_entry(url, "old-digest", "pdf", etag='"old-digest"')
+
+    async def fake_download_document(validated_url, etag=None, last_modified=None):
+        # The server says 304 to the conditional request, but the body it
+        # sends when asked unconditionally has changed
+        return None if etag else _FakeDocument("new-digest")
+
+    ingested = []
+
+    async def fake_ingest_document(pdf_source, file_id, vector_store, summary=None, content_digest=None):
+        ingested.append((pdf_source, file_id, content_digest))
+
+    monkeypatch.setattr(ingestion, "validate_document_url", lambda source: source)
+    monkeypatch.setattr(ingestion, "download_document", fake_download_document)
+    monkeypatch.setattr(ingestion, "ingest_document", fake_ingest_document)
+    monkeypatch.setattr(ingestion, "get_vector_store", MemoryVectorStore)
+
+    summary = asyncio.run(ingestion.ingest_source(url))
+
+    new_id = ingestion.make_document_id("new-digest")
+    assert summary["status"] == "ingested"
+    assert summary["file_id"] == new_id
+    assert ingested == [("/tmp/new-digest.pdf", new_id, "new-digest")]
+    assert ingestion.get_url_entry(url)["content_digest"] == "new-digest"
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+
+from app.utils.lexical_index import LexicalIndex, tokenize
+
+TEXTS = [
+    "The grace period for premium payment is thirty days.",
+    "A co-payment of 10% applies to every claim under section 4.2.",
+    "Pre-existing diseases are covered after a waiting period of 36 months.",
+    "Claims must be filed within thirty days of discharge; claims filed later are rejected.",
+    "",
+]
+
+
+def reference_bm25(texts, query, k1=1.2, b=0.75):
+    """Okapi BM25 written out term by term, to check the CSR scoring against."""
+    docs = [tokenize(text) for text in texts]
+    avg_length = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in other for other in docs)
+            tf = doc.count(term)
+            if not df or not tf:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+
+def test_tokenize_keeps_section_numbers_and_splits_hyphens():
+    assert tokenize("Under Section 4.2, the co-payment is due") == ["section", "4.2", "co-payment", "co", "payment", "due"]
+
+
+def test_csr_scores_match_the_bm25_formula():
+    index = LexicalIndex.build(TEXTS)
+    queries = ["thirty days grace period", "co payment claim", "claims filed late", "nothing matches here"]
+
+    scores = index.score(queries)
+
+    assert scores.shape == (len(queries), len(TEXTS))
+    for row, query in zip(scores, queries):
+        np.testing.assert_allclose(row, reference_bm25(TEXTS, query), rtol=1e-5, atol=1e-6)
+    assert not scores[3].any()
+
+
+def test_a_saved_index_scores_the_same(tmp_path):
+    index = LexicalIndex.build(TEXTS)
+    path = str(tmp_path / "lexical.npz")
+    index.save(path)
+
+    loaded = LexicalIndex.load(path)
+
+    np.testing.assert_array_equal(loaded.score(["waiting period 36 months"]), index.score(["waiting period 36 months"]))
@@ -0,0 +1,11 @@
+from fastapi.testclient import TestClient
+
+from app import main
+
+
+def test_the_app_can_start_and_stop_twice():
+    # Each TestClient runs the lifespan on its own event loop, as a reload or
+    # a second test module would
+    for _ in range(2):
+        with TestClient(main.app) as client:
+            assert client.get("/").status_code == 200
@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from app.utils.llm_providers import GeminiProvider
+
+
+class FakeGeminiChunk:
+    """Mimics the SDK's streamed chunk, whose .text raises when there are no parts."""
+
+    def __init__(self, *texts, usage=None):
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=t) for t in texts]))]
+        self.usage_metadata = usage
+
+    @property
+    def text(self):
+        if not self.candidates[0].content.parts:
+            raise ValueError("The `response.text` quick accessor requires the response to contain a valid `Part`")
+        return "".join(part.text for part in self.candidates[0].content.parts)
+
+
+def test_gemini_stream_skips_chunks_without_parts():
+    provider = GeminiProvider()
+    chunks = [FakeGeminiChunk("Hello, "), FakeGeminiChunk("world", "."), FakeGeminiChunk(usage={"prompt_token_count": 7})]
+    provider._model = SimpleNamespace(generate_content=lambda *args, **kwargs: iter(chunks))
+
+    assert provider.complete("prompt") == "Hello, world."
@@ -0,0 +1,164 @@
+import os
+import json
+import asyncio
+import threading
+
+import pytest
+
+from app import db
+
+
+class FakeDatabase:
+    """Stands in for write_log_rows, recording each batch and failing on demand."""
+
+    def __init__(self):
+        self.batches = []
+        self.down = False
+
+    def write_log_rows(self, rows):
+        if self.down:
+            raise ConnectionError("database unreachable")
+        self.batches.append(list(rows))
+
+
+@pytest.fixture
+def fake_db(monkeypatch, tmp_path):
+    fake = FakeDatabase()
+    monkeypatch.setattr(db, "write_log_rows", fake.write_log_rows)
+    monkeypatch.setattr(db, "LOG_SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(db, "LOG_BATCH_SIZE", 3)
+    monkeypatch.setattr(db, "LOG_FLUSH_INTERVAL", 0.2)
+    return fake
+
+
+def _row(i):
+    return (f"file-{i}", "https://example.com/doc.pdf", "[]", "[]", i, "{}")
+
+
+def _enqueue(sink, *ids):
+    for i in ids:
+        sink.enqueue(*_row(i))
+
+
+def test_flushes_when_the_batch_fills(fake_db):
+    async def scenario():
+        sink = db.LogSink()
+        sink.start()
+        _enqueue(sink, 1, 2, 3)
+        await asyncio.sleep(0.05)  # well inside the flush interval
+        assert fake_db.batches == [[_row(1), _row(2), _row(3)]]
+        await sink.stop()
+
+    asyncio.run(scenario())
+
+
+def test_flushes_a_partial_batch_after_the_interval(fake_db):
+    async def scenario():
+        sink = db.LogSink()
+        sink.start()
+        _enqueue(sink, 1)
+        await asyncio.sleep(0.05)
+        assert fake_db.batches == []
+        await asyncio.sleep(0.3)
+        assert fake_db.batches == [[_row(1)]]
+        await sink.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_writes_spill_and_replay_after_the_next_flush(fake_db):
+    async def scenario():
+        sink = db.LogSink()
+        sink.start()
+        fake_db.down = True
+        _enqueue(sink, 1, 2, 3)
+        await asyncio.sleep(0.05)
+        with open(db.LOG_SPILL_PATH, encoding="utf-8") as f:
+            assert [tuple(json.loads(line)) for line in f] == [_row(1), _row(2), _row(3)]
+
+        fake_db.down = False
+        _enqueue(sink, 4, 5, 6)
+        await sink.stop()
+
+    asyncio.run(scenario())
+    assert fake_db.batches == [[_row(4), _row(5), _row(6)], [_row(1), _row(2), _row(3)]]
+    assert not os.path.exists(db.LOG_SPILL_PATH)
+
+
+def test_stop_flushes_everything_still_queued(fake_db):
+    async def scenario():
+        sink = db.LogSink()
+        sink.start()
+        _enqueue(sink, *range(7))
+        await sink.stop()
+
+    asyncio.run(scenario())
+    assert [row for batch in fake_db.batches for row in batch] == [_row(i) for i in range(7)]
+    assert all(len(batch) <= 3 for batch in fake_db.batches)
+
+
+def test_a_failing_spill_does_not_stop_the_sink(fake_db, monkeypatch):
+    def broken_spill(rows):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(db, "_spill", broken_spill)
+
+    async def scenario():
+        sink = db.LogSink()
+        sink.start()
+        fake_db.down = True
+        _enqueue(sink, 1, 2, 3)
+        await asyncio.sleep(0.05)
+        fake_db.down = False
+        _enqueue(sink, 4)
+        await sink.stop()
+
+    asyncio.run(scenario())
+    assert fake_db.batches == [[_row(4)]]
+
+
+def test_the_sink_restarts_under_a_new_event_loop(fake_db):
+    sink = db.LogSink()
+
+    async def scenario(*ids):
+        sink.start()
+        _enqueue(sink, *ids)
+        await sink.stop()
+
+    asyncio.run(scenario(1))
+    asyncio.run(scenario(2))
+    assert fake_db.batches == [[_row(1)], [_row(2)]]
+
+
+def test_a_full_queue_spills_off_the_event_loop(fake_db, monkeypatch):
+    monkeypatch.setattr(db, "LOG_QUEUE_SIZE", 1)
+    spilled = []
+    real_spill = db._spill
+
+    def recording_spill(rows):
+        spilled.append((threading.current_thread(), list(rows)))
+        real_spill(rows)
+
+    monkeypatch.setattr(db, "_spill", recording_spill)
+
+    async def scenario():
+        sink = db.LogSink()
+        sink.start()
+        _enqueue(sink, 1, 2, 3)
+        assert spilled == []  # nothing was written from enqueue itself
+        await sink.stop()
+
+    asyncio.run(scenario())
+    assert [rows for _, rows in spilled] == [[_row(2), _row(3)]]
+    assert spilled[0][0] is not threading.main_thread()
+    assert fake_db.batches == [[_row(1)], [_row(2), _row(3)]]
+
+
+def test_the_spill_file_is_capped(fake_db, monkeypatch):
+    row_bytes = len(json.dumps(_row(1)) + "\n")
+    monkeypatch.setattr(db, "LOG_SPILL_MAX_BYTES", row_bytes * 2)
+    db._spill([_row(1)])
+    db._spill([_row(2), _row(3)])
+
+    with open(db.LOG_SPILL_PATH, encoding="utf-8") as f:
+        assert [tuple(json.loads(line)) for line in f] == [_row(1), _row(2)]
@@ -0,0 +1,42 @@
+import os
+import sys
+import subprocess
+
+from app.utils import memo_cache
+from app.utils.memo_cache import get_cached_answers, put_cached_answers, invalidate_document
+
+
+def _invalidate_in_another_process(doc_id):
+    # Stands in for a request that another gunicorn worker handled
+    subprocess.run(
+        [sys.executable, "-c", f"from app.utils.memo_cache import invalidate_document; invalidate_document({doc_id!r})"],
+        env={**os.environ, "ANSWER_INVALIDATION_DIR": memo_cache.ANSWER_INVALIDATION_DIR},
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True
+    )
+
+
+def test_invalidation_in_another_worker_hides_cached_answers(monkeypatch, tmp_path):
+    monkeypatch.setattr(memo_cache, "ANSWER_INVALIDATION_DIR", str(tmp_path))
+    put_cached_answers("doc-a", ["What is covered?"], ["Everything."], "v")
+    put_cached_answers("doc-b", ["What is covered?"], ["Nothing."], "v")
+
+    _invalidate_in_another_process("doc-a")
+
+    assert get_cached_answers("doc-a", ["What is covered?"], "v") == [None]
+    assert get_cached_answers("doc-b", ["what is  covered?"], "v") == ["Nothing."]
+
+    # Answers cached after the invalidation are served again
+    put_cached_answers("doc-a", ["What is covered?"], ["Most things."], "v")
+    assert get_cached_answers("doc-a", ["What is covered?"], "v") == ["Most things."]
+
+
+def test_invalidation_removes_this_workers_answers(monkeypatch, tmp_path):
+    monkeypatch.setattr(memo_cache, "ANSWER_INVALIDATION_DIR", str(tmp_path))
+    put_cached_answers("doc-c", ["Q1", "Q2"], ["A1", "A2"], "v")
+
+    assert invalidate_document("doc-c") == 2
+    assert invalidate_document("../../outside") == 0
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(memo_cache._invalidation_path(doc_id)) for doc_id in ("doc-c", "../../outside")
+    )
@@ -0,0 +1,46 @@
+import json
+
+from app.utils import metrics
+from app.utils.metrics import Histogram
+
+
+def _other_worker(tmp_path, histograms, stats):
+    # What another gunicorn worker would have written
+    with open(tmp_path / "999999.json", "w", encoding="utf-8") as f:
+        json.dump({"histograms": histograms, "stats": stats}, f)
+
+
+def test_metrics_are_summed_over_worker_snapshots(monkeypatch, tmp_path):
+    histogram = Histogram("test_latency_seconds", "Test.", (0.1, 1.0), ("stage",))
+    monkeypatch.setattr(metrics, "REGISTRY", [histogram])
+    monkeypatch.setattr(metrics, "STATS_SOURCES", {"answers": lambda: {"hits": 1, "misses": 3, "size": 2, "hit_rate": 0.25}})
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "METRICS_MULTIPROCESS", True)
+
+    histogram.observe(0.05, stage="embed")
+    _other_worker(
+        tmp_path,
+        {"test_latency_seconds": [[["embed"], [1, 1, 0], 0.6, 2], [["llm"], [0, 0, 1], 3.0, 1]]},
+        {"answers": {"hits": 3, "misses": 1, "size": 5, "hit_rate": 0.75}},
+    )
+
+    rendered = metrics.render_metrics()
+    assert 'test_latency_seconds_bucket{stage="embed",le="0.1"} 2' in rendered
+    assert 'test_latency_seconds_count{stage="embed"} 3' in rendered
+    assert 'test_latency_seconds_count{stage="llm"} 1' in rendered
+
+    assert metrics.collect_stats() == {
+        "answers": {"hits": 4, "misses": 4, "size": 7, "hit_rate": 0.5},
+        "workers": 2,
+    }
+
+
+def test_single_process_reports_its_own_metrics(monkeypatch, tmp_path):
+    histogram = Histogram("test_size_bytes", "Test.", (10,))
+    monkeypatch.setattr(metrics, "REGISTRY", [histogram])
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "METRICS_MULTIPROCESS", False)
+    _other_worker(tmp_path, {"test_size_bytes": [[[], [5, 0], 1.0, 5]]}, {})
+
+    histogram.observe(3)
+    assert "test_size_bytes_count 1" in metrics.render_metrics()
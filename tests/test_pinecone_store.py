@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from app.utils import vector_store
+from app.utils.vector_store import PineconeVectorStore
+
+
+class FakePineconeIndex:
+    """Implements the query/fetch/upsert calls PineconeVectorStore makes, with the 1000-match query cap."""
+
+    def __init__(self):
+        self.namespaces = {}
+
+    def upsert(self, vectors, namespace):
+        for vector_id, values, metadata in vectors:
+            self.namespaces.setdefault(namespace, {})[vector_id] = SimpleNamespace(values=values, metadata=metadata)
+
+    def query(self, vector, top_k, namespace, include_metadata, include_values):
+        stored = list(self.namespaces.get(namespace, {}).values())[:min(top_k, 1000)]
+        matches = [
+            {"metadata": v.metadata, **({"values": v.values} if include_values else {})} for v in stored
+        ]
+        return SimpleNamespace(to_dict=lambda: {"matches": matches})
+
+    def fetch(self, ids, namespace):
+        stored = self.namespaces.get(namespace, {})
+        return SimpleNamespace(vectors={i: stored[i] for i in ids if i in stored})
+
+
+def _store(monkeypatch):
+    index = FakePineconeIndex()
+    monkeypatch.setattr(vector_store, "get_pinecone_index", lambda: index)
+    return PineconeVectorStore(), index
+
+
+def test_documents_over_the_query_limit_are_read_in_full(monkeypatch):
+    store, _ = _store(monkeypatch)
+    vectors = [[float(i), 1.0] for i in range(2500)]
+    store.put("doc", vectors, [{"chunk": i} for i in range(2500)])
+
+    doc_index = store.get("doc")
+    assert doc_index is not None
+    assert [m["chunk"] for m in doc_index.metadatas] == list(range(2500))
+
+
+def test_a_partially_written_namespace_is_a_miss(monkeypatch):
+    store, index = _store(monkeypatch)
+    store.put("doc", [[1.0, 0.0]] * 3, [{"chunk": i} for i in range(3)])
+    del index.namespaces["doc"]["doc-1"]
+
+    assert store.get("doc") is None
+    assert store.get("unknown") is None
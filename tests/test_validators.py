@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.utils import validators
+
+PDF = b"%PDF-1.7\n" + b"x" * 5000 + b"\n%%EOF\n"
+
+
+def _download(monkeypatch, handler, **kwargs):
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(validators, "get_http_client", lambda: client)
+            return await validators.download_document("https://example.com/doc", **kwargs)
+
+    return asyncio.run(scenario())
+
+
+def _status_of(monkeypatch, handler):
+    with pytest.raises(HTTPException) as excinfo:
+        _download(monkeypatch, handler)
+    return excinfo.value
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (PDF, "application/pdf"),
+    # Blob stores often don't know the type; the header may follow some junk
+    (b"\x00" * 500 + PDF, "application/octet-stream"),
+    (PDF[:100], ""),
+])
+def test_pdfs_are_recognized_by_their_magic_bytes(monkeypatch, body, content_type):
+    headers = {"Content-Type": content_type, "ETag": '"v1"'} if content_type else {"ETag": '"v1"'}
+    document = _download(monkeypatch, lambda request: httpx.Response(200, content=body, headers=headers))
+    try:
+        assert document.file_extension == "pdf"
+        assert document.size == len(body)
+        assert document.sha256 == hashlib.sha256(body).hexdigest()
+        assert bytes(document.getbuffer()) == body
+        assert document.validators["etag"] == '"v1"'
+    finally:
+        document.close()
+
+
+def test_a_non_pdf_labelled_as_pdf_is_rejected(monkeypatch):
+    html = b"<html><body>Access denied</body></html>" * 50
+    error = _status_of(monkeypatch, lambda request: httpx.Response(
+        200, content=html, headers={"Content-Type": "application/pdf"}))
+    assert error.status_code == 415
+
+
+@pytest.mark.parametrize("content_type", ["application/json", "text/html; charset=utf-8", "image/png", "video/mp4"])
+def test_rejected_content_types_stop_before_the_body(monkeypatch, content_type):
+    def handler(request):
+        async def body():
+            raise AssertionError("the body should not be read")
+            yield b""
+        return httpx.Response(200, content=body(), headers={"Content-Type": content_type})
+
+    error = _status_of(monkeypatch, handler)
+    assert error.status_code == 415
+
+
+def test_a_large_content_length_is_rejected_up_front(monkeypatch):
+    monkeypatch.setattr(validators, "MAX_DOCUMENT_BYTES", 1024)
+    error = _status_of(monkeypatch, lambda request: httpx.Response(
+        200, content=PDF, headers={"Content-Type": "application/pdf"}))
+    assert error.status_code == 413
+    assert "(1024 bytes)" in error.detail and "0 MB" not in error.detail
+
+
+def test_a_body_growing_past_the_limit_is_rejected(monkeypatch):
+    monkeypatch.setattr(validators, "MAX_DOCUMENT_BYTES", 4096)
+    monkeypatch.setattr(validators, "DOWNLOAD_CHUNK_SIZE", 1024)
+
+    async def body():
+        # Streamed without a Content-Length
+        for start in range(0, len(PDF), 1024):
+            yield PDF[start:start + 1024]
+
+    error = _status_of(monkeypatch, lambda request: httpx.Response(
+        200, content=body(), headers={"Content-Type": "application/pdf"}))
+    assert error.status_code == 413
+
+
+def test_not_modified_returns_none(monkeypatch):
+    def handler(request):
+        assert request.headers["If-None-Match"] == '"v1"'
+        return httpx.Response(304)
+
+    assert _download(monkeypatch, handler, etag='"v1"') is None
+
+
+def test_the_default_limit_reads_in_megabytes():
+    assert validators._too_large().detail == (
+        f"Document is larger than the 100 MB ({100 * 1024 * 1024} bytes) limit."
+    )
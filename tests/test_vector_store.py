@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from app.utils.vector_store import DocumentIndex, quantize
+
+
+def clustered_corpus(num_chunks=2000, dim=64, clusters=40, seed=0):
+    """Unit vectors in tight clusters, so near-ties are common, plus noisy queries near them."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=num_chunks)] + 0.3 * rng.normal(size=(num_chunks, dim))
+    queries = centers[rng.integers(clusters, size=50)] + 0.3 * rng.normal(size=(50, dim))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_search_returns_the_most_similar_chunks_in_order():
+    vectors, queries = clustered_corpus()
+    index = DocumentIndex(vectors, [{}] * len(vectors))
+
+    scores, indices = index.search(queries, top_k=10)
+
+    expected = _unit(queries) @ _unit(vectors).T
+    np.testing.assert_array_equal(indices, np.argsort(-expected, axis=1, kind="stable")[:, :10])
+    np.testing.assert_allclose(scores, np.take_along_axis(expected, indices, axis=1), rtol=1e-5)
+
+
+def test_search_with_top_k_past_the_document_returns_every_chunk():
+    index = DocumentIndex([[1, 0], [0, 1], [1, 1]], [{}] * 3)
+    scores, indices = index.search([[1, 0]], top_k=10)
+    assert indices.tolist() == [[0, 2, 1]]
+    np.testing.assert_allclose(scores, [[1.0, np.sqrt(0.5), 0.0]], atol=1e-6)
+
+
+def test_hybrid_search_fuses_dense_and_bm25_ranks():
+    metadatas = [
+        {"text": "grace period of thirty days"},
+        {"text": "waiting period for maternity"},
+        {"text": "ambulance cover"},
+        {"text": "room rent limits"},
+    ]
+    # Dense ranking for the query: 2, 3, 1, 0. BM25 ranking: 0, 1 (2 and 3 share no terms)
+    vectors = [[0.0, 0.2], [0.3, 0.6], [1.0, 0.0], [0.9, 0.3]]
+    index = DocumentIndex(vectors, metadatas)
+
+    fused, indices, dense, lexical = index.hybrid_search([[1.0, 0.0]], ["grace period"], top_k=4, rrf_k=60)
+
+    expected = {
+        0: 1 / 64 + 1 / 61,
+        1: 1 / 63 + 1 / 62,
+        2: 1 / 61,
+        3: 1 / 62,
+    }
+    assert indices.tolist() == [[0, 1, 2, 3]]
+    np.testing.assert_allclose(fused[0], [expected[i] for i in indices[0]], rtol=1e-6)
+    assert (lexical[0, :2] > 0).all() and (lexical[0, 2:] == 0).all()
+    np.testing.assert_allclose(dense[0], (_unit(vectors) @ [1.0, 0.0])[indices[0]], rtol=1e-6)
+
+
+def test_hybrid_search_only_counts_the_top_candidates():
+    metadatas = [{"text": f"chunk {i}"} for i in range(5)]
+    vectors = [[1.0, 0.1 * i] for i in range(5)]
+    index = DocumentIndex(vectors, metadatas)
+
+    fused, indices, _, _ = index.hybrid_search([[1.0, 0.0]], ["unrelated"], top_k=5, candidates=2, rrf_k=0)
+
+    # Only the two densest chunks are candidates; nothing matches lexically
+    assert indices[0, :2].tolist() == [0, 1]
+    np.testing.assert_allclose(fused[0], [1.0, 0.5, 0.0, 0.0, 0.0])
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("int8", 1 / 127)])
+def test_quantized_vectors_round_trip(dtype, tolerance):
+    vectors, _ = clustered_corpus(num_chunks=200)
+    vectors = _unit(vectors)
+
+    codes, scales = quantize(vectors, dtype)
+
+    restored = codes.astype(np.float32) * (scales[:, None] if scales is not None else 1)
+    assert np.abs(restored - vectors).max() <= tolerance
+    if dtype == "int8":
+        assert np.abs(codes).max(axis=1).tolist() == [127] * len(codes)
+
+
+def test_int8_keeps_an_all_zero_row():
+    codes, scales = quantize(np.zeros((1, 4), dtype=np.float32), "int8")
+    assert codes.tolist() == [[0, 0, 0, 0]] and scales.tolist() == [1.0]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_rescored_quantized_search_matches_float32(dtype):
+    vectors, queries = clustered_corpus()
+    exact = DocumentIndex(vectors, [{}] * len(vectors))
+    quantized = DocumentIndex(vectors, [{}] * len(vectors), dtype=dtype, rescore=50)
+
+    exact_scores, exact_indices = exact.search(queries, top_k=10)
+    scores, indices = quantized.search(queries, top_k=10)
+
+    np.testing.assert_array_equal(indices, exact_indices)
+    # The returned scores come from the float32 rows, not the codes
+    np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+
+
+@pytest.mark.parametrize("dtype, min_agreement", [("float16", 0.99), ("int8", 0.9)])
+def test_quantized_search_without_rescoring_stays_close(dtype, min_agreement):
+    vectors, queries = clustered_corpus()
+    exact = DocumentIndex(vectors, [{}] * len(vectors))
+    quantized = DocumentIndex(vectors, [{}] * len(vectors), dtype=dtype, rescore=0)
+
+    _, exact_indices = exact.search(queries, top_k=10)
+    scores, indices = quantized.search(queries, top_k=10)
+
+    agreement = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(indices, exact_indices)])
+    assert agreement >= min_agreement
+    assert quantized.scan_nbytes < exact.scan_nbytes